@@ -1,4 +1,6 @@
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -8,7 +10,17 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
 ALGORITHM  = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost; hashes below it are re-hashed on the next successful login
+BCRYPT_ROUNDS    = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS     = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+)
 
 # 1. Hash / verify passwords
 def get_password_hash(password: str) -> str:
@@ -17,6 +29,67 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
+
+class HashPoolBusy(Exception):
+    """Raised when the password-hashing pool already has a full wait queue."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on its own small thread pool instead of the shared one that
+    sync routes use. At most `workers` hashes run at once and `queue_limit`
+    more may wait; anything beyond that is refused with `HashPoolBusy`.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT, context: CryptContext = pwd_context):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.context = context
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    async def _run(self, fn, *args):
+        if self._in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HashPoolBusy()
+        self._in_flight += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """(matches, replacement hash if the stored one is below the current cost)."""
+        ok, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers":     self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight":   self._in_flight,
+            "completed":   self.completed,
+            "failed":      self.failed,
+            "rejected":    self.rejected,
+            "rehashed":    self.rehashed,
+        }
+
+
 # 2. Create JWT tokens
 def create_access_token(data: dict):
     to_encode = data.copy()
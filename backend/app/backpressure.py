@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+
+import socketio
+from socketio import packet as sio_packet
+
+logger = logging.getLogger(__name__)
+
+# frames waiting in one connection's engine.io queue
+OUTBOUND_HIGH_WATER   = int(os.getenv("OUTBOUND_HIGH_WATER", "100"))    # shed typing and presence frames
+OUTBOUND_RESYNC_WATER = int(os.getenv("OUTBOUND_RESYNC_WATER", "500"))  # shed messages, resync once drained
+OUTBOUND_MAX_QUEUE    = int(os.getenv("OUTBOUND_MAX_QUEUE", "2000"))    # disconnect
+# a connection that owes a resync for this long is disconnected as well
+OUTBOUND_MAX_LAG_S    = float(os.getenv("OUTBOUND_MAX_LAG_S", "30"))
+OUTBOUND_CHECK_MS     = float(os.getenv("OUTBOUND_CHECK_MS", "250"))
+
+# state the next frame of the same kind replaces anyway
+DISPOSABLE = frozenset({"typing_users", "presence_delta", "room_users"})
+# messages a client gets back through the resume protocol (join_room with last_seen)
+RECOVERABLE = frozenset({"receive_message", "receive_messages", "resume", "message_persisted"})
+
+_EVENT_TYPES = (str(sio_packet.EVENT), str(sio_packet.BINARY_EVENT))
+
+
+def _event_of(encoded) -> str | None:
+    """The event name of an encoded Socket.IO packet, e.g. '2["typing_users",{...}]'."""
+    if not isinstance(encoded, str) or encoded[:1] not in _EVENT_TYPES:
+        return None
+    start = encoded.find('["')
+    if start < 0:
+        return None
+    end = encoded.find('"', start + 2)
+    return encoded[start + 2:end] if end > 0 else None
+
+
+class _Lag:
+    __slots__ = ("resync_at", "closing")
+
+    def __init__(self):
+        self.resync_at: float | None = None
+        self.closing = False
+
+
+class OutboundGuard:
+    """
+    Bounds what a slow consumer can make this process hold for it.
+
+    Every frame for a connection goes through its engine.io queue, which a
+    writer task drains into the transport; a client that stops reading
+    leaves it growing without limit. `install()` puts a check in front of
+    the queue of a `GuardedServer` that costs one `qsize()` while it is short. Past
+    `high_water` typing, presence and room-user frames for that connection
+    are dropped; past `resync_water` messages are dropped too and the
+    connection owes a resync; at `max_queue` (or after owing the resync for
+    `max_lag_s`) it is disconnected and its queue discarded. Once a lagging
+    queue is back under half of `high_water`, a connection that lost
+    messages gets one `resync_required` frame and rejoins its rooms with
+    `last_seen`.
+
+    `on_drop(event)` and `on_slow(action)` ("resync" / "disconnect") are
+    called for metrics.
+    """
+
+    def __init__(
+        self,
+        sio,
+        high_water: int = OUTBOUND_HIGH_WATER,
+        resync_water: int = OUTBOUND_RESYNC_WATER,
+        max_queue: int = OUTBOUND_MAX_QUEUE,
+        max_lag_s: float = OUTBOUND_MAX_LAG_S,
+        check_ms: float = OUTBOUND_CHECK_MS,
+        on_drop=None,
+        on_slow=None,
+        namespace: str = "/",
+    ):
+        self.sio = sio
+        self.high_water = high_water
+        self.resync_water = resync_water
+        self.max_queue = max_queue
+        self.max_lag = max_lag_s
+        self.check = check_ms / 1000.0
+        self.on_drop = on_drop
+        self.on_slow = on_slow
+        self.namespace = namespace
+        # eio sid -> lag state, only for connections that went past high_water
+        self._lagging: dict[str, _Lag] = {}
+        self._task: asyncio.Task | None = None
+        self._closing: set[asyncio.Task] = set()
+
+        self.lagged = 0
+        self.dropped: dict[str, int] = {}
+        self.resyncs = 0
+        self.disconnects = 0
+
+    def install(self):
+        """Route the server's outbound packets through `admit`."""
+        if not isinstance(self.sio, GuardedServer):
+            raise TypeError(f"OutboundGuard needs a GuardedServer, not {type(self.sio).__name__}")
+        self.sio.outbound_guard = self
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def admit(self, eio_sid: str, event, encoded: bool = False) -> bool:
+        """Whether a frame for `event` may be queued for `eio_sid` now."""
+        sock = self.sio.eio.sockets.get(eio_sid)
+        if sock is None:
+            return True
+        depth = sock.queue.qsize()
+        lag = self._lagging.get(eio_sid)
+        if lag is None:
+            if depth < self.high_water:
+                return True
+            lag = self._lagging[eio_sid] = _Lag()
+            self.lagged += 1
+        if lag.closing:
+            return False
+
+        if encoded:
+            event = _event_of(event)
+        if depth >= self.max_queue or (lag.resync_at is not None and time.monotonic() - lag.resync_at >= self.max_lag):
+            self._disconnect(eio_sid, sock, lag)
+            return False
+        if event in DISPOSABLE:
+            self._drop(event)
+            return False
+        if event in RECOVERABLE and (lag.resync_at is not None or depth >= self.resync_water):
+            if lag.resync_at is None:
+                lag.resync_at = time.monotonic()
+            self._drop(event)
+            return False
+        return True
+
+    def _drop(self, event: str):
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        if self.on_drop is not None:
+            self.on_drop(event)
+
+    def _disconnect(self, eio_sid: str, sock, lag: _Lag):
+        lag.closing = True
+        self.disconnects += 1
+        if self.on_slow is not None:
+            self.on_slow("disconnect")
+        logger.warning("disconnecting slow consumer %s: %d frames queued", eio_sid, sock.queue.qsize())
+        # nothing queued for it will be read now
+        while True:
+            try:
+                sock.queue.get_nowait()
+                sock.queue.task_done()
+            except asyncio.QueueEmpty:
+                break
+        task = asyncio.get_running_loop().create_task(self._close(sock))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(sock):
+        # runs the disconnect handlers without waiting for the queue to be read
+        await sock.close(wait=False, abort=True)
+        # and lets the writer task finish once its current send returns
+        sock.queue.put_nowait(None)
+
+    async def sweep(self):
+        """Forget closed connections; ask the ones that drained and lost messages to resync."""
+        now = time.monotonic()
+        for eio_sid, lag in list(self._lagging.items()):
+            sock = self.sio.eio.sockets.get(eio_sid)
+            if sock is None or sock.closed:
+                del self._lagging[eio_sid]
+                continue
+            if lag.closing:
+                continue
+            if lag.resync_at is not None and now - lag.resync_at >= self.max_lag:
+                self._disconnect(eio_sid, sock, lag)
+                continue
+            if sock.queue.qsize() > self.high_water // 2:
+                continue
+            del self._lagging[eio_sid]
+            if lag.resync_at is not None:
+                await self._request_resync(eio_sid)
+
+    async def _request_resync(self, eio_sid: str):
+        sid = self.sio.manager.sid_from_eio_sid(eio_sid, self.namespace)
+        if sid is None:
+            return
+        self.resyncs += 1
+        if self.on_slow is not None:
+            self.on_slow("resync")
+        try:
+            await self.sio.emit("resync_required", {}, to=sid)
+        except Exception:
+            logger.exception("resync request to %s failed", sid)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("outbound queue sweep failed")
+
+    def depths(self) -> list[int]:
+        return [sock.queue.qsize() for sock in list(self.sio.eio.sockets.values())]
+
+    def stats(self) -> dict:
+        depths = self.depths()
+        return {
+            "high_water":     self.high_water,
+            "resync_water":   self.resync_water,
+            "max_queue":      self.max_queue,
+            "queued":         sum(depths),
+            "deepest":        max(depths, default=0),
+            "lagging":        len(self._lagging),
+            "owing_resync":   sum(1 for lag in self._lagging.values() if lag.resync_at is not None),
+            "lagged":         self.lagged,
+            "dropped":        dict(sorted(self.dropped.items())),
+            "resyncs":        self.resyncs,
+            "disconnects":    self.disconnects,
+        }
+
+
+# GuardedServer overrides these private python-socketio methods; an upgrade
+# that renames or reshapes them must fail here rather than quietly turn the
+# guard off (python-socketio is pinned in requirements.txt for this reason)
+_HOOKS = {"_send_eio_packet": ["self", "eio_sid", "eio_pkt"], "_send_packet": ["self", "eio_sid", "pkt"]}
+for _name, _params in _HOOKS.items():
+    _method = getattr(socketio.AsyncServer, _name, None)
+    if _method is None or list(inspect.signature(_method).parameters) != _params:
+        raise ImportError(f"python-socketio {socketio.__version__} has no AsyncServer.{_name}{tuple(_params[1:])}; "
+                          "backpressure needs the version pinned in requirements.txt")
+
+
+class GuardedServer(socketio.AsyncServer):
+    """`socketio.AsyncServer` whose outbound packets pass `outbound_guard.admit` first."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbound_guard: OutboundGuard | None = None
+
+    # room and broadcast emits: the packet is already encoded once for every recipient
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        if self.outbound_guard is None or self.outbound_guard.admit(eio_sid, eio_pkt.data, encoded=True):
+            await super()._send_eio_packet(eio_sid, eio_pkt)
+
+    # emits with a callback, acks and connect/disconnect packets
+    async def _send_packet(self, eio_sid, pkt):
+        if self.outbound_guard is not None:
+            event = None
+            if pkt.packet_type in (sio_packet.EVENT, sio_packet.BINARY_EVENT) and pkt.data:
+                event = pkt.data[0]
+            if not self.outbound_guard.admit(eio_sid, event):
+                return
+        await super()._send_packet(eio_sid, pkt)
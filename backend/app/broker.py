@@ -0,0 +1,181 @@
+"""
+Minimal pub/sub + shared-state broker over a Unix socket.
+
+Stands in for Redis when several backend processes run on one host (and in
+tests). Frames are newline-delimited JSON objects:
+
+    {"op": "subscribe", "channel": c}
+    {"op": "publish", "channel": c, "data": {...}}        -> {"op": "message", "channel": c, "data": {...}}
+    {"op": "hincrby", "key": k, "field": f, "delta": d, "id": n}
+    {"op": "hgetall", "key": k, "id": n}
+                                                           -> {"id": n, "result": ...}
+
+Counter increments are remembered per connection and rolled back when that
+connection goes away, so a crashed worker does not leave stale presence.
+
+    python -m app.broker /tmp/chat-broker.sock
+"""
+import sys
+import json
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    def __init__(self):
+        self.subscribers: dict[str, set[asyncio.StreamWriter]] = defaultdict(set)
+        self.hashes: dict[str, dict] = defaultdict(dict)
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self, path: str):
+        self._server = await asyncio.start_unix_server(self._serve, path=path)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _hincrby(self, key: str, field: str, delta: int) -> int:
+        h = self.hashes[key]
+        value = h.get(field, 0) + delta
+        if value:
+            h[field] = value
+        else:
+            h.pop(field, None)
+            if not h:
+                del self.hashes[key]
+        return value
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        owned: dict[tuple[str, str], int] = defaultdict(int)
+        try:
+            while line := await reader.readline():
+                frame = json.loads(line)
+                op = frame.get("op")
+                if op == "subscribe":
+                    self.subscribers[frame["channel"]].add(writer)
+                    continue
+                if op == "publish":
+                    out = (json.dumps({"op": "message", "channel": frame["channel"], "data": frame["data"]}) + "\n").encode()
+                    for sub in list(self.subscribers.get(frame["channel"], ())):
+                        try:
+                            sub.write(out)
+                        except Exception:
+                            self.subscribers[frame["channel"]].discard(sub)
+                    continue
+
+                key = frame.get("key")
+                if op == "hincrby":
+                    owned[(key, frame["field"])] += frame["delta"]
+                    result = self._hincrby(key, frame["field"], frame["delta"])
+                elif op == "hgetall":
+                    result = dict(self.hashes.get(key, {}))
+                else:
+                    result = None
+                writer.write((json.dumps({"id": frame.get("id"), "result": result}) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for subs in self.subscribers.values():
+                subs.discard(writer)
+            for (key, field), delta in owned.items():
+                if delta:
+                    self._hincrby(key, field, -delta)
+            writer.close()
+
+
+class BrokerClient:
+    """Request/response connection to a `Broker` (one per process is enough)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader = None
+        self._writer = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._reader_task = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure(self):
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        async with self._lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self._reader_task = asyncio.create_task(self._read_replies(self._reader))
+
+    async def _read_replies(self, reader):
+        try:
+            while line := await reader.readline():
+                reply = json.loads(line)
+                fut = self._pending.pop(reply.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(reply.get("result"))
+        finally:
+            self._writer = None
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("broker connection lost"))
+            self._pending.clear()
+
+    async def request(self, op: str, **kwargs):
+        await self._ensure()
+        self._next_id += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = fut
+        self._writer.write((json.dumps({"op": op, "id": self._next_id, **kwargs}) + "\n").encode())
+        await self._writer.drain()
+        return await fut
+
+    async def publish(self, channel: str, data: dict):
+        await self._ensure()
+        self._writer.write((json.dumps({"op": "publish", "channel": channel, "data": data}) + "\n").encode())
+        await self._writer.drain()
+
+    async def subscribe(self, channel: str):
+        """Yield messages published on `channel`, reconnecting with backoff."""
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                logger.warning("broker at %s unavailable, retrying in %.1fs", self.path, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            delay = 0.1
+            writer.write((json.dumps({"op": "subscribe", "channel": channel}) + "\n").encode())
+            await writer.drain()
+            try:
+                while line := await reader.readline():
+                    frame = json.loads(line)
+                    if frame.get("op") == "message":
+                        yield frame["data"]
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                writer.close()
+            logger.warning("lost broker subscription on %s, reconnecting", channel)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+
+async def serve(path: str):
+    broker = Broker()
+    await broker.start(path)
+    logger.info("broker listening on %s", path)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(sys.argv[1] if len(sys.argv) > 1 else "/tmp/chat-broker.sock"))
@@ -0,0 +1,160 @@
+import os
+import logging
+from collections import Counter, defaultdict
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from .broker import BrokerClient
+
+logger = logging.getLogger(__name__)
+
+# "" (single process), "redis://host:6379/0", or "unix:///path/to/broker.sock" (see broker.py)
+BROKER_URL = os.getenv("BROKER_URL", "")
+
+
+def _unix_path(url: str) -> str:
+    return url[len("unix://"):]
+
+
+def _require_redis(url: str):
+    """Fail at startup, not on the first emit, when a redis:// broker has no client library."""
+    try:
+        import redis.asyncio  # noqa: F401
+    except ImportError:
+        raise RuntimeError(
+            f"BROKER_URL={url} needs the optional `redis` package: pip install redis"
+        ) from None
+
+
+class _RemoteEmits:
+    """
+    Mixin for pub/sub client managers: `on_remote_emit(event, data)`, if
+    set, is called for every emit that reaches this process from another
+    one, before it is delivered to the local clients.
+    """
+
+    on_remote_emit = None
+
+    async def _handle_emit(self, message):
+        if self.on_remote_emit is not None and message.get("host_id") != self.host_id:
+            try:
+                self.on_remote_emit(message.get("event"), message.get("data"))
+            except Exception:
+                logger.exception("remote emit hook failed for %s", message.get("event"))
+        await super()._handle_emit(message)
+
+
+class BrokerManager(_RemoteEmits, AsyncPubSubManager):
+    """Socket.IO client manager that fans out through the Unix-socket broker."""
+
+    name = "chatbroker"
+
+    def __init__(self, path: str, channel: str = "socketio", write_only: bool = False, logger=None):
+        self.client = BrokerClient(path)
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _publish(self, data):
+        await self.client.publish(self.channel, data)
+
+    async def _listen(self):
+        async for data in self.client.subscribe(self.channel):
+            yield data
+
+
+class RedisManager(_RemoteEmits, socketio.AsyncRedisManager):
+    """`socketio.AsyncRedisManager` with the remote emit hook."""
+
+
+def make_client_manager(url: str = BROKER_URL):
+    """Client manager for `socketio.AsyncServer`; None keeps the in-process default."""
+    if not url:
+        return None
+    if url.startswith("unix://"):
+        return BrokerManager(_unix_path(url))
+    if url.startswith(("redis://", "rediss://")):
+        _require_redis(url)
+        return RedisManager(url)
+    raise ValueError(f"unsupported BROKER_URL: {url!r}")
+
+
+# --- presence (who is in which room), shared between workers ---
+# Each join counts once and each leave uncounts once, so a user stays listed
+# while any of their connections (on any worker) is still in the room.
+# `add`/`remove` return the user's new count in that room.
+class LocalPresenceStore:
+    """Presence for a single process."""
+
+    def __init__(self):
+        self._rooms: dict[str, Counter] = defaultdict(Counter)
+
+    async def add(self, room: str, username: str) -> int:
+        self._rooms[room][username] += 1
+        return self._rooms[room][username]
+
+    async def remove(self, room: str, username: str) -> int:
+        counts = self._rooms.get(room)
+        if counts is None:
+            return 0
+        counts[username] -= 1
+        left = counts[username]
+        if left <= 0:
+            del counts[username]
+            if not counts:
+                del self._rooms[room]
+        return max(left, 0)
+
+    async def members(self, room: str) -> list[str]:
+        return list(self._rooms.get(room, ()))
+
+
+class BrokerPresenceStore:
+    """Presence counters in the Unix-socket broker; a dead worker's counts are rolled back."""
+
+    def __init__(self, path: str, prefix: str = "presence"):
+        self.client = BrokerClient(path)
+        self.prefix = prefix
+
+    async def add(self, room: str, username: str) -> int:
+        return await self.client.request("hincrby", key=f"{self.prefix}:{room}", field=username, delta=1)
+
+    async def remove(self, room: str, username: str) -> int:
+        return await self.client.request("hincrby", key=f"{self.prefix}:{room}", field=username, delta=-1)
+
+    async def members(self, room: str) -> list[str]:
+        counts = await self.client.request("hgetall", key=f"{self.prefix}:{room}")
+        return [u for u, n in counts.items() if n > 0]
+
+
+class RedisPresenceStore:
+    """Presence counters in Redis hashes (needs the optional `redis` package)."""
+
+    def __init__(self, url: str, prefix: str = "presence"):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def add(self, room: str, username: str) -> int:
+        return await self.redis.hincrby(f"{self.prefix}:{room}", username, 1)
+
+    async def remove(self, room: str, username: str) -> int:
+        left = await self.redis.hincrby(f"{self.prefix}:{room}", username, -1)
+        if left <= 0:
+            await self.redis.hdel(f"{self.prefix}:{room}", username)
+        return left
+
+    async def members(self, room: str) -> list[str]:
+        counts = await self.redis.hgetall(f"{self.prefix}:{room}")
+        return [u for u, n in counts.items() if int(n) > 0]
+
+
+def make_presence_store(url: str = BROKER_URL, prefix: str = "presence"):
+    """`prefix` keeps separate sets of counters (e.g. "typing") apart in a shared store."""
+    if not url:
+        return LocalPresenceStore()
+    if url.startswith("unix://"):
+        return BrokerPresenceStore(_unix_path(url), prefix)
+    if url.startswith(("redis://", "rediss://")):
+        _require_redis(url)
+        return RedisPresenceStore(url, prefix)
+    raise ValueError(f"unsupported BROKER_URL: {url!r}")
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+FANOUT_LINGER_MS = float(os.getenv("FANOUT_LINGER_MS", "5"))
+FANOUT_MAX_BATCH = int(os.getenv("FANOUT_MAX_BATCH", "50"))
+# messages per second above which a room counts as busy and gets batched
+FANOUT_HOT_RATE  = int(os.getenv("FANOUT_HOT_RATE", "20"))
+
+# Clients announce the protocol they speak in the connect auth
+# ({"protocol": 2}). Version 1 (the default) only understands single
+# `receive_message` frames; version 2 also takes `receive_messages` arrays.
+PROTOCOL_SINGLE = 1
+PROTOCOL_BATCH  = 2
+
+
+def protocol_room(room: str, protocol: int) -> str:
+    """Sub-room holding the connections of `room` that speak `protocol`."""
+    return f"{room}\x00v{PROTOCOL_BATCH if protocol >= PROTOCOL_BATCH else PROTOCOL_SINGLE}"
+
+
+class _RoomState:
+    __slots__ = ("pending", "timer", "bucket", "count", "previous")
+
+    def __init__(self):
+        self.pending: list[dict] = []
+        self.timer: asyncio.Task | None = None
+        self.bucket = 0      # current one-second bucket
+        self.count = 0       # messages seen in it
+        self.previous = 0    # messages seen in the bucket before
+
+
+class MessageFanout:
+    """
+    Delivers chat messages to a room, batching only where it pays off.
+
+    A quiet room sends each message at once as `receive_message`. Once a room
+    goes over `hot_rate` messages/second, batch-capable (protocol 2)
+    connections get one `receive_messages` frame per `linger_ms` (or per
+    `max_batch` messages) instead, while protocol 1 connections keep getting
+    single frames. `emit(event, data, to)` is usually `sio.emit`.
+    """
+
+    def __init__(
+        self,
+        emit,
+        linger_ms: float = FANOUT_LINGER_MS,
+        max_batch: int = FANOUT_MAX_BATCH,
+        hot_rate: int = FANOUT_HOT_RATE,
+    ):
+        self.emit = emit
+        self.linger = linger_ms / 1000.0
+        self.max_batch = max_batch
+        self.hot_rate = hot_rate
+        self._rooms: dict[str, _RoomState] = {}
+        self._last_sweep = 0
+
+        self.messages = 0
+        self.single_frames = 0
+        self.batch_frames = 0
+        self.batched_messages = 0
+
+    def _state(self, room: str) -> _RoomState:
+        state = self._rooms.get(room)
+        if state is None:
+            state = self._rooms[room] = _RoomState()
+        bucket = int(time.monotonic())
+        if bucket != state.bucket:
+            state.previous = state.count if bucket == state.bucket + 1 else 0
+            state.bucket, state.count = bucket, 0
+        return state
+
+    async def publish(self, room: str, message: dict):
+        self.messages += 1
+        if int(time.monotonic()) != self._last_sweep:
+            self.forget_idle()
+        state = self._state(room)
+        state.count += 1
+        if not state.pending and max(state.count, state.previous) < self.hot_rate:
+            await self.emit("receive_message", message, to=room)
+            self.single_frames += 1
+            return
+
+        await self.emit("receive_message", message, to=protocol_room(room, PROTOCOL_SINGLE))
+        self.single_frames += 1
+        state.pending.append(message)
+        if len(state.pending) >= self.max_batch:
+            await self._flush(room)
+        elif state.timer is None:
+            state.timer = asyncio.create_task(self._flush_later(room))
+
+    async def _flush_later(self, room: str):
+        await asyncio.sleep(self.linger)
+        state = self._rooms.get(room)
+        if state is not None:
+            state.timer = None
+        await self._flush(room)
+
+    async def _flush(self, room: str):
+        state = self._rooms.get(room)
+        if state is None or not state.pending:
+            return
+        batch, state.pending = state.pending, []
+        if state.timer is not None and state.timer is not asyncio.current_task():
+            state.timer.cancel()
+            state.timer = None
+        try:
+            await self.emit("receive_messages", batch, to=protocol_room(room, PROTOCOL_BATCH))
+            self.batch_frames += 1
+            self.batched_messages += len(batch)
+        except Exception:
+            logger.exception("batched fan-out to %s failed", room)
+
+    async def flush_all(self):
+        for room in list(self._rooms):
+            await self._flush(room)
+
+    def forget_idle(self):
+        """Drop state of rooms with nothing pending and no traffic for two seconds."""
+        bucket = self._last_sweep = int(time.monotonic())
+        for room, state in list(self._rooms.items()):
+            if not state.pending and state.bucket < bucket - 1:
+                del self._rooms[room]
+
+    def stats(self) -> dict:
+        return {
+            "rooms":            len(self._rooms),
+            "messages":         self.messages,
+            "single_frames":    self.single_frames,
+            "batch_frames":     self.batch_frames,
+            "batched_messages": self.batched_messages,
+            "avg_batch":        round(self.batched_messages / self.batch_frames, 2) if self.batch_frames else 0.0,
+        }
@@ -0,0 +1,177 @@
+import os
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+
+from .schemas import MessageRead
+
+HISTORY_CACHE_PER_ROOM  = int(os.getenv("HISTORY_CACHE_PER_ROOM", "200"))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# rough per-message overhead of the model instance, key tuple and list slots
+_MESSAGE_OVERHEAD = 400
+
+Key = tuple[datetime, int]
+
+
+def _size(msg: MessageRead) -> int:
+    return _MESSAGE_OVERHEAD + len(msg.content or "") + len(msg.username or "") + len(msg.room or "")
+
+
+class _RoomHistory:
+    """Newest messages of one room, oldest first, keyed by (timestamp, id)."""
+
+    __slots__ = ("keys", "items", "complete", "nbytes")
+
+    def __init__(self):
+        self.keys: list[Key] = []
+        self.items: list[MessageRead] = []
+        # True when the room has no messages older than items[0]
+        self.complete = False
+        self.nbytes = 0
+
+
+class RecentMessageCache:
+    """
+    Per-room ring buffer of the most recent `MessageRead`s.
+
+    Every message written in this process, or delivered to it from another
+    worker through the broker, is appended, so each room holds a contiguous
+    run of that room's newest messages; a history request is served
+    from it when the requested window lies inside that run. Rooms are kept in
+    LRU order and the coldest are dropped once the estimated size exceeds
+    `max_bytes`.
+    """
+
+    def __init__(self, per_room: int = HISTORY_CACHE_PER_ROOM, max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self._rooms: OrderedDict[str, _RoomHistory] = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def _entry(self, room: str) -> _RoomHistory:
+        entry = self._rooms.get(room)
+        if entry is None:
+            entry = self._rooms[room] = _RoomHistory()
+        self._rooms.move_to_end(room)
+        return entry
+
+    def _insert(self, entry: _RoomHistory, msg: MessageRead):
+        key = (msg.timestamp, msg.id)
+        i = bisect_left(entry.keys, key)
+        if i < len(entry.keys) and entry.keys[i] == key:
+            return
+        entry.keys.insert(i, key)
+        entry.items.insert(i, msg)
+        entry.nbytes += _size(msg)
+        self.nbytes += _size(msg)
+
+    def _trim(self, entry: _RoomHistory):
+        while len(entry.keys) > self.per_room:
+            entry.keys.pop(0)
+            dropped = entry.items.pop(0)
+            entry.nbytes -= _size(dropped)
+            self.nbytes -= _size(dropped)
+            entry.complete = False
+
+    def _enforce_budget(self):
+        while self.nbytes > self.max_bytes and len(self._rooms) > 1:
+            _, entry = self._rooms.popitem(last=False)
+            self.nbytes -= entry.nbytes
+            self.evictions += 1
+
+    def append(self, msg: MessageRead):
+        """Record a message that was just written."""
+        entry = self._entry(msg.room)
+        if entry.keys and not entry.complete and (msg.timestamp, msg.id) < entry.keys[0]:
+            return  # older than the cached run; keeping it could leave a gap
+        self._insert(entry, msg)
+        self._trim(entry)
+        self._enforce_budget()
+
+    def prime(self, room: str, newest: list[MessageRead], complete: bool):
+        """
+        Merge a newest-first page read from the database into the buffer.
+        `complete` means the page reached the first message of the room.
+        """
+        entry = self._entry(room)
+        for msg in newest:
+            self._insert(entry, msg)
+        entry.complete = complete and len(entry.keys) <= self.per_room
+        self._trim(entry)
+        self._enforce_budget()
+
+    def window(
+        self,
+        room: str,
+        limit: int,
+        before: Key | None = None,
+        after: Key | None = None,
+    ) -> list[MessageRead] | None:
+        """
+        Same contract as the `/messages/` query (newest-first, `limit` rows,
+        strictly before/after the cursor). Returns None when the buffer can't
+        answer without the database.
+        """
+        entry = self._rooms.get(room)
+        if entry is None or not (entry.keys or entry.complete):
+            self.misses += 1
+            return None
+
+        result = None
+        if after is not None:
+            if entry.complete or after >= entry.keys[0]:
+                j = bisect_right(entry.keys, after)
+                result = entry.items[j:j + limit][::-1]
+        else:
+            end = bisect_left(entry.keys, before) if before is not None else len(entry.keys)
+            if end >= limit:
+                result = entry.items[end - limit:end][::-1]
+            elif entry.complete:
+                result = entry.items[:end][::-1]
+
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._rooms.move_to_end(room)
+        return result
+
+    def since(self, room: str, last_id: int, limit: int) -> list[MessageRead] | None:
+        """
+        Up to `limit` messages after message `last_id`, oldest first.
+        Returns None when `last_id` isn't in the buffer.
+        """
+        entry = self._rooms.get(room)
+        if entry is not None:
+            # resumes are for recent ids, so search from the newest end
+            for i in range(len(entry.items) - 1, -1, -1):
+                if entry.items[i].id == last_id:
+                    self.hits += 1
+                    self._rooms.move_to_end(room)
+                    return entry.items[i + 1:i + 1 + limit]
+        self.misses += 1
+        return None
+
+    def discard(self, room: str):
+        entry = self._rooms.pop(room, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "rooms":     len(self._rooms),
+            "bytes":     self.nbytes,
+            "hits":      self.hits,
+            "misses":    self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,312 @@
+import os
+import glob
+import json
+import asyncio
+import logging
+import threading
+import httpx
+
+logger = logging.getLogger(__name__)
+
+ES_SERVICE_URL      = os.getenv("ES_SERVICE_URL", "http://elasticsearch-service:8000")
+ES_BATCH_SIZE       = int(os.getenv("ES_BATCH_SIZE", "500"))
+ES_BATCH_LINGER_MS  = float(os.getenv("ES_BATCH_LINGER_MS", "200"))
+ES_BUFFER_MAX       = int(os.getenv("ES_BUFFER_MAX", "20000"))
+ES_SPOOL_PATH       = os.getenv("ES_SPOOL_PATH", "./es-spool.jsonl")
+ES_DEAD_LETTER_PATH = os.getenv("ES_DEAD_LETTER_PATH", "")  # default: <spool>.rejected
+ES_REPLAY_MAX_DELAY = float(os.getenv("ES_REPLAY_MAX_DELAY", "60"))
+
+
+class SearchIndexer:
+    """
+    Buffers messages for the ES wrapper and ships them with `/index/bulk`.
+
+    A batch goes out when `batch_size` messages are waiting or `linger_ms`
+    after the first one arrived. Batches (or single items) the wrapper could
+    not take go to an in-memory overflow list that a background task appends
+    to the on-disk spool, so `add` never waits on the network or the disk.
+
+    The spool is replayed with exponential backoff. Replay seals the spool
+    into a numbered segment (`<spool>.<n>`), reads it forward from an offset
+    and deletes it once it is fully shipped; new overflow keeps going to a
+    fresh spool meanwhile. Items the wrapper rejects again on replay are
+    written to the dead-letter file and skipped. All file IO runs in a
+    thread. `on_indexed(items)` is called with every batch ES accepted.
+    """
+
+    def __init__(
+        self,
+        base_url: str = ES_SERVICE_URL,
+        batch_size: int = ES_BATCH_SIZE,
+        linger_ms: float = ES_BATCH_LINGER_MS,
+        max_buffer: int = ES_BUFFER_MAX,
+        spool_path: str = ES_SPOOL_PATH,
+        dead_letter_path: str = ES_DEAD_LETTER_PATH,
+        replay_min_delay: float = 1.0,
+        replay_max_delay: float = ES_REPLAY_MAX_DELAY,
+        transport: httpx.AsyncBaseTransport | None = None,
+        on_indexed=None,
+        event_hooks: dict | None = None,
+    ):
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000.0
+        self.max_buffer = max_buffer
+        self.spool_path = spool_path
+        self.dead_letter_path = dead_letter_path or spool_path + ".rejected"
+        self.replay_min_delay = replay_min_delay
+        self.replay_max_delay = replay_max_delay
+        self._transport = transport
+        self._event_hooks = event_hooks
+        self.on_indexed = on_indexed
+
+        self._buffer: list[dict] = []
+        self._wakeup: asyncio.Event | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._tasks: list[asyncio.Task] = []
+
+        # waiting to be appended to the spool by `_spool_loop`
+        self._overflow: list[dict] = []
+        self._spool_wakeup: asyncio.Event | None = None
+        # held by the worker threads around every append / rotation of the spool
+        self._file_lock = threading.Lock()
+        # sealed segment being replayed, and how far into it has been shipped
+        self._segment: str | None = None
+        self._offset = 0
+
+        self.indexed = 0
+        self.batches = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._client = httpx.AsyncClient(base_url=self.base_url, transport=self._transport, timeout=10.0,
+                                         event_hooks=self._event_hooks)
+        self._wakeup = asyncio.Event()
+        self._spool_wakeup = asyncio.Event()
+        if self._overflow:
+            self._spool_wakeup.set()
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._spool_loop()),
+            asyncio.create_task(self._replay_loop()),
+        ]
+
+    async def stop(self):
+        """Ship what is buffered (spooling it if that fails) and close the client."""
+        if not self.running:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+        await self.write_overflow()
+        await self._client.aclose()
+        self._client = None
+
+    def add(self, chat_id: str, message: dict):
+        """Queue one message for indexing."""
+        item = {"chat_id": chat_id, "message": message}
+        if not self.running or len(self._buffer) >= self.max_buffer:
+            # no sender, or ES is far behind: keep the buffer bounded and let replay catch up
+            self._overflow_add([item])
+            return
+        self._buffer.append(item)
+        if len(self._buffer) == 1 or len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                failed = await self._send(batch)
+            except asyncio.CancelledError:
+                self._overflow_add(batch)
+                raise
+            if failed:
+                self._overflow_add(failed)
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if len(self._buffer) < self.batch_size:
+                await asyncio.sleep(self.linger)
+            await self.flush()
+
+    async def _post(self, items: list[dict]) -> list[dict]:
+        """POST one batch; returns the items the wrapper rejected. Raises if the request failed."""
+        resp = await self._client.post("/index/bulk", json={"items": items})
+        resp.raise_for_status()
+        rejected = {str(i) for i in resp.json().get("failed", [])}
+
+        self.batches += 1
+        failed = [item for item in items if str(item["message"]["id"]) in rejected]
+        self.indexed += len(items) - len(failed)
+        if self.on_indexed and len(failed) < len(items):
+            try:
+                self.on_indexed([item for item in items if str(item["message"]["id"]) not in rejected])
+            except Exception:
+                logger.exception("on_indexed callback failed")
+        return failed
+
+    async def _send(self, items: list[dict]) -> list[dict]:
+        """POST one batch; returns the items that still need indexing."""
+        if self._client is None:
+            return items
+        try:
+            return await self._post(items)
+        except Exception as e:
+            logger.warning("bulk index of %d messages failed: %s", len(items), e)
+            return items
+
+    # --- spool ---
+    def _overflow_add(self, items: list[dict]):
+        self._overflow.extend(items)
+        if self._spool_wakeup is not None:
+            self._spool_wakeup.set()
+
+    async def _spool_loop(self):
+        while True:
+            await self._spool_wakeup.wait()
+            self._spool_wakeup.clear()
+            await self.write_overflow()
+
+    async def write_overflow(self):
+        """Append everything in the overflow list to the spool, in one write."""
+        items, self._overflow = self._overflow, []
+        if not items:
+            return
+        try:
+            await asyncio.to_thread(self._append, self.spool_path, items)
+        except asyncio.CancelledError:
+            # the thread still finishes the write; don't queue the items twice
+            self.spooled += len(items)
+            raise
+        except OSError:
+            logger.exception("could not spool %d messages", len(items))
+            self._overflow[:0] = items
+            return
+        self.spooled += len(items)
+
+    def _append(self, path: str, items: list[dict]):
+        data = "".join(json.dumps(item) + "\n" for item in items)
+        with self._file_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def _segments(self) -> list[str]:
+        """Sealed spool segments, oldest first."""
+        paths = glob.glob(glob.escape(self.spool_path) + ".*")
+        numbered = [(int(p.rsplit(".", 1)[1]), p) for p in paths if p.rsplit(".", 1)[1].isdigit()]
+        return [p for _, p in sorted(numbered)]
+
+    def _next_segment(self) -> str | None:
+        """Oldest sealed segment; seals the live spool first if there is none."""
+        segments = self._segments()
+        if segments:
+            return segments[0]
+        with self._file_lock:
+            try:
+                if not os.path.getsize(self.spool_path):
+                    return None
+            except OSError:
+                return None
+            segment = f"{self.spool_path}.1"
+            os.replace(self.spool_path, segment)
+        return segment
+
+    def _read_segment(self, path: str, offset: int) -> tuple[list[dict], int]:
+        """Read up to one batch from `path` at `offset`; returns (items, offset after them)."""
+        items = []
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if len(items) >= self.batch_size or not line.endswith(b"\n"):
+                        break  # batch full, or a partial trailing write
+                    offset += len(line)
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("skipping a corrupt line in %s", path)
+        except FileNotFoundError:
+            pass
+        return items, offset
+
+    def spool_size(self) -> int:
+        """Bytes spooled and not yet replayed."""
+        size = 0
+        for path in [self.spool_path, *self._segments()]:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return max(0, size - self._offset) if self._segment else size
+
+    async def replay_once(self) -> bool:
+        """Try to ship one batch from the spool. Returns False if the wrapper could not be reached."""
+        if self._segment is None:
+            self._segment = await asyncio.to_thread(self._next_segment)
+            self._offset = 0
+            if self._segment is None:
+                return True
+        items, offset = await asyncio.to_thread(self._read_segment, self._segment, self._offset)
+        if not items:
+            if offset == self._offset:
+                # fully shipped (a partial trailing line is a write that never finished)
+                await asyncio.to_thread(_unlink, self._segment)
+                self._segment = None
+            self._offset = offset
+            return True
+        if self._client is None:
+            return False
+        try:
+            rejected = await self._post(items)
+        except Exception as e:
+            logger.warning("replay of %d spooled messages failed: %s", len(items), e)
+            return False
+        if rejected:
+            # refused a second time: keep them aside instead of retrying forever
+            await asyncio.to_thread(self._append, self.dead_letter_path, rejected)
+            self.dead_lettered += len(rejected)
+            logger.error("%d messages rejected by the search index, written to %s",
+                         len(rejected), self.dead_letter_path)
+        self._offset = offset
+        self.replayed += len(items) - len(rejected)
+        return True
+
+    async def _replay_loop(self):
+        delay = self.replay_min_delay
+        while True:
+            await asyncio.sleep(delay)
+            if await self.replay_once():
+                delay = self.replay_min_delay
+            else:
+                delay = min(delay * 2, self.replay_max_delay)
+
+    def stats(self) -> dict:
+        return {
+            "buffered":      len(self._buffer),
+            "overflow":      len(self._overflow),
+            "batches":       self.batches,
+            "indexed":       self.indexed,
+            "spooled":       self.spooled,
+            "replayed":      self.replayed,
+            "dead_lettered": self.dead_lettered,
+            "spool_bytes":   self.spool_size(),
+        }
+
+
+def _unlink(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
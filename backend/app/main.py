@@ -1,12 +1,16 @@
 import uvicorn
-import os
-import httpx
-from fastapi import FastAPI, Depends, HTTPException, status, Response
+import math
+import anyio
+import time
+from fastapi import FastAPI, Depends, HTTPException, status, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from collections import defaultdict
+from datetime import datetime
 import socketio
 from jose import JWTError, jwt
 from pydantic import BaseModel
@@ -15,9 +19,27 @@ from typing import List
 from fastapi import Query
 
 
-from .database import Base, SessionLocal, engine, get_db
+from .database import AsyncSessionLocal, engine, async_engine, get_db, get_async_db
 from . import models, schemas, auth as _auth_module
-from .models import User, Friend, FriendRequest, RoomInvite
+from .migrations import upgrade
+from .pagination import encode_cursor, decode_cursor
+from .persistence import MessageIdAllocator, MessageWriter
+from .search_backends import make_search_backend
+from .search_cache import SearchCache, search_key
+from .history_cache import RecentMessageCache
+from .resume import ResumeSync, as_event, from_event
+from .room_access import RoomAccess
+from .rate_limit import RateLimits
+from .backpressure import OutboundGuard, GuardedServer
+from .principal_cache import PrincipalCache
+from .bus import make_client_manager, make_presence_store
+from .presence import PresenceTracker
+from .typing_state import TypingTracker
+from .fanout import MessageFanout, protocol_room, PROTOCOL_SINGLE
+from . import metrics
+from .query_profiler import QueryProfiler, QueryProfileMiddleware
+from .models import User, Friend, FriendRequest, RoomInvite, RoomMember
+from .membership import private_participants, add_members, remove_member
 from .schemas import (
     UserRead,
     UserCreate,
@@ -33,11 +55,8 @@ from .schemas import (
     RoomInviteCreate,
 )
 
-ES_SERVICE_URL = os.getenv("ES_SERVICE_URL", "http://elasticsearch-service:8000")
-
-
 # --- Initialize DB ---
-Base.metadata.create_all(bind=engine)
+upgrade(engine)
 
 # --- FastAPI + CORS setup ---
 app = FastAPI()
@@ -47,7 +66,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+query_profiler = QueryProfiler()
+query_profiler.instrument(engine)
+query_profiler.instrument(async_engine.sync_engine)
+app.add_middleware(QueryProfileMiddleware, profiler=query_profiler)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
 
 
 # --- Auth helpers ---
@@ -62,74 +89,199 @@ async def health():
     return {"status":"ok"}
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-):
-    creds_exc = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "persistence": message_writer.stats(),
+        "indexer":     search_backend.stats(),
+        "search":      search_cache.stats(),
+        "history":     history_cache.stats(),
+        "principals":  principal_cache.stats(),
+        "hashing":     password_hasher.stats(),
+        "presence":    presence.stats(),
+        "typing":      typists.stats(),
+        "fanout":      fanout.stats(),
+        "resume":      resume.stats(),
+        "access":      room_access.stats(),
+        "rate_limits": rate_limits.stats(),
+        "outbound":    outbound.stats(),
+        "queries":     query_profiler.stats(),
+    }
+
+
+principal_cache = PrincipalCache()
+
+
+async def resolve_principal(token: str, db: AsyncSession) -> User | None:
+    """Decode `token` and load its user, going through `principal_cache`."""
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
+
+    started = time.perf_counter()
     try:
         payload = jwt.decode(token, _auth_module.SECRET_KEY, algorithms=[_auth_module.ALGORITHM])
-        username: str = payload.get("sub")
-        if not username:
-            raise creds_exc
     except JWTError:
-        raise creds_exc
+        return None
+    username: str = payload.get("sub")
+    if not username:
+        return None
 
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
     if not user:
-        raise creds_exc
+        return None
+    principal_cache.put(token, payload, user, cost=time.perf_counter() - started)
     return user
 
 
-@app.get("/search", response_model=List[schemas.MessageRead])
-async def proxy_search(chat_id: str = Query(...), q: str = Query(...)):
-    """Proxy through to the ES wrapper, then map into your internal MessageRead schema."""
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{ES_SERVICE_URL}/search",
-            params={"chat_id": chat_id, "q": q},
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await resolve_principal(token, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        resp.raise_for_status()
-        hits = resp.json()  # [{ "chat_id":..., "id":..., "text":..., "timestamp":..., "username":... }, ...]
+    return user
+
+
+rate_limits = RateLimits(on_limited=lambda event, scope: metrics.RATE_LIMITED.labels(event, scope).inc())
+
+
+def _too_many(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests, retry shortly",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+# async so every bucket is only ever touched from the event loop, also for
+# the sync (threadpool) endpoints
+def limit_by_ip(event: str):
+    async def dependency(request: Request):
+        wait = rate_limits.check(event, ip=request.client.host if request.client else None)
+        if wait:
+            raise _too_many(wait)
+    return Depends(dependency)
+
+
+def limit_by_user(event: str):
+    async def dependency(current_user: User = Depends(get_current_user)):
+        wait = rate_limits.check(event, user=current_user.id)
+        if wait:
+            raise _too_many(wait)
+    return Depends(dependency)
+
+
+search_cache = SearchCache()
+
+
+@app.get("/search", dependencies=[limit_by_ip("search")], response_model=List[schemas.SearchHit], response_model_exclude_none=True)
+async def proxy_search(
+    response: Response,
+    chat_id: str = Query(...),
+    q: str = Query(...),
+    size: int = Query(20, ge=1, le=100),
+    sort: Literal["timestamp", "relevance"] = Query("timestamp"),
+    cursor: str | None = Query(None),
+    highlight: bool = False,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """
+    Search through the configured backend (the ES wrapper by default), then
+    map into your internal MessageRead schema.
+    Paged like /messages/: pass X-Next-Cursor back as `cursor` for the next page.
+    """
+    async def load():
+        try:
+            return await search_backend.search(chat_id, q, size=size, sort=sort, cursor=cursor,
+                                               highlight=highlight, since=since, until=until)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # identical searches share one cached/in-flight backend call
+    key = search_key(chat_id, q, size=size, sort=sort, cursor=cursor, highlight=highlight,
+                     since=since, until=until)
+    hits, next_cursor = await search_cache.get_or_load(key, load)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
     return [
-        schemas.MessageRead(
+        schemas.SearchHit(
             id=hit["id"],
             room=hit["chat_id"],
             username=hit["username"],
             content=hit["text"],
             timestamp=hit["timestamp"],
+            highlight=hit.get("highlight"),
         )
         for hit in hits
     ]
         
 
 # --- USER endpoints ---
+password_hasher = _auth_module.PasswordHasher()
+HASH_RETRY_AFTER = "1"
+
+
+async def _hash_call(coro):
+    """Await a password-hasher call, turning a full pool into 503 + Retry-After."""
+    try:
+        return await coro
+    except _auth_module.HashPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, retry shortly",
+            headers={"Retry-After": HASH_RETRY_AFTER},
+        )
+
+
 @app.post("/users/", response_model=UserRead)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.username == user.username).first():
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User).where(User.username == user.username)):
         raise HTTPException(400, "Username already registered")
-    hashed = _auth_module.get_password_hash(user.password)
+    # don't hold a pooled connection while waiting on bcrypt
+    await db.commit()
+    hashed = await _hash_call(password_hasher.hash(user.password))
     db_user = User(username=user.username, hashed_password=hashed)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # someone took the name while the password was hashing
+        await db.rollback()
+        raise HTTPException(400, "Username already registered")
+    principal_cache.invalidate_user(db_user.username)
     return db_user
 
 
-@app.post("/token", response_model=Token)
-def login_for_access_token(
+@app.post("/token", response_model=Token, dependencies=[limit_by_ip("token")])
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    print("DEBUG handler sees:", list(db.query(User).all()))
-
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not _auth_module.verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.username == form_data.username))
+    # don't hold a pooled connection while waiting on bcrypt
+    await db.commit()
+    ok = False
+    if user:
+        ok, new_hash = await _hash_call(password_hasher.verify_and_update(form_data.password, user.hashed_password))
+        if ok and new_hash:
+            # stored hash predates the current bcrypt cost: upgrade it in place
+            user.hashed_password = new_hash
+            await db.commit()
+            principal_cache.invalidate_user(user.username)
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -141,17 +293,64 @@ def login_for_access_token(
 
 # --- MESSAGES ---
 @app.get("/messages/", response_model=list[MessageRead])
-def read_messages(
-    skip: int = 0,
-    limit: int = 100,
+async def read_messages(
+    response: Response,
     room: str | None = None,
+    limit: int = Query(100, ge=1, le=500),
+    before: str | None = None,
+    after: str | None = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = db.query(models.Message)
+    """
+    Newest-first history, paged by keyset rather than offset.
+    Pass the `X-Next-Cursor` response header back as `before` to scroll further
+    into the past; `after` returns the page immediately newer than a cursor
+    (its `X-Next-Cursor` keeps moving forward).
+    """
+    if before and after:
+        raise HTTPException(400, "Use either before or after, not both")
+    try:
+        cursor = decode_cursor(before or after) if (before or after) else None
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+    rows = None
+    if room:
+        rows = history_cache.window(
+            room,
+            limit,
+            before=cursor if before else None,
+            after=cursor if after else None,
+        )
+    if rows is None:
+        rows = await _query_messages(db, room, limit, before=cursor if before else None, after=cursor if after else None)
+        if room and not (before or after):
+            history_cache.prime(room, rows, complete=len(rows) < limit)
+
+    if len(rows) == limit:
+        edge = rows[0] if after else rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(edge.timestamp, edge.id)
+    return rows
+
+
+async def _query_messages(db: AsyncSession, room, limit, before=None, after=None) -> list[MessageRead]:
+    M = models.Message
+    key = tuple_(M.timestamp, M.id)
+    q = select(M)
     if room:
-        q = q.filter(models.Message.room == room)
-    return q.offset(skip).limit(limit).all()
+        q = q.where(M.room == room)
+    if after:
+        q = q.where(key > tuple_(*after)).order_by(M.timestamp.asc(), M.id.asc())
+    else:
+        if before:
+            q = q.where(key < tuple_(*before))
+        q = q.order_by(M.timestamp.desc(), M.id.desc())
+
+    rows = [MessageRead.model_validate(m, from_attributes=True) for m in (await db.scalars(q.limit(limit))).all()]
+    if after:
+        rows.reverse()
+    return rows
 
 
 # --- ROOMS ---
@@ -165,8 +364,6 @@ def create_room(
         raise HTTPException(400, "Room already exists")
     db_room = models.Room(name=room.name)
     db.add(db_room)
-    db.commit()
-    db.refresh(db_room)
 
     # auto-accept for the creator
     creator_invite = RoomInvite(
@@ -176,37 +373,31 @@ def create_room(
         status="accepted",
     )
     db.add(creator_invite)
+    # a room named private_{a}_{b} is only ever visible to a and b
+    pair = private_participants(db_room.name)
+    if pair:
+        add_members(db, db_room.name, [uid for (uid,) in db.query(User.id).filter(User.id.in_(pair))])
+    elif not db_room.name.startswith("private_"):
+        add_members(db, db_room.name, [current_user.id])
     db.commit()
+    db.refresh(db_room)
+    # a threadpool endpoint: RoomAccess is only ever changed on the event loop
+    anyio.from_thread.run_sync(room_access.grant, current_user.id, db_room.name)
     return db_room
 
 
 @app.get("/rooms/", response_model=list[RoomRead])
-def list_rooms(
+async def list_rooms(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    all_rooms = db.query(models.Room).all()
-    allowed: list[models.Room] = []
-    for r in all_rooms:
-        if r.name.startswith("private_"):
-            parts = r.name.split("_", 2)
-            if len(parts) == 3:
-                try:
-                    a, b = int(parts[1]), int(parts[2])
-                    if current_user.id in (a, b):
-                        allowed.append(r)
-                except ValueError:
-                    pass
-            continue
-
-        inv = (
-            db.query(RoomInvite)
-            .filter_by(room_name=r.name, to_user_id=current_user.id, status="accepted")
-            .first()
-        )
-        if inv:
-            allowed.append(r)
-    return allowed
+    q = (
+        select(models.Room)
+        .join(RoomMember, RoomMember.room_name == models.Room.name)
+        .where(RoomMember.user_id == current_user.id)
+        .order_by(models.Room.id)
+    )
+    return (await db.scalars(q)).all()
 
 
 # --- ROOM INVITES ---
@@ -274,8 +465,12 @@ def respond_room_invite(
         raise HTTPException(404, "No such invite")
 
     ri.status = "accepted" if resp.action == "accept" else "rejected"
+    if ri.status == "accepted" and not ri.room_name.startswith("private_"):
+        add_members(db, ri.room_name, [current_user.id])
     db.commit()
     db.refresh(ri)
+    if ri.status == "accepted":
+        anyio.from_thread.run_sync(room_access.grant, current_user.id, ri.room_name)
     return ri
 
 
@@ -297,17 +492,20 @@ def add_friend(
     f1 = Friend(user_id=current_user.id, friend_id=target.id)
     f2 = Friend(user_id=target.id, friend_id=current_user.id)
     db.add_all([f1, f2])
-    db.commit()
 
     name = f"private_{min(current_user.id, target.id)}_{max(current_user.id, target.id)}"
     room = db.query(models.Room).filter_by(name=name).first()
     if not room:
         room = models.Room(name=name)
         db.add(room)
-        db.commit()
-        db.refresh(room)
+    add_members(db, name, [current_user.id, target.id])
+    db.flush()
+    result = {"id": f1.id, "username": target.username, "room_name": name}
+    # friendship, room and memberships land together or not at all; reading
+    # the result first saves re-fetching the expired rows after the commit
+    db.commit()
 
-    return {"id": f1.id, "username": target.username, "room_name": name}
+    return result
 
 
 @app.get("/friends/", response_model=list[FriendRead])
@@ -331,7 +529,7 @@ def list_friends(
     ]
 
 
-@app.post("/friend_requests/", response_model=FriendRequestRead)
+@app.post("/friend_requests/", response_model=FriendRequestRead, dependencies=[limit_by_user("friend_request")])
 def send_friend_request(
     req: FriendRequestCreate,
     current_user: User = Depends(get_current_user),
@@ -373,10 +571,16 @@ def list_friend_requests(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    rows = db.query(FriendRequest).filter_by(to_user_id=current_user.id, status="pending").all()
+    # sender names in the same query, not one lazy load of r.from_user per row
+    rows = (
+        db.query(FriendRequest, User.username)
+        .join(User, FriendRequest.from_user_id == User.id)
+        .filter(FriendRequest.to_user_id == current_user.id, FriendRequest.status == "pending")
+        .all()
+    )
     return [
-        FriendRequestRead(id=r.id, from_username=r.from_user.username, status=r.status)
-        for r in rows
+        FriendRequestRead(id=r.id, from_username=from_username, status=r.status)
+        for r, from_username in rows
     ]
 
 
@@ -446,103 +650,314 @@ def leave_room(
     db: Session = Depends(get_db),
 ):
     db.query(RoomInvite).filter_by(room_name=room_name, to_user_id=current_user.id, status="accepted").delete(synchronize_session=False)
+    # private rooms follow from the name, so "leaving" one has never hidden it
+    if not room_name.startswith("private_"):
+        remove_member(db, room_name, current_user.id)
     db.commit()
+    if not room_name.startswith("private_"):
+        # this user's connections here stop receiving the room right away
+        sids = anyio.from_thread.run_sync(room_access.revoke, current_user.id, room_name)
+        if sids:
+            anyio.from_thread.run(_leave_all, sids, room_name)
     return Response(status_code=204)
 
 # --- SOCKET.IO setup (unchanged) ---
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+# with BROKER_URL set, emits and presence are shared by every backend process
+_client_manager = make_client_manager()
+if _client_manager is not None:
+    sio = GuardedServer(async_mode="asgi", cors_allowed_origins="*", client_manager=_client_manager)
+else:
+    sio = GuardedServer(async_mode="asgi", cors_allowed_origins="*")
 app_sio = socketio.ASGIApp(sio, other_asgi_app=app)
 
-room_users = defaultdict(set)
+# slow consumers: typing/presence frames are shed first, then messages (the
+# client resyncs), and a connection that still does not read is dropped
+outbound = OutboundGuard(
+    sio,
+    on_drop=lambda event: metrics.OUTBOUND_DROPPED.labels(event).inc(),
+    on_slow=lambda action: metrics.SLOW_CONSUMERS.labels(action).inc(),
+)
+outbound.install()
+
+presence = PresenceTracker(make_presence_store(), sio.emit)
+typists = TypingTracker(sio.emit, make_presence_store(prefix="typing"))
+fanout = MessageFanout(sio.emit)
+metrics.register_chat_state(sio, presence)
+history_cache = RecentMessageCache()
+
+
+def _remember_remote(event: str, data):
+    """Messages sent through other workers go into this worker's history as well."""
+    if event == "receive_message":
+        history_cache.append(from_event(data))
+    elif event == "receive_messages":
+        for item in data:
+            history_cache.append(from_event(item))
+
+
+# without this each worker's history (and resume) would only know its own writes
+if _client_manager is not None:
+    _client_manager.on_remote_emit = _remember_remote
+
+
+async def _load_rooms(user_id: int) -> set[str]:
+    async with AsyncSessionLocal() as db:
+        return set(await db.scalars(select(RoomMember.room_name).where(RoomMember.user_id == user_id)))
+
+
+room_access = RoomAccess(_load_rooms)
+
+
+async def _load_recent(room: str, limit: int) -> list[MessageRead]:
+    async with AsyncSessionLocal() as db:
+        return await _query_messages(db, room, limit)
+
+
+resume = ResumeSync(history_cache, _load_recent)
+
+
+# --- Write-behind message persistence ---
+async def _ack_persisted(batch):
+    """Tell each sender which of its messages are now durable."""
+    by_sid = defaultdict(list)
+    for row, sid in batch:
+        if sid:
+            by_sid[sid].append(row["id"])
+    for sid, ids in by_sid.items():
+        await sio.emit("message_persisted", {"ids": ids}, to=sid)
+    search_backend.persisted([row for row, _ in batch])
+
+
+message_ids = MessageIdAllocator(AsyncSessionLocal)
+message_writer = MessageWriter(AsyncSessionLocal, on_persisted=_ack_persisted)
+
+
+def _searchable(items):
+    """New messages became searchable: cached searches of those rooms are stale."""
+    for chat_id in {item["chat_id"] for item in items}:
+        search_cache.invalidate(chat_id)
+
+
+search_backend = make_search_backend(session_factory=AsyncSessionLocal, engine=engine, on_indexed=_searchable)
+
+
+@app.on_event("startup")
+async def start_background_writers():
+    message_writer.start()
+    await search_backend.start()
+    typists.start()
+    outbound.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_writers():
+    await outbound.stop()
+    await typists.stop()
+    await fanout.flush_all()
+    await presence.stop()
+    await message_writer.stop()
+    await search_backend.stop()
+    await async_engine.dispose()
 
 
 @sio.event
 async def connect(sid, environ, auth_data):
     token = auth_data.get("token") if auth_data else None
-    room = auth_data.get("room")
+    room = auth_data.get("room") if auth_data else None
     if not token:
         return False
+    async with AsyncSessionLocal() as db:
+        user = await resolve_principal(token, db)
+    if not user:
+        return False
+    username = user.username
     try:
-        payload = jwt.decode(token, _auth_module.SECRET_KEY, algorithms=[_auth_module.ALGORITHM])
-        username = payload.get("sub")
-        if not username:
-            return False
-    except JWTError:
+        protocol = int(auth_data.get("protocol") or PROTOCOL_SINGLE)
+    except (TypeError, ValueError):
+        protocol = PROTOCOL_SINGLE
+
+    # the only membership query of the connection; events check the loaded set
+    await room_access.attach(sid, user.id)
+    if room and not room_access.allowed(user.id, room):
+        room_access.detach(sid)
         return False
 
-    await sio.save_session(sid, {"username": username, "room": room})
+    await sio.save_session(sid, {"username": username, "user_id": user.id, "room": room, "protocol": protocol})
     if room:
-        await sio.enter_room(sid, room)
-        room_users[room].add(username)
-        await sio.emit("room_users", list(room_users[room]), to=room)
+        await _enter(sid, room, protocol)
+        await presence.join(sid, room, username)
+        # full list for the newcomer; everyone else gets a presence_delta
+        await sio.emit("room_users", await presence.snapshot(room), to=sid)
+        last_seen = auth_data.get("last_seen")
+        if isinstance(last_seen, dict):
+            await _resume(sid, room, last_seen.get(room))
     return True
 
+async def _enter(sid, room: str, protocol: int):
+    """Join `room` plus the sub-room that picks this client's message framing."""
+    await sio.enter_room(sid, room)
+    await sio.enter_room(sid, protocol_room(room, protocol))
+
+
+async def _resume(sid, room: str, last_id):
+    """
+    Send what a reconnecting client missed in `room` since message `last_id`
+    as one `resume` event: {"room", "messages"} or {"room", "reload": True}.
+    Called after the join, so a message racing it may arrive twice (dedupe by
+    id) but is never lost.
+    """
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        return
+    missed = await resume.missed(room, last_id)
+    if missed is None:
+        await sio.emit("resume", {"room": room, "reload": True}, to=sid)
+    else:
+        await sio.emit("resume", {"room": room, "messages": [as_event(m) for m in missed]}, to=sid)
+
 #Tell the server how to handle our client->room join requests
 @sio.event
-async def join_room(sid, room_name: str):
+async def join_room(sid, room_name):
+    # either a room name or {"room": ..., "last_seen": <message id>} to resume
+    last_seen = None
+    if isinstance(room_name, dict):
+        room_name, last_seen = room_name.get("room"), room_name.get("last_seen")
+    if not isinstance(room_name, str):
+        return
+
     # Fetch username from the session
     sess = await sio.get_session(sid)
     username = sess.get("username")
+    wait = rate_limits.check("join_room", sid=sid, user=sess.get("user_id"))
+    if wait:
+        return {"error": "rate limited", "retry_after": round(wait, 3)}
+    if not room_access.allowed(sess.get("user_id"), room_name):
+        return {"error": "not a member"}
 
     # Actually add this connection into the room
-    await sio.enter_room(sid, room_name)
+    await _enter(sid, room_name, sess.get("protocol", PROTOCOL_SINGLE))
+    await presence.join(sid, room_name, username)
+    users = await presence.snapshot(room_name)
+    await sio.emit("room_users", users, to=sid)
+    await _resume(sid, room_name, last_seen)
+    # the ack carries the member list too, for connections in several rooms
+    return users
+
+
+@sio.event
+async def presence_snapshot(sid, room_name: str):
+    """On-demand full member list of a room this connection is in."""
+    if not presence.in_room(sid, room_name):
+        return []
+    return await presence.snapshot(room_name)
+
+
+@sio.on("leave_room")
+async def leave_room_event(sid, room_name):
+    """Stop receiving `room_name` on this connection (the REST leave_room drops the membership)."""
+    if presence.in_room(sid, room_name):
+        await _leave(sid, room_name)
+
+
+async def _leave(sid, room: str):
+    sess = await sio.get_session(sid)
+    await sio.leave_room(sid, room)
+    await sio.leave_room(sid, protocol_room(room, sess.get("protocol", PROTOCOL_SINGLE)))
+    await presence.leave(sid, room)
+    typists.leave(sid, room)
+
+
+async def _leave_all(sids, room: str):
+    """Take connections out of a room their user no longer belongs to."""
+    for sid in sids:
+        if presence.in_room(sid, room):
+            await _leave(sid, room)
 
-    room_users[room_name].add(username)
-    await sio.emit("room_users", list(room_users[room_name]), to=room_name)
 
 @sio.event
 async def send_message(sid, data):
     sess = await sio.get_session(sid)
-    room = sess.get("room")
+    # refused before any work: each message costs a commit and an index call
+    wait = rate_limits.check("send_message", sid=sid, user=sess.get("user_id"))
+    if wait:
+        return {"error": "rate limited", "retry_after": round(wait, 3)}
+
+    # checked before an id is taken: a row the database refuses cannot be stored
+    text = data.get("text") if isinstance(data, dict) else None
+    if not isinstance(text, str):
+        return {"error": "invalid message"}
+
+    # one connection can be in many rooms; clients that predate that send no
+    # room and mean the one they connected with
+    room = data.get("room") or sess.get("room")
+    if not (presence.in_room(sid, room) and room_access.allowed(sess.get("user_id"), room)):
+        return {"error": "not in room"}
     username = sess.get("username")
-    db = SessionLocal()
-    db_msg = models.Message(room=room, username=username, content=data.get("text"))
-    db.add(db_msg)
-    db.commit()
-    db.refresh(db_msg)
-    db.close()
+
+    # the id is assigned up front so the message can go out before it is stored
+    row = {
+        "id":        await message_ids.next_id(),
+        "room":      room,
+        "username":  username,
+        "content":   text,
+        "timestamp": datetime.utcnow(),
+    }
+    await message_writer.submit(row, sid)
+    history_cache.append(MessageRead(**row))
 
     out = {
-        "id": db_msg.id,
-        "sender": db_msg.username,
-        "text": db_msg.content,
-        "timestamp": db_msg.timestamp.isoformat(),
+        "id": row["id"],
+        "room": room,
+        "sender": row["username"],
+        "text": row["content"],
+        "timestamp": row["timestamp"].isoformat(),
     }
-    await sio.emit("receive_message", out, to=room)
-
-    async with httpx.AsyncClient() as client:
-        await client.post(
-            f"{ES_SERVICE_URL}/index",
-            json={
-                "chat_id": room,
-                "message": {
-                    "id":        db_msg.id,
-                    "text":      db_msg.content,
-                    "timestamp": db_msg.timestamp.isoformat(),
-                    "username":  username,
-                }
-            },
-        )
+    await fanout.publish(room, out)
+
+    search_backend.add(room, {
+        "id":        row["id"],
+        "text":      row["content"],
+        "timestamp": out["timestamp"],
+        "username":  username,
+    })
+
+    # acknowledgement for the sender; "message_persisted" follows once stored
+    return {"id": row["id"], "timestamp": out["timestamp"]}
 
 @sio.event
 async def disconnect(sid):
-    sess = await sio.get_session(sid)
-    room = sess.get("room")
-    username = sess.get("username")
-    if room and username:
-        room_users[room].discard(username)
-        await sio.leave_room(sid, room)
-        await sio.emit("room_users", list(room_users[room]), to=room)
+    # every room this connection joined, not just the one it connected with
+    await presence.leave_all(sid)
+    typists.disconnect(sid)
+    room_access.detach(sid)
+    rate_limits.forget_sid(sid)
 
 
 @sio.event
 async def typing(sid, data):
-    await sio.emit("typing", data, to=data.get("room"))
+    room = (data or {}).get("room")
+    if presence.in_room(sid, room):
+        sess = await sio.get_session(sid)
+        # over the limit, typing indicators are simply dropped
+        if room_access.allowed(sess.get("user_id"), room) and not rate_limits.check(
+            "typing", sid=sid, user=sess.get("user_id")
+        ):
+            typists.typing(sid, room, sess.get("username"))
 
 
 @sio.event
 async def stop_typing(sid, data):
-    await sio.emit("stop_typing", data, to=data.get("room"))
+    room = (data or {}).get("room")
+    if presence.in_room(sid, room):
+        sess = await sio.get_session(sid)
+        # not rate limited: dropping a stop would leave the user shown as
+        # typing until the timeout, and it only ever removes state
+        if room_access.allowed(sess.get("user_id"), room):
+            typists.stop_typing(sid, room, sess.get("username"))
+
+
+# after every @sio.event above, so each handler gets profiled and timed
+query_profiler.instrument_socketio(sio)
+metrics.instrument_socketio(sio)
 
 
 if __name__ == "__main__":
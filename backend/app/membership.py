@@ -0,0 +1,63 @@
+from sqlalchemy.orm import Session
+
+from .models import User, Room, RoomInvite, RoomMember
+
+
+def private_participants(room_name: str) -> tuple[int, int] | None:
+    """User ids encoded in a `private_{a}_{b}` room name, or None for other rooms."""
+    if not room_name.startswith("private_"):
+        return None
+    parts = room_name.split("_", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def add_members(db: Session, room_name: str, user_ids):
+    """Add membership rows that don't exist yet. The caller commits."""
+    wanted = set(user_ids)
+    if not wanted:
+        return
+    present = {
+        uid for (uid,) in db.query(RoomMember.user_id)
+        .filter(RoomMember.room_name == room_name, RoomMember.user_id.in_(wanted))
+    }
+    db.add_all(RoomMember(room_name=room_name, user_id=uid) for uid in wanted - present)
+
+
+def remove_member(db: Session, room_name: str, user_id: int):
+    """The caller commits."""
+    db.query(RoomMember).filter_by(room_name=room_name, user_id=user_id).delete(synchronize_session=False)
+
+
+def backfill_room_members(db: Session) -> int:
+    """
+    Build `room_members` from existing data: accepted invites of group rooms
+    and the participants named by private rooms. Safe to re-run.
+    Returns the number of rows added.
+    """
+    existing = set(db.query(RoomMember.room_name, RoomMember.user_id))
+    user_ids = {uid for (uid,) in db.query(User.id)}
+    wanted = set()
+
+    for (name,) in db.query(Room.name):
+        pair = private_participants(name)
+        if pair:
+            wanted.update((name, uid) for uid in pair if uid in user_ids)
+
+    accepted = (
+        db.query(RoomInvite.room_name, RoomInvite.to_user_id)
+        .join(Room, Room.name == RoomInvite.room_name)
+        .filter(RoomInvite.status == "accepted")
+    )
+    for name, uid in accepted:
+        if not name.startswith("private_"):
+            wanted.add((name, uid))
+
+    new = wanted - existing
+    db.add_all(RoomMember(room_name=name, user_id=uid) for name, uid in new)
+    db.commit()
+    return len(new)
@@ -0,0 +1,216 @@
+"""
+Prometheus metrics for the backend, served on `/metrics`.
+
+Everything lives in its own `REGISTRY`. Request, event, query and ES-call
+timings are histograms observed inline; connection and room gauges are
+computed from the live objects only when scraped.
+"""
+import os
+import time
+import asyncio
+import functools
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, ProcessCollector, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+METRICS_TOP_ROOMS = int(os.getenv("METRICS_TOP_ROOMS", "20"))
+
+# 0.5ms .. 10s: SQLite queries sit at the low end, slow ES searches at the top
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "REST request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests", "REST requests by route template and status",
+    ["method", "route", "status"], registry=REGISTRY,
+)
+SIO_SECONDS = Histogram(
+    "socketio_event_duration_seconds", "Socket.IO handler latency by event",
+    ["event"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+SIO_ERRORS = Counter(
+    "socketio_event_errors", "Socket.IO handlers that raised", ["event"], registry=REGISTRY,
+)
+DB_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement latency by engine and statement kind",
+    ["engine", "op"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+ES_SECONDS = Histogram(
+    "es_request_duration_seconds", "HTTP calls to the ES wrapper by path",
+    ["path"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+ES_RESPONSES = Counter(
+    "es_responses", "ES wrapper responses by path and status", ["path", "status"], registry=REGISTRY,
+)
+RATE_LIMITED = Counter(
+    "rate_limited", "Socket events and requests refused by a rate limit", ["event", "scope"], registry=REGISTRY,
+)
+OUTBOUND_DROPPED = Counter(
+    "socketio_outbound_dropped", "Frames not queued for a slow consumer, by event", ["event"], registry=REGISTRY,
+)
+SLOW_CONSUMERS = Counter(
+    "socketio_slow_consumers", "Slow consumers asked to resync or disconnected", ["action"], registry=REGISTRY,
+)
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+# --- REST ---
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task overhead). Requests are
+    labelled with the matched route's template, so `/rooms/{room_name}/leave`
+    is one series however many rooms there are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            HTTP_SECONDS.labels(method, path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, path, str(status)).inc()
+
+
+# --- Socket.IO ---
+def _timed_handler(name: str, handler):
+    histogram, errors = SIO_SECONDS.labels(name), SIO_ERRORS.labels(name)
+
+    if asyncio.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def timed(*args):
+            started = time.perf_counter()
+            try:
+                return await handler(*args)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+    else:
+        @functools.wraps(handler)
+        def timed(*args):
+            started = time.perf_counter()
+            try:
+                return handler(*args)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+    timed.metrics_timed = True
+    return timed
+
+
+def instrument_socketio(sio, namespace: str = "/"):
+    """Wrap every handler registered so far on `namespace` with a timer."""
+    handlers = sio.handlers.get(namespace, {})
+    for name, handler in list(handlers.items()):
+        if not getattr(handler, "metrics_timed", False):
+            handlers[name] = _timed_handler(name, handler)
+
+
+# --- SQLAlchemy ---
+_OPS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement on `engine` (for an AsyncEngine pass `.sync_engine`)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        op = statement.lstrip()[:6].upper()
+        DB_SECONDS.labels(name, op if op in _OPS else "OTHER").observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        # after_cursor_execute never fires for a failed statement
+        stack = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+# --- httpx calls to the ES wrapper ---
+async def _es_request(request):
+    request.extensions["metrics_started"] = time.perf_counter()
+
+
+async def _es_response(response):
+    started = response.request.extensions.get("metrics_started")
+    path = response.request.url.path
+    if started is not None:
+        ES_SECONDS.labels(path).observe(time.perf_counter() - started)
+    ES_RESPONSES.labels(path, str(response.status_code)).inc()
+
+
+def es_event_hooks() -> dict:
+    """`event_hooks` for an httpx.AsyncClient talking to ES_SERVICE_URL."""
+    return {"request": [_es_request], "response": [_es_response]}
+
+
+# --- gauges read at scrape time ---
+class ChatStateCollector:
+    """Connected sids, rooms with members, the member count of the largest rooms and outbound queue depth."""
+
+    def __init__(self, sio, presence, top: int = METRICS_TOP_ROOMS, namespace: str = "/"):
+        self.sio = sio
+        self.presence = presence
+        self.top = top
+        self.namespace = namespace
+
+    def collect(self):
+        # the namespace's `None` room holds every connected sid
+        sids = self.sio.manager.rooms.get(self.namespace, {}).get(None, ())
+        yield GaugeMetricFamily("chat_connected_sids", "Socket.IO connections on this process", value=len(sids))
+
+        sizes = self.presence.room_sizes()
+        yield GaugeMetricFamily("chat_rooms", "Rooms with at least one member here", value=len(sizes))
+        yield GaugeMetricFamily("chat_room_memberships", "Users in rooms on this process, summed over rooms",
+                                value=sum(sizes.values()))
+        largest = GaugeMetricFamily("chat_room_users", f"Members of the {self.top} largest rooms", labels=["room"])
+        for room, members in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True)[:self.top]:
+            largest.add_metric([room], members)
+        yield largest
+
+        # frames waiting for the transport, per connection (see backpressure.py)
+        depths = [sock.queue.qsize() for sock in list(self.sio.eio.sockets.values())]
+        yield GaugeMetricFamily("chat_outbound_queued_frames", "Frames queued for all connections here",
+                                value=sum(depths))
+        yield GaugeMetricFamily("chat_outbound_queue_max", "Frames queued for the most backed-up connection",
+                                value=max(depths, default=0))
+
+
+def register_chat_state(sio, presence):
+    REGISTRY.register(ChatStateCollector(sio, presence))
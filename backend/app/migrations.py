@@ -0,0 +1,39 @@
+import sys
+from sqlalchemy import inspect
+
+from .database import Base, SessionLocal, engine as default_engine
+from .membership import backfill_room_members
+
+
+def ensure_indexes(engine):
+    """
+    `create_all` only builds indexes together with a new table.
+    Add any index declared on the models that an existing table is missing.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present:
+                index.create(bind=engine, checkfirst=True)
+
+
+def upgrade(engine, session_factory=SessionLocal):
+    had_members = inspect(engine).has_table("room_members")
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    if not had_members:
+        # first start with the membership table: derive it from invites / private rooms
+        with session_factory() as db:
+            backfill_room_members(db)
+
+
+if __name__ == "__main__":
+    # python -m app.migrations [backfill-room-members]
+    upgrade(default_engine)
+    if sys.argv[1:] == ["backfill-room-members"]:
+        with SessionLocal() as db:
+            print(f"added {backfill_room_members(db)} room_members rows")
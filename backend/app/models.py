@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Index
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -23,6 +23,15 @@ class Message(Base):
     content   = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    # history paging walks (timestamp, id) within a room, newest first
+    __table_args__ = (Index("ix_messages_room_timestamp_id", "room", "timestamp", "id"),)
+
+class IdBlock(Base):
+    """Next free id per sequence name; ids are reserved in blocks (see persistence.py)."""
+    __tablename__ = "id_blocks"
+    name       = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)
+
 class Friend(Base):
     __tablename__ = "friends"
     id        = Column(Integer, primary_key=True, index=True)
@@ -57,4 +66,16 @@ class RoomInvite(Base):
     status       = Column(String, default="pending", nullable=False)
 
     from_user = relationship("User", foreign_keys=[from_user_id])
-    to_user   = relationship("User", foreign_keys=[to_user_id])
\ No newline at end of file
+    to_user   = relationship("User", foreign_keys=[to_user_id])
+
+class RoomMember(Base):
+    """Who can see a room: accepted invitees of group rooms, both participants of private rooms."""
+    __tablename__ = "room_members"
+    id        = Column(Integer, primary_key=True, index=True)
+    room_name = Column(String, nullable=False)
+    user_id   = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("room_name", "user_id", name="uq_room_member"),
+        Index("ix_room_members_user_room", "user_id", "room_name"),
+    )
@@ -0,0 +1,36 @@
+import json
+import base64
+from datetime import datetime
+
+
+def encode_cursor(timestamp: datetime, message_id: int) -> str:
+    """Opaque keyset cursor: the (timestamp, id) of the last message a page ended on."""
+    raw = json.dumps([timestamp.isoformat(), message_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of `encode_cursor`. Raises ValueError on anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, message_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(ts), int(message_id)
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+
+
+def encode_offset(offset: int) -> str:
+    """Cursor for orderings with no usable keyset (e.g. relevance): just the row offset."""
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode().rstrip("=")
+
+
+def decode_offset(cursor: str) -> int:
+    """Inverse of `encode_offset`. Raises ValueError on anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = int(json.loads(base64.urlsafe_b64decode(padded.encode()))["o"])
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+    if offset < 0:
+        raise ValueError("invalid cursor")
+    return offset
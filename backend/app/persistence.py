@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from sqlalchemy import insert, select, update, func
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+
+from .models import Message, IdBlock
+
+logger = logging.getLogger(__name__)
+# rows the database refused: one JSON line each, to be replayed by hand
+dead_letters = logging.getLogger(__name__ + ".dead_letter")
+
+MESSAGE_BATCH_SIZE      = int(os.getenv("MESSAGE_BATCH_SIZE", "200"))
+MESSAGE_BATCH_LINGER_MS = float(os.getenv("MESSAGE_BATCH_LINGER_MS", "20"))
+MESSAGE_QUEUE_MAXSIZE   = int(os.getenv("MESSAGE_QUEUE_MAXSIZE", "10000"))
+MESSAGE_ID_BLOCK_SIZE   = int(os.getenv("MESSAGE_ID_BLOCK_SIZE", "100"))
+
+_STOP = object()
+
+
+def _transient(exc: Exception) -> bool:
+    """Whether a failed write may succeed if simply retried (lost connection, locked database)."""
+    if isinstance(exc, OperationalError):
+        return True
+    if isinstance(exc, DBAPIError):
+        return exc.connection_invalidated
+    return isinstance(exc, (OSError, asyncio.TimeoutError))
+
+
+class MessageIdAllocator:
+    """
+    Hands out message ids before the row exists (hi/lo style).
+    A block of ids is reserved in `id_blocks` with one short transaction,
+    so several processes can allocate without colliding.
+    `session_factory` must produce `AsyncSession`s.
+    """
+
+    def __init__(self, session_factory, block_size: int = MESSAGE_ID_BLOCK_SIZE, name: str = "messages"):
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self.name = name
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                self._next = await self._reserve_block()
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    async def _reserve_block(self) -> int:
+        # a single UPDATE ... RETURNING is atomic, so workers racing for
+        # blocks on the same row each get a distinct range
+        bump = (
+            update(IdBlock)
+            .where(IdBlock.name == self.name)
+            .values(next_value=IdBlock.next_value + self.block_size)
+            .returning(IdBlock.next_value)
+        )
+        for _ in range(3):
+            async with self.session_factory() as db:
+                try:
+                    end = (await db.execute(bump)).scalar()
+                    if end is None:
+                        # first use: continue after whatever is already stored
+                        start = (await db.scalar(select(func.max(Message.id))) or 0) + 1
+                        db.add(IdBlock(name=self.name, next_value=start + self.block_size))
+                        await db.commit()
+                        return start
+                    await db.commit()
+                    return end - self.block_size
+                except IntegrityError:
+                    # another process created the row first; retry against it
+                    await db.rollback()
+        raise RuntimeError(f"could not reserve an id block for {self.name!r}")
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for chat messages.
+
+    `submit` only enqueues; a background task drains the queue in batches of
+    up to `batch_size` rows (or whatever arrived within `linger_ms`) and writes
+    each batch with one multi-row INSERT and a single COMMIT.
+    `on_persisted(batch)` is awaited with the rows of every batch that was stored.
+
+    Transient errors are retried until the write goes through. A batch the
+    database refuses outright is split in halves until the offending rows
+    are found; those go to the `dead_letter` log and the rest is stored.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        batch_size: int = MESSAGE_BATCH_SIZE,
+        linger_ms: float = MESSAGE_BATCH_LINGER_MS,
+        max_queue: int = MESSAGE_QUEUE_MAXSIZE,
+        on_persisted=None,
+        retry_delay: float = 0.5,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000.0
+        self.max_queue = max_queue
+        self.on_persisted = on_persisted
+        self.retry_delay = retry_delay
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+        self.batches = 0
+        self.persisted = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, row: dict, sid: str | None = None):
+        """
+        Queue one message row (`id`, `room`, `username`, `content`, `timestamp`).
+        Blocks only when the queue is full. If the writer is not running the
+        row is written immediately so nothing is lost around startup/shutdown.
+        """
+        if not self.running:
+            await self._flush([(row, sid)])
+            return
+        await self._queue.put((row, sid))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        stored = await self._write_batch(batch)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.batches += 1
+        self.persisted += len(stored)
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._total_flush_ms += elapsed
+
+        if self.on_persisted and stored:
+            try:
+                await self.on_persisted(stored)
+            except Exception:
+                logger.exception("on_persisted callback failed")
+
+    async def _write_batch(self, batch) -> list:
+        """Write `batch`; returns the items that were stored."""
+        rows = [row for row, _ in batch]
+        while True:
+            try:
+                await self._write_rows(rows)
+                return batch
+            except Exception as exc:
+                self.failures += 1
+                if not _transient(exc):
+                    error = exc
+                    break
+                # keep the batch and retry: dropping it would lose messages
+                # that were already delivered to the room
+                logger.exception("failed to persist %d messages, retrying", len(rows))
+                await asyncio.sleep(self.retry_delay)
+
+        if len(batch) == 1:
+            self.dead_lettered += 1
+            logger.error("message %s refused by the database: %s", rows[0].get("id"), error)
+            dead_letters.error(json.dumps(rows[0], default=str))
+            return []
+        logger.warning("batch of %d messages refused (%s), splitting it", len(rows), type(error).__name__)
+        half = len(batch) // 2
+        return await self._write_batch(batch[:half]) + await self._write_batch(batch[half:])
+
+    async def _write_rows(self, rows):
+        async with self.session_factory() as db:
+            await db.execute(insert(Message), rows)
+            await db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth":       self.queue_depth(),
+            "batches":           self.batches,
+            "persisted":         self.persisted,
+            "failures":          self.failures,
+            "dead_lettered":     self.dead_lettered,
+            "last_flush_ms":     round(self.last_flush_ms, 3),
+            "max_flush_ms":      round(self.max_flush_ms, 3),
+            "avg_flush_ms":      round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+        }
@@ -0,0 +1,157 @@
+import os
+import sys
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_FLUSH_MS = float(os.getenv("PRESENCE_FLUSH_MS", "250"))
+
+
+class PresenceTracker:
+    """
+    Who is online in which room, refcounted per connection.
+
+    Locally every sid is tracked per room, so a user's second tab leaving
+    doesn't mark them offline. The shared `store` (see bus.py) is touched only
+    when a user's first/last local connection enters/leaves a room, and a
+    `presence_delta` is emitted only when that flips the user's global count
+    between zero and non-zero. Deltas are coalesced per room for `flush_ms`:
+    a join followed by a leave inside the window sends nothing.
+    `emit(event, data, to)` is usually `sio.emit`.
+    """
+
+    def __init__(self, store, emit, flush_ms: float = PRESENCE_FLUSH_MS):
+        self.store = store
+        self.emit = emit
+        self.window = flush_ms / 1000.0
+        # room -> username -> local sids; emptied rooms are dropped
+        self._rooms: dict[str, dict[str, set[str]]] = {}
+        # sid -> room -> username
+        self._sids: dict[str, dict[str, str]] = {}
+        # room -> username -> net change (+1 joined / -1 left) since last flush
+        self._pending: dict[str, dict[str, int]] = {}
+        self._flush_task: asyncio.Task | None = None
+
+        self.deltas_sent = 0
+        self.snapshots = 0
+
+    def rooms_of(self, sid: str) -> list[str]:
+        return list(self._sids.get(sid, ()))
+
+    def in_room(self, sid: str, room: str) -> bool:
+        return room in self._sids.get(sid, ())
+
+    async def join(self, sid: str, room: str, username: str) -> bool:
+        """Count `sid` in `room`; False if it was already counted."""
+        rooms = self._sids.setdefault(sid, {})
+        if room in rooms:
+            return False
+        rooms[room] = username
+        sids = self._rooms.setdefault(room, {}).setdefault(username, set())
+        sids.add(sid)
+        if len(sids) == 1 and await self.store.add(room, username) == 1:
+            self._note(room, username, +1)
+        return True
+
+    async def leave(self, sid: str, room: str):
+        rooms = self._sids.get(sid)
+        username = rooms.pop(room, None) if rooms else None
+        if username is None:
+            return
+        if not rooms:
+            del self._sids[sid]
+
+        users = self._rooms[room]
+        sids = users[username]
+        sids.discard(sid)
+        if sids:
+            return
+        del users[username]
+        if not users:
+            del self._rooms[room]
+        if await self.store.remove(room, username) <= 0:
+            self._note(room, username, -1)
+
+    async def leave_all(self, sid: str):
+        """Drop every room of a disconnected sid."""
+        for room in self.rooms_of(sid):
+            await self.leave(sid, room)
+
+    async def snapshot(self, room: str) -> list[str]:
+        """Full, sorted member list of `room` across all workers."""
+        self.snapshots += 1
+        return sorted(await self.store.members(room))
+
+    # --- coalesced deltas ---
+    def _note(self, room: str, username: str, change: int):
+        changes = self._pending.setdefault(room, {})
+        net = changes.get(username, 0) + change
+        if net:
+            changes[username] = net
+        else:
+            changes.pop(username, None)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for room, changes in pending.items():
+            if not changes:
+                continue
+            delta = {
+                "room":   room,
+                "joined": sorted(u for u, n in changes.items() if n > 0),
+                "left":   sorted(u for u, n in changes.items() if n < 0),
+            }
+            try:
+                await self.emit("presence_delta", delta, to=room)
+                self.deltas_sent += 1
+            except Exception:
+                logger.exception("presence delta for %s failed", room)
+
+    async def stop(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def room_sizes(self) -> dict[str, int]:
+        """Members (distinct users) this process has in each room."""
+        return {room: len(users) for room, users in self._rooms.items()}
+
+    # --- memory accounting ---
+    def room_bytes(self, room: str) -> int:
+        """Approximate bytes this process holds for `room`."""
+        users = self._rooms.get(room)
+        if users is None:
+            return 0
+        size = sys.getsizeof(users) + sys.getsizeof(room)
+        for username, sids in users.items():
+            size += sys.getsizeof(username) + sys.getsizeof(sids)
+            size += sum(sys.getsizeof(s) for s in sids)
+        return size
+
+    def stats(self, top: int = 10) -> dict:
+        per_room = sorted(
+            ({"room": room, "members": len(users), "connections": sum(len(s) for s in users.values()),
+              "bytes": self.room_bytes(room)}
+             for room, users in self._rooms.items()),
+            key=lambda r: r["bytes"], reverse=True,
+        )
+        return {
+            "rooms":         len(self._rooms),
+            "connections":   len(self._sids),
+            "bytes":         sum(r["bytes"] for r in per_room) + sys.getsizeof(self._sids),
+            "pending_rooms": len(self._pending),
+            "deltas_sent":   self.deltas_sent,
+            "snapshots":     self.snapshots,
+            "largest_rooms": per_room[:top],
+        }
@@ -0,0 +1,108 @@
+import os
+import time
+from collections import OrderedDict, defaultdict
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL  = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
+
+class _Entry:
+    __slots__ = ("claims", "user", "expires_at")
+
+    def __init__(self, claims: dict, user, expires_at: float):
+        self.claims = claims
+        self.user = user
+        self.expires_at = expires_at
+
+
+class PrincipalCache:
+    """
+    Token -> (decoded JWT claims, user row) for authenticated requests.
+
+    An entry lives for `ttl` seconds but never past the token's own `exp`,
+    the least recently used entries go first once `max_size` is reached, and
+    `invalidate_user` drops every token of a user whose row changed.
+    Cached users are detached ORM instances: read their columns, don't
+    attach them to a session.
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._tokens_by_user: dict[str, set[str]] = defaultdict(set)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._miss_seconds = 0.0
+        self._resolved = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str):
+        """Cached user for `token`, or None (expired entries count as misses)."""
+        entry = self._entries.get(token)
+        if entry is not None and entry.expires_at > time.time():
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry.user
+        if entry is not None:
+            self._drop(token)
+        self.misses += 1
+        return None
+
+    def put(self, token: str, claims: dict, user, cost: float = 0.0):
+        """Cache a resolved principal. `cost` is how long resolving it took (seconds)."""
+        self._miss_seconds += cost
+        self._resolved += 1
+
+        expires_at = time.time() + self.ttl
+        exp = claims.get("exp")
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= time.time():
+            return
+
+        if token in self._entries:
+            self._drop(token)
+        self._entries[token] = _Entry(claims, user, expires_at)
+        self._tokens_by_user[claims.get("sub")].add(token)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        username = entry.claims.get("sub")
+        tokens = self._tokens_by_user.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[username]
+
+    def invalidate_user(self, username: str):
+        """Forget every cached token of `username` (call after the user row changes)."""
+        for token in list(self._tokens_by_user.get(username, ())):
+            self._drop(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        avg_miss = self._miss_seconds / self._resolved if self._resolved else 0.0
+        return {
+            "entries":       len(self._entries),
+            "hits":          self.hits,
+            "misses":        self.misses,
+            "hit_ratio":     round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions":     self.evictions,
+            "avg_miss_ms":   round(avg_miss * 1000, 3),
+            "time_saved_ms": round(self.hits * avg_miss * 1000, 1),
+        }
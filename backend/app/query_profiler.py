@@ -0,0 +1,228 @@
+"""
+Per-request SQL profiling.
+
+While a request or Socket.IO event is being profiled, every statement run on
+an instrumented engine is recorded (normalized SQL and duration) together
+with the commits. A statement repeated `QUERY_PROFILE_REPEAT` times or more
+within one unit of work is flagged as an N+1 candidate and logged.
+
+Profiling is on for everything with `QUERY_PROFILE=1`; otherwise only for
+HTTP requests carrying `X-Query-Profile: 1`. Profiled responses get
+`X-Query-Count` / `X-Query-Ms` headers, and per-route totals show up under
+`queries` in `/stats`.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+import functools
+import contextlib
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILE        = os.getenv("QUERY_PROFILE", "0") == "1"
+QUERY_PROFILE_REPEAT = int(os.getenv("QUERY_PROFILE_REPEAT", "3"))
+PROFILE_HEADER       = b"x-query-profile"
+
+_IN_LIST  = re.compile(r"\bIN \(\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+|:\w+))*\s*\)", re.I)
+_STRING   = re.compile(r"'(?:[^']|'')*'")
+_NUMBER   = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?\b")
+_SPACE    = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """Collapse literals, IN-lists of any length and whitespace so equal-shaped statements compare equal."""
+    sql = _STRING.sub("?", statement)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class Profile:
+    """Statements and commits of one request or event."""
+
+    __slots__ = ("name", "statements", "commits", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements: list[tuple[str, float]] = []   # (normalized sql, seconds)
+        self.commits = 0
+        self.started = time.perf_counter()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(s for _, s in self.statements) * 1000
+
+    def repeated(self, threshold: int = QUERY_PROFILE_REPEAT) -> dict[str, int]:
+        """Normalized statements run `threshold` times or more: N+1 candidates."""
+        counts = Counter(sql for sql, _ in self.statements)
+        return {sql: n for sql, n in counts.items() if n >= threshold}
+
+    def report(self) -> dict:
+        return {
+            "name":       self.name,
+            "queries":    self.count,
+            "commits":    self.commits,
+            "total_ms":   round(self.total_ms, 3),
+            "repeated":   self.repeated(),
+            "statements": [sql for sql, _ in self.statements],
+        }
+
+
+_current: ContextVar[Profile | None] = ContextVar("query_profile", default=None)
+
+
+class QueryProfiler:
+    """Engine hooks plus per-route totals of everything profiled."""
+
+    def __init__(self, enabled: bool = QUERY_PROFILE, repeat: int = QUERY_PROFILE_REPEAT):
+        self.enabled = enabled
+        self.repeat = repeat
+        self._routes: dict[str, dict] = {}
+        self._listeners: list = []
+
+    # --- engines ---
+    def instrument(self, engine):
+        """Record statements run on `engine` (for an AsyncEngine pass `.sync_engine`)."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _start(conn, cursor, statement, parameters, context, executemany):
+            if _current.get() is not None:
+                conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _stop(conn, cursor, statement, parameters, context, executemany):
+            profile = _current.get()
+            stack = conn.info.get("profile_started")
+            if profile is not None and stack:
+                profile.statements.append((normalize(statement), time.perf_counter() - stack.pop()))
+
+        @event.listens_for(engine, "handle_error")
+        def _failed(context):
+            stack = context.connection.info.get("profile_started") if context.connection is not None else None
+            if stack:
+                stack.pop()
+
+        @event.listens_for(engine, "commit")
+        def _commit(conn):
+            profile = _current.get()
+            if profile is not None:
+                profile.commits += 1
+
+    # --- units of work ---
+    @contextlib.contextmanager
+    def profile(self, name: str):
+        """Profile whatever runs inside the block (on this task/thread's context)."""
+        profile = Profile(name)
+        token = _current.set(profile)
+        try:
+            yield profile
+        finally:
+            _current.reset(token)
+            self.record(profile)
+
+    def record(self, profile: Profile):
+        """A profiled unit of work finished: log N+1 candidates and add it to the route totals."""
+        repeated = profile.repeated(self.repeat)
+        for sql, n in repeated.items():
+            logger.warning("possible N+1 in %s: %d x %s", profile.name, n, sql)
+
+        route = self._routes.setdefault(profile.name, {
+            "calls": 0, "queries": 0, "max_queries": 0, "commits": 0, "total_ms": 0.0, "n_plus_one": {},
+        })
+        route["calls"] += 1
+        route["queries"] += profile.count
+        route["max_queries"] = max(route["max_queries"], profile.count)
+        route["commits"] += profile.commits
+        route["total_ms"] += profile.total_ms
+        for sql, n in repeated.items():
+            route["n_plus_one"][sql] = max(route["n_plus_one"].get(sql, 0), n)
+
+        for listener in self._listeners:
+            listener(profile)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Force profiling on and collect every Profile finished inside the block (for tests)."""
+        captured: list[Profile] = []
+        was_enabled, self.enabled = self.enabled, True
+        self._listeners.append(captured.append)
+        try:
+            yield captured
+        finally:
+            self._listeners.remove(captured.append)
+            self.enabled = was_enabled
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "calls":       r["calls"],
+                "avg_queries": round(r["queries"] / r["calls"], 2),
+                "max_queries": r["max_queries"],
+                "avg_commits": round(r["commits"] / r["calls"], 2),
+                "avg_ms":      round(r["total_ms"] / r["calls"], 3),
+                "n_plus_one":  r["n_plus_one"],
+            }
+            for name, r in sorted(self._routes.items())
+        }
+
+    # --- Socket.IO ---
+    def instrument_socketio(self, sio, namespace: str = "/"):
+        """Profile each handler call on `namespace` while profiling is enabled."""
+        handlers = sio.handlers.get(namespace, {})
+        for name, handler in list(handlers.items()):
+            if asyncio.iscoroutinefunction(handler) and not getattr(handler, "query_profiled", False):
+                handlers[name] = self._profiled_handler(f"sio:{name}", handler)
+
+    def _profiled_handler(self, name: str, handler):
+        @functools.wraps(handler)
+        async def profiled(*args):
+            if not self.enabled:
+                return await handler(*args)
+            with self.profile(name):
+                return await handler(*args)
+        profiled.query_profiled = True
+        return profiled
+
+
+class QueryProfileMiddleware:
+    """Profiles HTTP requests when enabled, or when the request asks for it."""
+
+    def __init__(self, app, profiler: QueryProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            self.profiler.enabled or dict(scope["headers"]).get(PROFILE_HEADER) == b"1"
+        ):
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["path"])
+
+        async def send_with_counts(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-query-count", str(profile.count).encode()),
+                    (b"x-query-ms", f"{profile.total_ms:.3f}".encode()),
+                ]
+            await send(message)
+
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_with_counts)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            profile.name = f"{scope['method']} {getattr(route, 'path', None) or '<unmatched>'}"
+            self.profiler.record(profile)
@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (event, scope) -> (tokens per second, burst). Each can be overridden with
+# RATE_LIMIT_<EVENT>_<SCOPE>="<rate>/<burst>", e.g. RATE_LIMIT_SEND_MESSAGE_SID=2/10;
+# a rate of 0 turns that limit off.
+DEFAULT_LIMITS = {
+    ("send_message",   "sid"):  (5, 20),
+    ("send_message",   "user"): (10, 40),
+    ("typing",         "sid"):  (5, 10),
+    ("typing",         "user"): (10, 20),
+    # a multiplexed client joins every room it has right after connecting
+    ("join_room",      "sid"):  (5, 100),
+    ("join_room",      "user"): (10, 200),
+    ("token",          "ip"):   (2, 20),
+    ("search",         "ip"):   (5, 30),
+    ("friend_request", "user"): (1, 10),
+}
+# full buckets are dropped at most this often
+RATE_LIMIT_SWEEP_S = float(os.getenv("RATE_LIMIT_SWEEP_S", "10"))
+
+
+def _configured(event: str, scope: str, default: tuple[float, float]) -> tuple[float, float]:
+    raw = os.getenv(f"RATE_LIMIT_{event}_{scope}".upper())
+    if not raw:
+        return default
+    try:
+        rate, _, burst = raw.partition("/")
+        return float(rate), float(burst or rate)
+    except ValueError:
+        logger.warning("ignoring malformed RATE_LIMIT_%s_%s=%r", event.upper(), scope.upper(), raw)
+        return default
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key (a sid, user id or IP): `burst` tokens, refilled
+    at `rate` per second. A bucket that has refilled completely is the same
+    as a new one, so `sweep()` drops those and memory stays proportional to
+    the keys that were active within the last `burst / rate` seconds.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._buckets: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _refilled(self, key, now: float) -> _Bucket | None:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def wait(self, key, now: float) -> float:
+        """Seconds until `key` has a token (0 when it has one now). Takes nothing."""
+        bucket = self._refilled(key, now)
+        if bucket is None or bucket.tokens >= 1:
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    def take(self, key, now: float):
+        bucket = self._refilled(key, now)
+        if bucket is None:
+            self._buckets[key] = _Bucket(self.burst - 1, now)
+        else:
+            bucket.tokens -= 1
+
+    def forget(self, key):
+        self._buckets.pop(key, None)
+
+    def sweep(self, now: float):
+        for key in [k for k, b in self._buckets.items() if b.tokens + (now - b.updated) * self.rate >= self.burst]:
+            del self._buckets[key]
+
+
+class RateLimits:
+    """
+    The configured limiters, by event and scope.
+
+    `check(event, sid=..., user=..., ip=...)` spends a token in every limiter
+    of `event` that the call gives a key for, or none at all when any of them
+    is empty; it returns 0 when allowed, otherwise the seconds to wait.
+    `on_limited(event, scope)` is called for each refusal (metrics).
+    """
+
+    def __init__(self, limits: dict | None = None, on_limited=None, sweep_s: float = RATE_LIMIT_SWEEP_S):
+        self.on_limited = on_limited
+        self.sweep_s = sweep_s
+        self._limiters: dict[str, dict[str, TokenBucketLimiter]] = {}
+        self._last_sweep = time.monotonic()
+        self.allowed = 0
+        self.limited: dict[tuple[str, str], int] = {}
+        for (event, scope), default in (DEFAULT_LIMITS if limits is None else limits).items():
+            self.set(event, scope, *_configured(event, scope, default))
+
+    def set(self, event: str, scope: str, rate: float, burst: float | None = None):
+        """(Re)configure one limit; a rate of 0 removes it."""
+        scopes = self._limiters.setdefault(event, {})
+        if rate <= 0:
+            scopes.pop(scope, None)
+        else:
+            scopes[scope] = TokenBucketLimiter(rate, burst if burst is not None else rate)
+
+    def check(self, event: str, **keys) -> float:
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_s:
+            self.sweep(now)
+
+        applied = [(scope, limiter, keys[scope]) for scope, limiter in self._limiters.get(event, {}).items()
+                   if keys.get(scope) is not None]
+        waits = [(scope, limiter.wait(key, now)) for scope, limiter, key in applied]
+        longest = max((w for _, w in waits), default=0.0)
+        if longest > 0:
+            for scope, w in waits:
+                if w > 0:
+                    self.limited[(event, scope)] = self.limited.get((event, scope), 0) + 1
+                    if self.on_limited is not None:
+                        self.on_limited(event, scope)
+            return longest
+
+        for _, limiter, key in applied:
+            limiter.take(key, now)
+        self.allowed += 1
+        return 0.0
+
+    def forget_sid(self, sid: str):
+        """A connection closed: its per-sid buckets go now rather than at the next sweep."""
+        for scopes in self._limiters.values():
+            limiter = scopes.get("sid")
+            if limiter is not None:
+                limiter.forget(sid)
+
+    def sweep(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        for scopes in self._limiters.values():
+            for limiter in scopes.values():
+                limiter.sweep(now)
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "limited": {f"{event}:{scope}": n for (event, scope), n in sorted(self.limited.items())},
+            "buckets": {
+                f"{event}:{scope}": len(limiter)
+                for event, scopes in sorted(self._limiters.items())
+                for scope, limiter in sorted(scopes.items())
+            },
+        }
@@ -0,0 +1,286 @@
+"""
+Rebuild or top up the search index from the `messages` table.
+
+    python -m app.reindex run [--batch-size 1000] [--concurrency 4] [--reset]
+    python -m app.reindex verify [--room NAME ...] [--fix] [--batch-size 1000]
+
+`run` streams messages in id order (server-side cursor) and ships them to the
+ES wrapper's `/index/bulk`, several batches in flight at once. The highest id
+below which everything is indexed is checkpointed to a file after every
+batch, so an interrupted run picks up where it stopped.
+
+`verify` compares the ids stored for each room with the ids the wrapper has
+indexed (`/ids`) and reports what is missing or extra; `--fix` indexes the
+missing ones.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import httpx
+from sqlalchemy import select
+
+from .models import Message
+from .indexer import ES_SERVICE_URL
+
+logger = logging.getLogger(__name__)
+
+REINDEX_BATCH_SIZE  = int(os.getenv("REINDEX_BATCH_SIZE", "1000"))
+REINDEX_CONCURRENCY = int(os.getenv("REINDEX_CONCURRENCY", "4"))
+REINDEX_CHECKPOINT  = os.getenv("REINDEX_CHECKPOINT", "./reindex-checkpoint.json")
+REINDEX_RETRIES     = 3
+
+
+def _item(m: Message) -> dict:
+    # same shape send_message hands to the live indexer
+    return {
+        "chat_id": m.room,
+        "message": {
+            "id":        m.id,
+            "text":      m.content,
+            "timestamp": m.timestamp.isoformat(),
+            "username":  m.username,
+        },
+    }
+
+
+class Checkpoint:
+    """`{"last_id": n, "failed": [...]}` in a small JSON file, replaced atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"last_id": 0, "failed": []}
+
+    def save(self, state: dict):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def reset(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def send_batch(client: httpx.AsyncClient, items: list[dict]) -> list:
+    """POST to /index/bulk, retrying what failed; returns ids still rejected at the end."""
+    delay = 0.5
+    for attempt in range(REINDEX_RETRIES):
+        try:
+            resp = await client.post("/index/bulk", json={"items": items})
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            if attempt == REINDEX_RETRIES - 1:
+                raise
+            logger.warning("bulk request failed (%s), retrying in %.1fs", e, delay)
+        else:
+            rejected = {str(i) for i in resp.json().get("failed", [])}
+            items = [item for item in items if str(item["message"]["id"]) in rejected]
+            if not items:
+                return []
+        await asyncio.sleep(delay)
+        delay *= 2
+    return [item["message"]["id"] for item in items]
+
+
+class _Progress:
+    def __init__(self, out, every: float):
+        self.out = out
+        self.every = every
+        self.started = self._last = time.perf_counter()
+        self.rows = 0
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def tick(self, rows: int, last_id: int):
+        self.rows += rows
+        now = time.perf_counter()
+        if self.out is not None and now - self._last >= self.every:
+            self._last = now
+            print(f"indexed {self.rows} messages ({self.rate():.0f}/s), checkpoint id {last_id}", file=self.out)
+
+
+async def reindex(
+    session_factory,
+    client: httpx.AsyncClient,
+    checkpoint: Checkpoint,
+    batch_size: int = REINDEX_BATCH_SIZE,
+    concurrency: int = REINDEX_CONCURRENCY,
+    start_after: int | None = None,
+    progress_out=sys.stderr,
+    progress_every: float = 2.0,
+) -> dict:
+    """
+    Index every message with an id above the checkpoint (or `start_after`).
+    Batches complete out of order; the checkpoint only moves past a batch
+    once every batch before it has finished too.
+    """
+    state = checkpoint.load()
+    if start_after is not None:
+        state["last_id"] = start_after
+    progress = _Progress(progress_out, progress_every)
+    pending: list[tuple[int, int, asyncio.Task]] = []   # (last id, rows, task), in id order
+
+    def settle(wait_all: bool = False):
+        while pending and (wait_all or pending[0][2].done()):
+            last_id, rows, task = pending[0]
+            if not task.done():
+                return
+            failed = task.result()  # re-raises a batch that gave up
+            pending.pop(0)
+            state["last_id"] = last_id
+            state["failed"] = state.get("failed", []) + failed
+            checkpoint.save(state)
+            progress.tick(rows, last_id)
+
+    try:
+        async with session_factory() as db:
+            stmt = (
+                select(Message)
+                .where(Message.id > state["last_id"])
+                .order_by(Message.id)
+                .execution_options(yield_per=batch_size)
+            )
+            result = await db.stream(stmt)
+            try:
+                async for rows in result.scalars().partitions(batch_size):
+                    while len([p for p in pending if not p[2].done()]) >= concurrency:
+                        await asyncio.wait([p[2] for p in pending if not p[2].done()], return_when=asyncio.FIRST_COMPLETED)
+                    settle()
+                    task = asyncio.create_task(send_batch(client, [_item(m) for m in rows]))
+                    pending.append((rows[-1].id, len(rows), task))
+            finally:
+                # a server-side cursor left open would hold its read lock / snapshot
+                await result.close()
+        if pending:
+            await asyncio.wait([p[2] for p in pending])
+        settle(wait_all=True)
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+
+    return {
+        "indexed":    progress.rows,
+        "last_id":    state["last_id"],
+        "failed":     state.get("failed", []),
+        "seconds":    round(time.perf_counter() - progress.started, 3),
+        "per_second": round(progress.rate(), 1),
+    }
+
+
+async def indexed_ids(client: httpx.AsyncClient, chat_id: str) -> set[int]:
+    ids, after = set(), None
+    while True:
+        params = {"chat_id": chat_id}
+        if after is not None:
+            params["after"] = after
+        resp = await client.get("/ids", params=params)
+        resp.raise_for_status()
+        page = resp.json()
+        ids.update(int(i) for i in page["ids"])
+        after = page.get("next")
+        if after is None:
+            return ids
+
+
+async def verify(
+    session_factory,
+    client: httpx.AsyncClient,
+    rooms: list[str] | None = None,
+    fix: bool = False,
+    batch_size: int = REINDEX_BATCH_SIZE,
+    sample: int = 10,
+) -> dict:
+    """Per-room diff of stored vs indexed message ids; `fix` indexes what's missing."""
+    async with session_factory() as db:
+        if not rooms:
+            rooms = list(await db.scalars(select(Message.room).distinct().order_by(Message.room)))
+
+        report = {}
+        for room in rooms:
+            stored = set(await db.scalars(select(Message.id).where(Message.room == room)))
+            indexed = await indexed_ids(client, room)
+            missing = sorted(stored - indexed)
+            extra = sorted(indexed - stored)
+            entry = {
+                "stored":         len(stored),
+                "indexed":        len(indexed),
+                "missing":        len(missing),
+                "extra":          len(extra),
+                "sample_missing": missing[:sample],
+                "sample_extra":   extra[:sample],
+            }
+            if fix and missing:
+                failed = []
+                for i in range(0, len(missing), batch_size):
+                    chunk = missing[i:i + batch_size]
+                    rows = await db.scalars(select(Message).where(Message.id.in_(chunk)).order_by(Message.id))
+                    failed += await send_batch(client, [_item(m) for m in rows])
+                entry["fixed"] = len(missing) - len(failed)
+            report[room] = entry
+
+    return {
+        "rooms":   report,
+        "missing": sum(r["missing"] for r in report.values()),
+        "extra":   sum(r["extra"] for r in report.values()),
+    }
+
+
+async def _main(args) -> dict:
+    from .database import AsyncSessionLocal, async_engine
+
+    try:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60.0) as client:
+            if args.command == "run":
+                checkpoint = Checkpoint(args.checkpoint)
+                if args.reset:
+                    checkpoint.reset()
+                return await reindex(
+                    AsyncSessionLocal, client, checkpoint,
+                    batch_size=args.batch_size, concurrency=args.concurrency, start_after=args.from_id,
+                )
+            return await verify(AsyncSessionLocal, client, rooms=args.room, fix=args.fix, batch_size=args.batch_size)
+    finally:
+        await async_engine.dispose()
+
+
+def main(argv=None):
+    # accepted after either subcommand, as the usage above shows
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--url", default=ES_SERVICE_URL, help="ES wrapper base URL")
+    common.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+
+    parser = argparse.ArgumentParser(prog="python -m app.reindex", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", parents=[common], help="stream messages into the index")
+    run.add_argument("--concurrency", type=int, default=REINDEX_CONCURRENCY, help="batches in flight")
+    run.add_argument("--checkpoint", default=REINDEX_CHECKPOINT)
+    run.add_argument("--reset", action="store_true", help="ignore the checkpoint and start from the first message")
+    run.add_argument("--from-id", type=int, default=None, help="start after this message id")
+
+    check = sub.add_parser("verify", parents=[common], help="diff stored vs indexed ids per room")
+    check.add_argument("--room", action="append", help="only these rooms (repeatable)")
+    check.add_argument("--fix", action="store_true", help="index the missing messages")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(_main(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import asyncio
+from datetime import datetime
+
+from .history_cache import RecentMessageCache
+from .schemas import MessageRead
+
+# more missed messages than this and the client is told to reload instead
+RESUME_MAX_MESSAGES = int(os.getenv("RESUME_MAX_MESSAGES", "100"))
+
+
+def as_event(msg: MessageRead) -> dict:
+    """A stored message in the shape `receive_message` delivers it."""
+    return {
+        "id":        msg.id,
+        "room":      msg.room,
+        "sender":    msg.username,
+        "text":      msg.content,
+        "timestamp": msg.timestamp.isoformat(),
+    }
+
+
+def from_event(data: dict) -> MessageRead:
+    """The inverse of `as_event`."""
+    return MessageRead(
+        id=data["id"],
+        room=data["room"],
+        username=data["sender"],
+        content=data["text"],
+        timestamp=datetime.fromisoformat(data["timestamp"]),
+    )
+
+
+def _after(newest: list[MessageRead], last_id: int) -> list[MessageRead] | None:
+    """Messages newer than `last_id` in a newest-first page, oldest first; None if it isn't there."""
+    for i, msg in enumerate(newest):
+        if msg.id == last_id:
+            return newest[:i][::-1]
+    return None
+
+
+class ResumeSync:
+    """
+    Delta sync for reconnecting clients.
+
+    A client that reports the last message id it saw in a room gets only the
+    messages after it. They come from the recent-message cache when the id is
+    still buffered; otherwise the room's newest `max_messages + 1` messages
+    are loaded with `load_recent(room, limit)` (newest first), which also
+    primes the cache. Concurrent resumes of one room share that load, so a
+    mass reconnect costs one query per room rather than one per client; it
+    runs in its own task, so a client that disconnects meanwhile (cancelled)
+    doesn't cancel it for the rest. An id
+    outside that window means more than `max_messages` were missed (or the id
+    is unknown) and `missed()` returns None: the client should reload.
+    """
+
+    def __init__(self, cache: RecentMessageCache, load_recent, max_messages: int = RESUME_MAX_MESSAGES):
+        self.cache = cache
+        self.load_recent = load_recent
+        self.max_messages = max_messages
+        self._inflight: dict[str, asyncio.Task] = {}
+
+        self.requests = 0
+        self.from_cache = 0
+        self.db_loads = 0
+        self.coalesced = 0
+        self.reloads = 0
+        self.messages = 0
+
+    async def missed(self, room: str, last_id: int) -> list[MessageRead] | None:
+        """Messages of `room` after `last_id`, oldest first, or None when a full reload is needed."""
+        self.requests += 1
+        limit = self.max_messages + 1
+        rows = self.cache.since(room, last_id, limit)
+        if rows is not None:
+            self.from_cache += 1
+        else:
+            newest = await self._recent(room, limit)
+            # the cache has messages that are not stored yet; the page is the fallback
+            rows = self.cache.since(room, last_id, limit)
+            if rows is None:
+                rows = _after(newest, last_id)
+
+        if rows is None or len(rows) > self.max_messages:
+            self.reloads += 1
+            return None
+        self.messages += len(rows)
+        return rows
+
+    async def _recent(self, room: str, limit: int) -> list[MessageRead]:
+        pending = self._inflight.get(room)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.db_loads += 1
+        task = asyncio.get_running_loop().create_task(self._load(room, limit))
+        task.add_done_callback(_retrieve)
+        self._inflight[room] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, room: str, limit: int) -> list[MessageRead]:
+        try:
+            newest = await self.load_recent(room, limit)
+        finally:
+            self._inflight.pop(room, None)
+        self.cache.prime(room, newest, complete=len(newest) < limit)
+        return newest
+
+    def stats(self) -> dict:
+        return {
+            "requests":   self.requests,
+            "from_cache": self.from_cache,
+            "db_loads":   self.db_loads,
+            "coalesced":  self.coalesced,
+            "reloads":    self.reloads,
+            "messages":   self.messages,
+        }
+
+
+def _retrieve(task: asyncio.Task):
+    # a load whose clients all went away still finishes; don't log its error as unretrieved
+    if not task.cancelled():
+        task.exception()
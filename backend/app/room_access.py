@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import logging
+
+from .membership import private_participants
+
+logger = logging.getLogger(__name__)
+
+# how long a loaded membership set is trusted before it is re-read in the
+# background (picks up changes made through another backend process)
+ROOM_ACCESS_TTL = float(os.getenv("ROOM_ACCESS_TTL", "60"))
+
+
+class _Access:
+    __slots__ = ("rooms", "sids", "loaded_at", "refreshing", "changes")
+
+    def __init__(self, rooms: set[str]):
+        self.rooms = rooms
+        self.sids: set[str] = set()
+        self.loaded_at = time.monotonic()
+        self.refreshing = False
+        self.changes = 0     # grants/revokes/invalidations applied so far
+
+
+class RoomAccess:
+    """
+    Which rooms the connected users may use, checked on every socket event
+    without touching the database.
+
+    A `private_{a}_{b}` room is open to users a and b, decided from the name.
+    Any other room needs a `room_members` row; a user's rows are read with
+    `load_rooms(user_id)` when their first connection attaches and kept until
+    their last one detaches. The REST endpoints that change memberships call
+    `grant` / `revoke` / `invalidate` so this process is current at once;
+    sets older than `ttl` are re-read in the background, never on the event
+    that noticed it. Not thread-safe: every call, including those from the
+    sync endpoints, has to run on the event loop.
+    """
+
+    def __init__(self, load_rooms, ttl: float = ROOM_ACCESS_TTL):
+        self.load_rooms = load_rooms
+        self.ttl = ttl
+        self._users: dict[int, _Access] = {}
+        self._user_of: dict[str, int] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        self.checks = 0
+        self.denied = 0
+        self.loads = 0
+        self.refreshes = 0
+
+    async def attach(self, sid: str, user_id: int):
+        """A connection of `user_id` was accepted; load the user's rooms unless another one already did."""
+        access = self._users.get(user_id)
+        if access is None:
+            self.loads += 1
+            rooms = await self.load_rooms(user_id)
+            # another connection of the same user may have loaded meanwhile
+            access = self._users.setdefault(user_id, _Access(rooms))
+        access.sids.add(sid)
+        self._user_of[sid] = user_id
+
+    def detach(self, sid: str):
+        user_id = self._user_of.pop(sid, None)
+        access = self._users.get(user_id)
+        if access is None:
+            return
+        access.sids.discard(sid)
+        if not access.sids:
+            del self._users[user_id]
+
+    def allowed(self, user_id: int, room) -> bool:
+        self.checks += 1
+        if not isinstance(room, str):
+            ok = False
+        elif (pair := private_participants(room)) is not None:
+            ok = user_id in pair
+        else:
+            access = self._users.get(user_id)
+            ok = access is not None and room in access.rooms
+            if access is not None and time.monotonic() - access.loaded_at > self.ttl:
+                self._refresh(user_id, access)
+        if not ok:
+            self.denied += 1
+        return ok
+
+    # --- membership changes (called from the REST handlers) ---
+    def grant(self, user_id: int, room: str):
+        access = self._users.get(user_id)
+        if access is not None:
+            access.rooms.add(room)
+            access.changes += 1
+
+    def revoke(self, user_id: int, room: str) -> list[str]:
+        """Drop `room` from the user's set; returns their connections here, to be taken out of it."""
+        access = self._users.get(user_id)
+        if access is None:
+            return []
+        access.rooms.discard(room)
+        access.changes += 1
+        return list(access.sids)
+
+    def invalidate(self, user_id: int):
+        """Re-read the user's rooms on the next check."""
+        access = self._users.get(user_id)
+        if access is not None:
+            access.loaded_at = float("-inf")
+            access.changes += 1
+
+    def _refresh(self, user_id: int, access: _Access):
+        if access.refreshing:
+            return
+        access.refreshing = True
+        task = asyncio.get_running_loop().create_task(self._reload(user_id, access))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reload(self, user_id: int, access: _Access):
+        started, changes = time.monotonic(), access.changes
+        try:
+            self.refreshes += 1
+            rooms = await self.load_rooms(user_id)
+        except Exception:
+            logger.exception("reloading the rooms of user %s failed", user_id)
+        else:
+            # a change that landed while loading may not be in the rows read;
+            # keep the patched set and let the next check load again
+            if access.changes == changes:
+                access.rooms = rooms
+                access.loaded_at = started
+        finally:
+            access.refreshing = False
+
+    def stats(self) -> dict:
+        return {
+            "users":     len(self._users),
+            "sids":      len(self._user_of),
+            "checks":    self.checks,
+            "denied":    self.denied,
+            "loads":     self.loads,
+            "refreshes": self.refreshes,
+        }
@@ -48,6 +48,10 @@ class MessageRead(BaseModel):
     class Config:
         orm_mode = True
 
+# A /search hit: a message plus optional highlighted fragments of its content
+class SearchHit(MessageRead):
+    highlight: Optional[List[str]] = None
+
 class FriendCreate(BaseModel):
     username: str
 
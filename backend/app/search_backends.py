@@ -0,0 +1,268 @@
+import os
+import re
+import logging
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import select, text, func, tuple_, literal_column, table, column
+
+from .models import Message
+from .indexer import SearchIndexer, ES_SERVICE_URL
+from .metrics import es_event_hooks
+from .pagination import encode_cursor, decode_cursor, encode_offset, decode_offset
+
+logger = logging.getLogger(__name__)
+
+# "elasticsearch" (the wrapper service) or "sql" (SQLite FTS5 / Postgres tsvector, in-process)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "elasticsearch")
+
+
+def _hit(m: Message, highlight: str | None = None) -> dict:
+    """Same shape the ES wrapper returns."""
+    hit = {
+        "chat_id":   m.room,
+        "id":        m.id,
+        "text":      m.content,
+        "timestamp": m.timestamp.isoformat(),
+        "username":  m.username,
+    }
+    if highlight is not None:
+        hit["highlight"] = [highlight]
+    return hit
+
+
+def _naive_utc(ts: datetime | None) -> datetime | None:
+    # messages.timestamp holds naive UTC
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class SearchBackend:
+    """
+    Where `send_message` sends messages to be indexed and `/search` reads from.
+
+    `search` returns `(hits, next_cursor)`; hits are dicts with chat_id, id,
+    text, timestamp, username and optionally highlight. It raises ValueError
+    for a malformed cursor. `on_indexed(items)` is called once messages
+    become searchable, so cached results can be dropped.
+    """
+
+    def __init__(self, on_indexed=None):
+        self.on_indexed = on_indexed
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def add(self, chat_id: str, message: dict):
+        """A message was sent (it may not be stored yet)."""
+
+    def persisted(self, rows: list[dict]):
+        """Message rows were committed to the database."""
+
+    async def search(self, chat_id: str, q: str, size: int = 20, sort: str = "timestamp",
+                     cursor: str | None = None, highlight: bool = False,
+                     since: datetime | None = None, until: datetime | None = None):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class ElasticsearchBackend(SearchBackend):
+    """Index through `SearchIndexer`, search through the wrapper's `/search`."""
+
+    def __init__(self, base_url: str = ES_SERVICE_URL, on_indexed=None, indexer: SearchIndexer | None = None):
+        super().__init__(on_indexed)
+        self.base_url = base_url
+        self.indexer = indexer or SearchIndexer(base_url, on_indexed=on_indexed, event_hooks=es_event_hooks())
+        # one pooled client for all proxied searches (created lazily, closed on stop)
+        self._client: httpx.AsyncClient | None = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0, event_hooks=es_event_hooks())
+        return self._client
+
+    async def start(self):
+        await self.indexer.start()
+
+    async def stop(self):
+        await self.indexer.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def add(self, chat_id: str, message: dict):
+        self.indexer.add(chat_id, message)
+
+    async def search(self, chat_id, q, size=20, sort="timestamp", cursor=None, highlight=False,
+                     since=None, until=None):
+        params = {"chat_id": chat_id, "q": q, "size": size, "sort": sort}
+        if cursor:
+            params["cursor"] = cursor
+        if highlight:
+            params["highlight"] = "true"
+        # a date range lets the wrapper read only the monthly indices it overlaps
+        if since:
+            params["since"] = since.isoformat()
+        if until:
+            params["until"] = until.isoformat()
+
+        resp = await self._http().get(f"{self.base_url}/search", params=params)
+        if resp.status_code == 400:
+            raise ValueError("invalid cursor")
+        resp.raise_for_status()
+        # [{ "chat_id":..., "id":..., "text":..., "timestamp":..., "username":... }, ...]
+        return resp.json(), resp.headers.get("X-Next-Cursor")
+
+    def stats(self) -> dict:
+        return {"backend": "elasticsearch", **self.indexer.stats()}
+
+
+# --- in-process full-text search on the messages table ---
+_fts = table("messages_fts", column("rowid"))
+
+_SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+_PG_FTS_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_messages_content_fts ON messages USING GIN (to_tsvector('simple', content))",
+]
+
+
+def install_fulltext(engine):
+    """
+    Create the full-text index for `SqlSearchBackend` if it is missing:
+    an external-content FTS5 table kept in sync by triggers on SQLite, an
+    expression GIN index on Postgres.
+    """
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            fresh = conn.scalar(text("SELECT count(*) FROM sqlite_master WHERE name = 'messages_fts'")) == 0
+            for ddl in _SQLITE_FTS_DDL:
+                conn.execute(text(ddl))
+            if fresh:
+                # index whatever was stored before the table existed
+                conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for ddl in _PG_FTS_DDL:
+                conn.execute(text(ddl))
+        else:
+            raise RuntimeError(f"no full-text support for {dialect!r}")
+
+
+def fts5_query(q: str) -> str:
+    """User text -> FTS5 MATCH expression: every word required, the last one as a prefix."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SqlSearchBackend(SearchBackend):
+    """
+    Searches `messages` directly (run `install_fulltext` once). Rows are
+    indexed by the database as they are inserted, so `add` has nothing to do
+    and results show up as soon as the write-behind batch commits.
+    """
+
+    def __init__(self, session_factory, dialect: str, on_indexed=None):
+        super().__init__(on_indexed)
+        self.session_factory = session_factory
+        self.dialect = dialect
+        self.searches = 0
+
+    def persisted(self, rows: list[dict]):
+        if self.on_indexed:
+            self.on_indexed([{"chat_id": r["room"], "message": {"id": r["id"]}} for r in rows])
+
+    def _match(self, q: str, chat_id: str):
+        """(WHERE clauses, rank expression ordered best-first, highlight expression)"""
+        if self.dialect == "sqlite":
+            match = fts5_query(q)
+            if not match:
+                return None
+            where = [
+                text("messages_fts MATCH :match").bindparams(match=match),
+                # left to itself SQLite walks the room index and re-runs MATCH
+                # per row (seconds on a busy room); unlikely() makes it drive
+                # the query from the FTS index and look rows up by id instead
+                func.unlikely(Message.room == chat_id),
+            ]
+            return (
+                where,
+                literal_column("bm25(messages_fts)").asc(),
+                literal_column("highlight(messages_fts, 0, '<em>', '</em>')"),
+            )
+        vector = func.to_tsvector("simple", Message.content)
+        query = func.plainto_tsquery("simple", q)
+        return (
+            [Message.room == chat_id, vector.op("@@")(query)],
+            func.ts_rank(vector, query).desc(),
+            func.ts_headline("simple", Message.content, query, "StartSel=<em>, StopSel=</em>"),
+        )
+
+    async def search(self, chat_id, q, size=20, sort="timestamp", cursor=None, highlight=False,
+                     since=None, until=None):
+        self.searches += 1
+        match = self._match(q, chat_id)
+        if match is None:
+            return [], None
+        where, rank, headline = match
+
+        columns = [Message, headline] if highlight else [Message]
+        stmt = select(*columns).where(*where)
+        if self.dialect == "sqlite":
+            stmt = stmt.join(_fts, _fts.c.rowid == Message.id)
+        if since is not None:
+            stmt = stmt.where(Message.timestamp >= _naive_utc(since))
+        if until is not None:
+            stmt = stmt.where(Message.timestamp <= _naive_utc(until))
+
+        offset = 0
+        if sort == "relevance":
+            offset = decode_offset(cursor) if cursor else 0
+            stmt = stmt.order_by(rank, Message.timestamp.desc(), Message.id.desc()).offset(offset)
+        else:
+            if cursor:
+                ts, last_id = decode_cursor(cursor)
+                stmt = stmt.where(tuple_(Message.timestamp, Message.id) < tuple_(ts, last_id))
+            stmt = stmt.order_by(Message.timestamp.desc(), Message.id.desc())
+        stmt = stmt.limit(size)
+
+        async with self.session_factory() as db:
+            rows = (await db.execute(stmt)).all()
+
+        hits = [_hit(row[0], row[1] if highlight else None) for row in rows]
+        next_cursor = None
+        if len(rows) == size:
+            last = rows[-1][0]
+            next_cursor = encode_offset(offset + size) if sort == "relevance" else encode_cursor(last.timestamp, last.id)
+        return hits, next_cursor
+
+    def stats(self) -> dict:
+        return {"backend": f"sql/{self.dialect}", "searches": self.searches}
+
+
+def make_search_backend(kind: str = SEARCH_BACKEND, *, session_factory=None, engine=None, on_indexed=None):
+    if kind == "elasticsearch":
+        return ElasticsearchBackend(on_indexed=on_indexed)
+    if kind == "sql":
+        install_fulltext(engine)
+        return SqlSearchBackend(session_factory, engine.dialect.name, on_indexed=on_indexed)
+    raise ValueError(f"unsupported SEARCH_BACKEND: {kind!r}")
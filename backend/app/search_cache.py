@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+from collections import Counter, OrderedDict, defaultdict
+
+SEARCH_CACHE_SIZE   = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+SEARCH_CACHE_TTL    = float(os.getenv("SEARCH_CACHE_TTL", "30"))
+# ES makes new documents searchable on its refresh interval (1s by default);
+# results fetched that soon after an invalidation may still miss them
+SEARCH_CACHE_SETTLE = float(os.getenv("SEARCH_CACHE_SETTLE", "1"))
+
+
+def search_key(chat_id: str, q: str, **params) -> tuple:
+    """Cache key: the query is case- and whitespace-normalized, other params kept as given."""
+    return (chat_id, " ".join(q.lower().split()), tuple(sorted(params.items())))
+
+
+class SearchCache:
+    """
+    LRU + TTL cache of search results, with singleflight loading.
+
+    Concurrent lookups of the same key share one `loader()` call instead of
+    each going to ES. The call runs in its own task, so a requester that goes
+    away (cancelled) doesn't take the result away from the others.
+    `invalidate(chat_id)` drops a room's entries when new messages for it
+    were indexed; for `settle` seconds afterwards results for that room are
+    served but not cached, so a search racing the ES refresh can't pin stale
+    hits for a whole TTL.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL,
+                 settle: float = SEARCH_CACHE_SETTLE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.settle = settle
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._keys_by_chat: dict[str, set[tuple]] = defaultdict(set)
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        # only for chats with a load in flight: bumped by invalidate() so that
+        # load's (older) result is not cached
+        self._generation: dict[str, int] = {}
+        self._loading: Counter = Counter()
+        # chat -> end of its settle window, oldest first
+        self._unsettled_until: dict[str, float] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_load(self, key: tuple, loader):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            self._drop(key)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        self.loads += 1
+        task = asyncio.get_running_loop().create_task(self._load(key, loader))
+        task.add_done_callback(_retrieve)
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: tuple, loader):
+        chat_id = key[0]
+        generation = self._generation.setdefault(chat_id, 0)
+        self._loading[chat_id] += 1
+        try:
+            result = await loader()
+        finally:
+            self._inflight.pop(key, None)
+            self._loading[chat_id] -= 1
+            current = self._generation[chat_id]
+            if not self._loading[chat_id]:
+                del self._loading[chat_id], self._generation[chat_id]
+
+        if generation == current and not self._unsettled(chat_id):
+            self._store(key, result)
+        return result
+
+    def _unsettled(self, chat_id: str) -> bool:
+        self._prune_settled()
+        return chat_id in self._unsettled_until
+
+    def _prune_settled(self):
+        # windows all last `settle`, so the dict is ordered by when they end
+        now = time.monotonic()
+        while self._unsettled_until:
+            chat_id, until = next(iter(self._unsettled_until.items()))
+            if until > now:
+                break
+            del self._unsettled_until[chat_id]
+
+    def _store(self, key: tuple, result):
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        self._keys_by_chat[key[0]].add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._keys_by_chat.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_chat[key[0]]
+
+    def invalidate(self, chat_id: str):
+        """Forget every cached search of `chat_id` (new messages were indexed)."""
+        self.invalidations += 1
+        if chat_id in self._generation:
+            self._generation[chat_id] += 1
+        if self.settle > 0:
+            self._prune_settled()
+            self._unsettled_until.pop(chat_id, None)
+            self._unsettled_until[chat_id] = time.monotonic() + self.settle
+        for key in list(self._keys_by_chat.get(chat_id, ())):
+            self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_chat.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries":        len(self._entries),
+            "hits":           self.hits,
+            "misses":         self.misses,
+            "coalesced":      self.coalesced,
+            "hit_ratio":      round(self.hits / lookups, 4) if lookups else 0.0,
+            "es_calls":       self.loads,
+            "es_calls_saved": self.hits + self.coalesced,
+            "invalidations":  self.invalidations,
+        }
+
+
+def _retrieve(task: asyncio.Task):
+    # a load whose requesters all went away still finishes; don't log its error as unretrieved
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,162 @@
+import os
+import time
+import asyncio
+import logging
+
+from .bus import LocalPresenceStore
+
+logger = logging.getLogger(__name__)
+
+TYPING_TICK_MS   = float(os.getenv("TYPING_TICK_MS", "300"))
+TYPING_TIMEOUT_S = float(os.getenv("TYPING_TIMEOUT_S", "5"))
+
+
+class TypingTracker:
+    """
+    Server-side typing state per (room, username).
+
+    Clients may send `typing` on every keystroke: only a user starting or
+    stopping changes the state, repeats just push the expiry back. Every
+    `tick_ms` each room whose set of typers changed gets one `typing_users`
+    frame with the full list. A typer that goes quiet for `timeout_s`, or
+    whose connection drops, is removed as if it had sent `stop_typing`.
+    `emit(event, data, to)` is usually `sio.emit`.
+
+    With several workers, each counts its local typers in the shared `store`
+    (the presence counters of bus.py, under their own prefix) once per tick,
+    and the list it sends is read back from there, so it includes the
+    typers of every worker.
+    """
+
+    def __init__(self, emit, store=None, tick_ms: float = TYPING_TICK_MS, timeout_s: float = TYPING_TIMEOUT_S):
+        self.emit = emit
+        self.store = store if store is not None else LocalPresenceStore()
+        self.tick = tick_ms / 1000.0
+        self.timeout = timeout_s
+        # room -> username -> (sid, expires_at)
+        self._rooms: dict[str, dict[str, tuple[str, float]]] = {}
+        self._by_sid: dict[str, set[tuple[str, str]]] = {}
+        self._dirty: set[str] = set()
+        # (room, username, +1/-1) not yet applied to the store
+        self._changes: list[tuple[str, str, int]] = []
+        self._task: asyncio.Task | None = None
+
+        self.inbound = 0
+        self.suppressed = 0
+        self.expired = 0
+        self.outbound = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        # take this worker's typers out of the shared counts
+        for room in list(self._rooms):
+            for username in list(self._rooms.get(room, ())):
+                self._remove(room, username)
+        await self.flush()
+
+    def typing(self, sid: str, room: str, username: str):
+        self.inbound += 1
+        typers = self._rooms.setdefault(room, {})
+        if username in typers:
+            self.suppressed += 1
+        else:
+            self._dirty.add(room)
+            self._changes.append((room, username, +1))
+        # recorded on repeats too: another tab of the same user may be the one typing now
+        self._by_sid.setdefault(sid, set()).add((room, username))
+        typers[username] = (sid, time.monotonic() + self.timeout)
+
+    def stop_typing(self, sid: str, room: str, username: str):
+        self.inbound += 1
+        if not self._remove(room, username):
+            self.suppressed += 1
+
+    def disconnect(self, sid: str):
+        for room, username in list(self._by_sid.pop(sid, ())):
+            entry = self._rooms.get(room, {}).get(username)
+            if entry is not None and entry[0] == sid:
+                self._remove(room, username)
+
+    def leave(self, sid: str, room: str):
+        """`sid` left `room`: whatever it was typing there is dropped."""
+        for key in [k for k in self._by_sid.get(sid, ()) if k[0] == room]:
+            entry = self._rooms.get(room, {}).get(key[1])
+            if entry is not None and entry[0] == sid:
+                self._remove(*key)
+
+    def _remove(self, room: str, username: str) -> bool:
+        typers = self._rooms.get(room)
+        if not typers or username not in typers:
+            return False
+        sid, _ = typers.pop(username)
+        if not typers:
+            del self._rooms[room]
+        keys = self._by_sid.get(sid)
+        if keys is not None:
+            keys.discard((room, username))
+            if not keys:
+                del self._by_sid[sid]
+        self._dirty.add(room)
+        self._changes.append((room, username, -1))
+        return True
+
+    def users(self, room: str) -> list[str]:
+        return sorted(self._rooms.get(room, ()))
+
+    def _expire(self):
+        now = time.monotonic()
+        for room in list(self._rooms):
+            for username, (_, expires_at) in list(self._rooms[room].items()):
+                if expires_at <= now:
+                    self._remove(room, username)
+                    self.expired += 1
+
+    async def flush(self):
+        self._expire()
+        changes, self._changes = self._changes, []
+        for room, username, delta in changes:
+            try:
+                if delta > 0:
+                    await self.store.add(room, username)
+                else:
+                    await self.store.remove(room, username)
+            except Exception:
+                logger.exception("typing state of %s in %s not shared", username, room)
+        dirty, self._dirty = self._dirty, set()
+        for room in dirty:
+            try:
+                users = sorted(await self.store.members(room))
+                await self.emit("typing_users", {"room": room, "users": users}, to=room)
+                self.outbound += 1
+            except Exception:
+                logger.exception("typing frame for %s failed", room)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "rooms":      len(self._rooms),
+            "typers":     sum(len(t) for t in self._rooms.values()),
+            "inbound":    self.inbound,
+            "suppressed": self.suppressed,
+            "expired":    self.expired,
+            "outbound":   self.outbound,
+            "out_per_in": round(self.outbound / self.inbound, 4) if self.inbound else 0.0,
+        }
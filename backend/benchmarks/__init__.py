@@ -0,0 +1,4 @@
+# backend/benchmarks/__init__.py
+
+# Stand-alone benchmark scripts. Run from backend/, e.g.
+#   python -m benchmarks.bench_emit_latency
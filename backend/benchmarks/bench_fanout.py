@@ -0,0 +1,94 @@
+"""
+Frames/sec and CPU per delivered message for a busy room, single vs batched.
+
+A bare `socketio.AsyncServer` gets `--clients` fake connections in one room;
+their Engine.IO transport is replaced by a counter that still encodes each
+packet, so the numbers cover Socket.IO serialization and per-recipient
+fan-out but not the network. `--rate` messages/second are published through
+`MessageFanout` for `--seconds`:
+
+  single  - every client speaks protocol 1 (one receive_message per message)
+  batched - every client speaks protocol 2 (receive_messages arrays)
+
+    cd backend
+    python -m benchmarks.bench_fanout --clients 2000 --rate 500 --seconds 3
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import socketio
+
+from app.fanout import MessageFanout, protocol_room, PROTOCOL_SINGLE, PROTOCOL_BATCH
+
+ROOM = "bench-fanout"
+
+
+async def build_server(clients: int, protocol: int):
+    sio = socketio.AsyncServer(async_mode="asgi")
+    counts = {"frames": 0, "bytes": 0}
+
+    async def send_packet(eio_sid, pkt):
+        counts["frames"] += 1
+        counts["bytes"] += len(pkt.encode())
+
+    sio.eio.send_packet = send_packet
+    for i in range(clients):
+        sid = await sio.manager.connect(f"eio-{i}", "/")
+        sio.manager.basic_enter_room(sid, "/", ROOM)
+        sio.manager.basic_enter_room(sid, "/", protocol_room(ROOM, protocol))
+    return sio, counts
+
+
+async def run(mode: str, clients: int, rate: int, seconds: float, linger_ms: float) -> dict:
+    protocol = PROTOCOL_BATCH if mode == "batched" else PROTOCOL_SINGLE
+    sio, counts = await build_server(clients, protocol)
+    fanout = MessageFanout(sio.emit, linger_ms=linger_ms)
+
+    loop = asyncio.get_running_loop()
+    period = 1.0 / rate
+    total = int(rate * seconds)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    next_at = loop.time()
+    for i in range(total):
+        next_at += period
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+        await fanout.publish(ROOM, {"id": i, "sender": "bench", "text": f"message {i}", "timestamp": "2024-01-01T00:00:00"})
+    await fanout.flush_all()
+    await asyncio.sleep(0.05)  # let the per-recipient send tasks finish
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    delivered = total * clients
+
+    return {
+        "mode":             mode,
+        "clients":          clients,
+        "messages_sent":    total,
+        "frames":           counts["frames"],
+        "frames_per_sec":   round(counts["frames"] / wall, 1),
+        "delivered":        delivered,
+        "bytes":            counts["bytes"],
+        "cpu_s":            round(cpu, 3),
+        "cpu_us_per_delivered": round(cpu / delivered * 1e6, 3),
+        "lag_s":            round(wall - seconds, 3),
+        "fanout":           fanout.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rate", type=int, default=300, help="messages per second into the room")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--linger-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(run(mode, args.clients, args.rate, args.seconds, args.linger_ms))
+        for mode in ("single", "batched")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+/rooms/ cost at scale: the old per-room invite scan vs the room_members join.
+
+Fills a scratch database with `--rooms` rooms (a tenth of them private
+1:1 rooms), gives every user a handful of accepted invites, backfills
+room_members, then times both implementations for one user.
+
+    cd backend
+    python -m benchmarks.bench_list_rooms --rooms 100000
+"""
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.membership import backfill_room_members, private_participants
+from app.models import User, Room, RoomInvite, RoomMember
+
+
+def fill(db, rooms: int, users: int, invites_per_user: int):
+    if db.query(Room).count() >= rooms:
+        return
+    rng = random.Random(7)
+    db.execute(insert(User), [{"id": i, "username": f"user-{i}", "hashed_password": "!"} for i in range(1, users + 1)])
+    names, seen = [], set()
+    for i in range(rooms):
+        name = f"room-{i}"
+        if i % 10 == 0:
+            a, b = sorted(rng.sample(range(1, users + 1), 2))
+            if f"private_{a}_{b}" not in seen:
+                name = f"private_{a}_{b}"
+        seen.add(name)
+        names.append(name)
+    db.execute(insert(Room), [{"name": n} for n in names])
+    group = [n for n in names if not n.startswith("private_")]
+    db.execute(insert(RoomInvite), [
+        {"from_user_id": u, "to_user_id": u, "room_name": name, "status": "accepted"}
+        for u in range(1, users + 1)
+        for name in rng.sample(group, invites_per_user)
+    ])
+    db.commit()
+    backfill_room_members(db)
+
+
+def legacy_list_rooms(db, user_id: int):
+    allowed = []
+    for r in db.query(Room).all():
+        if r.name.startswith("private_"):
+            pair = private_participants(r.name)
+            if pair and user_id in pair:
+                allowed.append(r)
+            continue
+        inv = db.query(RoomInvite).filter_by(room_name=r.name, to_user_id=user_id, status="accepted").first()
+        if inv:
+            allowed.append(r)
+    return allowed
+
+
+def member_list_rooms(db, user_id: int):
+    return (
+        db.query(Room)
+        .join(RoomMember, RoomMember.room_name == Room.name)
+        .filter(RoomMember.user_id == user_id)
+        .order_by(Room.id)
+        .all()
+    )
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, round((time.perf_counter() - t0) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///./bench_list_rooms.db")
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--invites-per-user", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        fill(db, args.rooms, args.users, args.invites_per_user)
+        legacy, legacy_ms = timed(legacy_list_rooms, db, 1)
+        db.expunge_all()
+        members, members_ms = timed(member_list_rooms, db, 1)
+
+    assert {r.name for r in legacy} == {r.name for r in members}
+    print(json.dumps({
+        "url": args.url,
+        "rooms": args.rooms,
+        "visible_rooms": len(members),
+        "legacy_ms": legacy_ms,
+        "room_members_ms": members_ms,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+/rooms/ latency during a login storm.
+
+Seeds `--users` accounts, then fires `--logins` concurrent POST /token
+requests at the app in-process (httpx ASGI transport) while a probe keeps
+calling GET /rooms/ for one already-logged-in user. Reports /rooms/
+latency with and without the storm and how the logins resolved
+(200 vs 503 shed by the bcrypt pool).
+
+    cd backend
+    python -m benchmarks.bench_login_storm --logins 500
+"""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_login_storm.db")
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+from app.auth import create_access_token, get_password_hash
+from app.database import SessionLocal, async_engine
+from app.main import app, rate_limits
+from app.models import User
+
+# the storm is the point here, not the per-IP login limit
+rate_limits.set("token", "ip", 0)
+
+
+def seed(users: int, password: str):
+    hashed = get_password_hash(password)
+    with SessionLocal() as db:
+        have = {u for (u,) in db.query(User.username)}
+        db.add_all(
+            User(username=f"storm-{i}", hashed_password=hashed)
+            for i in range(users) if f"storm-{i}" not in have
+        )
+        db.commit()
+
+
+def summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        "requests": len(samples),
+        "p50_ms": round(statistics.median(samples), 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+async def probe(client, headers, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        resp = await client.get("/rooms/", headers=headers)
+        resp.raise_for_status()
+        samples.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run(args) -> dict:
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'storm-0'})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        quiet: list[float] = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, quiet))
+        await asyncio.sleep(args.quiet_seconds)
+        stop.set()
+        await task
+
+        storm: list[float] = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, storm))
+        t0 = time.perf_counter()
+        logins = await asyncio.gather(*(
+            client.post("/token", data={"username": f"storm-{i % args.users}", "password": args.password})
+            for i in range(args.logins)
+        ))
+        storm_seconds = time.perf_counter() - t0
+        stop.set()
+        await task
+    await async_engine.dispose()
+
+    return {
+        "logins": dict(Counter(r.status_code for r in logins)),
+        "storm_seconds": round(storm_seconds, 2),
+        "rooms_quiet": summary(quiet),
+        "rooms_during_storm": summary(storm),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--password", default="storm-password")
+    parser.add_argument("--quiet-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    seed(args.users, args.password)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
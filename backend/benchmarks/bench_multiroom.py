@@ -0,0 +1,104 @@
+"""
+Server memory per user: one Socket.IO connection per open room vs. one
+multiplexed connection.
+
+For each layout a fresh backend process (plus the in-memory ES wrapper) is
+started, `--users` users each open `--rooms` rooms, and the growth of the
+server's RSS and its connection count are recorded:
+
+  per-room     - a connection per room, joined through the connect auth
+                 (what the frontend did before rooms could be multiplexed)
+  multiplexed  - one connection per user, the other rooms via join_room
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bench_multiroom --users 300 --rooms 5
+"""
+import gc
+import json
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+import socketio
+
+from benchmarks.loadtest import Services, seed, token_for, room_name, _raise_fd_limit
+
+LAYOUTS = ("per-room", "multiplexed")
+
+
+async def open_user(url: str, i: int, rooms: int, layout: str, gate: asyncio.Semaphore) -> list:
+    async def connect(room: str) -> socketio.AsyncClient:
+        sio = socketio.AsyncClient(reconnection=False)
+        async with gate:
+            await sio.connect(url, transports=["websocket"], wait_timeout=30,
+                              auth={"token": token_for(i), "room": room, "protocol": 2})
+        return sio
+
+    # seeded so that user i belongs to rooms i % rooms, (i + 1) % rooms, ...
+    mine = [room_name((i + k) % rooms) for k in range(rooms)]
+    if layout == "per-room":
+        return [await connect(room) for room in mine]
+    sio = await connect(mine[0])
+    for room in mine[1:]:
+        await sio.call("join_room", room, timeout=30)
+    return [sio]
+
+
+async def measure(services: Services, users: int, rooms: int, layout: str, settle: float) -> dict:
+    server = services.server
+    await asyncio.sleep(settle)
+    rss_before = server.memory_info().rss
+
+    gate = asyncio.Semaphore(50)
+    opened = await asyncio.gather(*(open_user(services.url, i, rooms, layout, gate) for i in range(users)))
+    clients = [c for conns in opened for c in conns]
+    await asyncio.sleep(settle)
+    rss_after = server.memory_info().rss
+    async with httpx.AsyncClient(base_url=services.url) as http:
+        presence = (await http.get("/stats")).json()["presence"]
+
+    await asyncio.gather(*(c.disconnect() for c in clients))
+    gc.collect()
+    return {
+        "layout":             layout,
+        "users":              users,
+        "rooms_per_user":     rooms,
+        "connections":        presence["connections"],
+        "rss_mb_before":      round(rss_before / 2**20, 1),
+        "rss_mb_after":       round(rss_after / 2**20, 1),
+        "kb_per_user":        round((rss_after - rss_before) / users / 1024, 1),
+        "kb_per_connection":  round((rss_after - rss_before) / len(clients) / 1024, 1),
+    }
+
+
+def run(args) -> list[dict]:
+    _raise_fd_limit()
+    results = []
+    for layout in args.layouts:
+        workdir = tempfile.mkdtemp(prefix="multiroom-")
+        database_url = f"sqlite:///{workdir}/multiroom.db"
+        seed(database_url, args.users, args.rooms, rooms_per_user=args.rooms)
+        services = Services(database_url, workdir, {})
+        services.start()
+        try:
+            results.append(asyncio.run(measure(services, args.users, args.rooms, layout, args.settle)))
+        finally:
+            services.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--rooms", type=int, default=5, help="rooms each user has open")
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait before reading RSS")
+    args = parser.parse_args()
+    for row in run(args):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Per-event cost of authorizing room access on socket events.
+
+Fills the same scratch database as bench_list_rooms, then checks `--events`
+(user, room) pairs three ways:
+
+  none    - no check (baseline loop cost)
+  cached  - RoomAccess.allowed against the set loaded at connect
+  query   - one room_members lookup per event (the alternative)
+
+and reports microseconds per event, plus what loading the sets at connect
+costs per user.
+
+    cd backend
+    python -m benchmarks.bench_room_access --events 20000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import RoomMember
+from app.room_access import RoomAccess
+from benchmarks.bench_list_rooms import fill
+
+
+def async_url(url: str) -> str:
+    return url.replace("sqlite://", "sqlite+aiosqlite://", 1).replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(async_url(args.url))
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def load_rooms(user_id: int) -> set[str]:
+        async with Session() as db:
+            return set(await db.scalars(select(RoomMember.room_name).where(RoomMember.user_id == user_id)))
+
+    async with Session() as db:
+        members = (await db.execute(select(RoomMember.user_id, RoomMember.room_name))).all()
+    rng = random.Random(11)
+    users = sorted({uid for uid, _ in members})[:args.connected]
+    rooms = [name for _, name in members]
+    # half of the events are for a room the user belongs to
+    by_user = {}
+    for uid, name in members:
+        by_user.setdefault(uid, []).append(name)
+    events = [(u, rng.choice(by_user[u]) if rng.random() < 0.5 else rng.choice(rooms))
+              for u in (rng.choice(users) for _ in range(args.events))]
+
+    access = RoomAccess(load_rooms)
+    t0 = time.perf_counter()
+    for uid in users:
+        await access.attach(f"sid-{uid}", uid)
+    attach_ms = (time.perf_counter() - t0) * 1000 / len(users)
+
+    async def per_event_query(uid: int, room: str) -> bool:
+        async with Session() as db:
+            return await db.scalar(
+                select(RoomMember.id).where(RoomMember.room_name == room, RoomMember.user_id == uid).limit(1)
+            ) is not None
+
+    result = {"url": args.url, "events": len(events), "connected_users": len(users),
+              "attach_ms_per_user": round(attach_ms, 3)}
+
+    t0 = time.perf_counter()
+    for uid, room in events:
+        pass
+    result["none_us"] = round((time.perf_counter() - t0) * 1e6 / len(events), 3)
+
+    t0 = time.perf_counter()
+    cached = [access.allowed(uid, room) for uid, room in events]
+    result["cached_us"] = round((time.perf_counter() - t0) * 1e6 / len(events), 3)
+
+    t0 = time.perf_counter()
+    queried = [await per_event_query(uid, room) for uid, room in events]
+    result["query_us"] = round((time.perf_counter() - t0) * 1e6 / len(events), 3)
+
+    assert cached == queried
+    result["allowed_ratio"] = round(sum(cached) / len(cached), 3)
+    await engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///./bench_list_rooms.db")
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--invites-per-user", type=int, default=20)
+    parser.add_argument("--connected", type=int, default=500, help="users with a live connection")
+    parser.add_argument("--events", type=int, default=20_000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        fill(db, args.rooms, args.users, args.invites_per_user)
+    engine.dispose()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
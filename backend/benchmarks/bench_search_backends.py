@@ -0,0 +1,110 @@
+"""
+/search latency: in-process SQL full-text vs the Elasticsearch wrapper.
+
+Fills a scratch database with `--rows` messages over `--rooms` rooms (skipped
+if it is already that size), installs the full-text index and times the same
+queries through both backends, without the result cache in front:
+  sql            - SqlSearchBackend (FTS5 on SQLite, tsvector/GIN on Postgres)
+  elasticsearch  - ElasticsearchBackend against `--es-url`, only if given;
+                   index the same rows first (`python -m app.reindex run`)
+
+    cd backend
+    python -m benchmarks.bench_search_backends --rows 500000
+    python -m benchmarks.bench_search_backends --es-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.search_backends import SqlSearchBackend, ElasticsearchBackend, install_fulltext
+from benchmarks.bench_pagination import fill
+
+QUERIES = ["message", "number 4242", "numb", "nothing-matches-this"]
+
+
+def async_url(url: str) -> str:
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+async def timed(backend, room: str, repeat: int, **params) -> dict:
+    out = {}
+    for q in QUERIES:
+        samples, hits = [], 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            found, _ = await backend.search(room, q, **params)
+            samples.append((time.perf_counter() - t0) * 1000)
+            hits = len(found)
+        out[q] = {"median_ms": round(statistics.median(samples), 3),
+                  "max_ms": round(max(samples), 3), "hits": hits}
+    return out
+
+
+async def run(args) -> dict:
+    sql_engine = create_async_engine(async_url(args.url))
+    backend = SqlSearchBackend(async_sessionmaker(sql_engine, expire_on_commit=False), sql_engine.dialect.name)
+    params = {"size": args.size}
+    results = {}
+    try:
+        results["sql"] = {
+            "timestamp": await timed(backend, args.room, args.repeat, sort="timestamp", **params),
+            "relevance": await timed(backend, args.room, args.repeat, sort="relevance", highlight=True, **params),
+        }
+    finally:
+        await sql_engine.dispose()
+
+    if args.es_url:
+        es = ElasticsearchBackend(args.es_url)
+        try:
+            results["elasticsearch"] = {
+                "timestamp": await timed(es, args.room, args.repeat, sort="timestamp", **params),
+                "relevance": await timed(es, args.room, args.repeat, sort="relevance", highlight=True, **params),
+            }
+        except httpx.HTTPError as e:
+            results["elasticsearch"] = {"skipped": f"{type(e).__name__}: {e}"}
+        finally:
+            await es.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///./bench_search.db")
+    parser.add_argument("--es-url", default=None, help="ES wrapper base URL (omit to time only SQL)")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--room", default="room-0")
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    Base.metadata.create_all(bind=engine)
+    t0 = time.perf_counter()
+    install_fulltext(engine)   # before the fill, so the triggers index as rows go in
+    fill(engine, args.rows, args.rooms)
+    fill_s = time.perf_counter() - t0
+    engine.dispose()
+
+    print(json.dumps({
+        "url": args.url,
+        "rows": args.rows,
+        "room": args.room,
+        "fill_seconds": round(fill_s, 1),
+        "results": asyncio.run(run(args)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+In-memory stand-in for the ES wrapper service, for load tests.
+
+Speaks the wrapper's HTTP API (`/index`, `/index/bulk`, `/search`, `/ids`)
+closely enough for the backend: search is a case-insensitive substring match,
+newest first, one page only.
+
+    cd backend
+    uvicorn benchmarks.fake_es:app --port 8000
+"""
+from collections import defaultdict
+
+from fastapi import FastAPI, Body, Query
+
+app = FastAPI()
+_docs: dict[str, dict[str, dict]] = defaultdict(dict)   # chat_id -> id -> doc
+
+
+def _store(chat_id: str, message: dict):
+    doc = {"chat_id": chat_id, **message}
+    _docs[chat_id][str(message["id"])] = doc
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "docs": sum(len(d) for d in _docs.values())}
+
+
+@app.post("/index")
+async def index_endpoint(chat_id: str = Body(..., embed=True), message: dict = Body(..., embed=True)):
+    _store(chat_id, message)
+    return {"status": "indexed"}
+
+
+@app.post("/index/bulk")
+async def bulk_index_endpoint(items: list[dict] = Body(..., embed=True)):
+    for item in items:
+        _store(item["chat_id"], item["message"])
+    return {"indexed": len(items), "failed": []}
+
+
+@app.get("/search")
+async def search_endpoint(chat_id: str, q: str, size: int = Query(20, ge=1, le=100)):
+    needle = q.lower()
+    hits = [d for d in _docs.get(chat_id, {}).values() if needle in str(d.get("text", "")).lower()]
+    hits.sort(key=lambda d: (d.get("timestamp", ""), int(d["id"])), reverse=True)
+    return hits[:size]
+
+
+@app.get("/ids")
+async def ids_endpoint(chat_id: str):
+    return {"ids": list(_docs.get(chat_id, {})), "next": None}
@@ -1,11 +1,14 @@
 import pytest
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from fastapi.testclient import TestClient
 
 # 1) Import your app and the real get_db
-from app.main     import app
-from app.database import Base, get_db
+from app.main     import app, query_profiler
+from app.database import Base, get_db, get_async_db
 
 # 2) Build a *test* engine & session factory
 TEST_DB_URL = "sqlite:///./backend/tests/test.db"  
@@ -13,6 +16,15 @@ TEST_DB_URL = "sqlite:///./backend/tests/test.db"
 engine = create_engine(TEST_DB_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Async twin on the same file. NullPool: every test (and every TestClient)
+# runs its own event loop, so pooled aiosqlite connections can't be shared.
+async_engine = create_async_engine("sqlite+aiosqlite:///./backend/tests/test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# count statements on the test engines too (see the query_budget fixture)
+query_profiler.instrument(engine)
+query_profiler.instrument(async_engine.sync_engine)
+
 # 3) Initialize the test schema once per test run
 @pytest.fixture(scope="session", autouse=True)
 def setup_db():
@@ -29,6 +41,11 @@ def db_session():
     finally:
         session.close()
 
+# 4b) Async session factory for code that opens its own sessions (background workers)
+@pytest.fixture()
+def session_factory():
+    return TestingAsyncSessionLocal
+
 # 5) Override FastAPI’s get_db to use *this* session
 @pytest.fixture()
 def client(db_session):
@@ -38,6 +55,56 @@ def client(db_session):
         finally:
             db_session.close()
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as c:
         yield c
+
+# 6) Seed a user and hand back Bearer headers for it
+@pytest.fixture()
+def make_user(db_session):
+    from app.auth import create_access_token
+    from app.models import User
+
+    def _make(username: str):
+        user = db_session.query(User).filter_by(username=username).first()
+        if not user:
+            user = User(username=username, hashed_password="!")
+            db_session.add(user)
+            db_session.commit()
+        token = create_access_token({"sub": username})
+        return user, {"Authorization": f"Bearer {token}"}
+
+    return _make
+
+# 7) Query budgets: every request/event profiled inside the block must stay
+#    within `max_queries` and repeat no statement (N+1), or the test fails
+@pytest.fixture()
+def query_budget():
+    @contextmanager
+    def _budget(max_queries: int, allow_repeats: bool = False):
+        with query_profiler.capture() as profiles:
+            yield profiles
+        assert profiles, "nothing was profiled inside the query budget"
+        for p in profiles:
+            assert p.count <= max_queries, f"{p.name} ran {p.count} queries (budget {max_queries}): {p.report()}"
+            if not allow_repeats:
+                assert not p.repeated(), f"{p.name} repeats statements (N+1?): {p.repeated()}"
+
+    return _budget
+
+# 8) Stand-in for `sio.emit`: records every (event, data, to) it is called with
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, event, data, to=None):
+        self.events.append((event, data, to))
+
+@pytest.fixture()
+def emit():
+    return Recorder()
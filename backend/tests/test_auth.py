@@ -65,3 +65,69 @@ def test_token_missing_fields(client: TestClient):
         headers={"Content-Type": "application/x-www-form-urlencoded"}
     )
     assert response2.status_code == 422
+
+
+def test_login_upgrades_weak_hash(client: TestClient, db_session):
+    from passlib.context import CryptContext
+    from app.auth import BCRYPT_ROUNDS
+
+    weak = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("pw-weak")
+    db_session.add(User(username="legacy-hash", hashed_password=weak))
+    db_session.commit()
+
+    response = client.post("/token", data={"username": "legacy-hash", "password": "pw-weak"})
+    assert response.status_code == 200
+
+    db_session.expire_all()
+    stored = db_session.query(User).filter_by(username="legacy-hash").one().hashed_password
+    assert stored != weak
+    assert stored.split("$")[2] == f"{BCRYPT_ROUNDS:02d}"
+    assert verify_password("pw-weak", stored)
+
+
+def test_login_sheds_load_when_hash_pool_is_full(client: TestClient, db_session, monkeypatch):
+    from app.auth import PasswordHasher
+    import app.main as main
+
+    db_session.add(User(username="busy-user", hashed_password=get_password_hash("pw")))
+    db_session.commit()
+
+    saturated = PasswordHasher(workers=1, queue_limit=0)
+    saturated._in_flight = 1
+    monkeypatch.setattr(main, "password_hasher", saturated)
+
+    response = client.post("/token", data={"username": "busy-user", "password": "pw"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert saturated.stats()["rejected"] == 1
+
+
+def test_signup_losing_a_race_for_the_name_gets_400(client: TestClient, db_session, monkeypatch):
+    import app.main as main
+
+    class RacingHasher:
+        """Another signup for the same name commits while this one hashes."""
+
+        async def hash(self, password):
+            db_session.add(User(username="contested", hashed_password="!"))
+            db_session.commit()
+            return get_password_hash(password)
+
+    monkeypatch.setattr(main, "password_hasher", RacingHasher())
+
+    response = client.post("/users/", json={"username": "contested", "password": "pw"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username already registered"
+
+
+@pytest.mark.asyncio
+async def test_hashes_that_raise_are_counted_as_failed():
+    from app.auth import PasswordHasher
+
+    hasher = PasswordHasher(workers=1)
+    assert (await hasher.verify_and_update("pw", get_password_hash("pw")))[0]
+    with pytest.raises(ValueError):
+        await hasher.verify_and_update("pw", "not-a-bcrypt-hash")
+
+    stats = hasher.stats()
+    assert stats["completed"] == 1 and stats["failed"] == 1 and stats["in_flight"] == 0
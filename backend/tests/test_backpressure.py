@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+import socketio
+
+from app.backpressure import GuardedServer, OutboundGuard, _event_of
+
+
+class Client:
+    """Stands in for an engine.io socket: a slow one never drains its queue."""
+
+    def __init__(self, slow: bool):
+        self.slow = slow
+        self.queue = asyncio.Queue()
+        self.received = []
+        self.closed = False
+        self.closing = False
+        self.close_args = None
+
+    async def send(self, pkt):
+        if self.slow:
+            self.queue.put_nowait(pkt)
+        else:
+            self.received.append(_event_of(pkt.data) if isinstance(pkt.data, str) else None)
+
+    async def close(self, wait=True, abort=False):
+        self.close_args = (wait, abort)
+        self.closed = True
+
+    def queued(self) -> list:
+        return [_event_of(pkt.data) for pkt in self.queue._queue if pkt is not None]
+
+
+async def connect(sio, eio_sid: str, slow: bool, room: str = "general") -> tuple[str, Client]:
+    client = sio.eio.sockets[eio_sid] = Client(slow)
+    sid = await sio.manager.connect(eio_sid, "/")
+    await sio.enter_room(sid, room)
+    return sid, client
+
+
+@pytest.fixture()
+def sio():
+    return GuardedServer(async_mode="asgi")
+
+
+@pytest.mark.asyncio
+async def test_slow_client_is_shed_in_stages_and_then_disconnected(sio):
+    drops, slow_events = [], []
+    guard = OutboundGuard(sio, high_water=4, resync_water=8, max_queue=12, max_lag_s=60,
+                          on_drop=drops.append, on_slow=slow_events.append)
+    guard.install()
+    _, fast = await connect(sio, "eio-fast", slow=False)
+    _, slow = await connect(sio, "eio-slow", slow=True)
+
+    for i in range(4):
+        await sio.emit("receive_message", {"id": i}, to="general")
+    # past the high-water mark typing and presence go first
+    await sio.emit("typing_users", {"room": "general", "users": ["a"]}, to="general")
+    await sio.emit("presence_delta", {"room": "general", "joined": ["b"], "left": []}, to="general")
+    for i in range(4, 9):
+        await sio.emit("receive_message", {"id": i}, to="general")
+    assert slow.queued() == ["receive_message"] * 8
+    assert drops == ["typing_users", "presence_delta", "receive_message"]
+    assert guard.stats()["owing_resync"] == 1
+
+    # anything that is not recoverable still goes out, until the hard limit
+    for _ in range(4):
+        await sio.emit("friend_removed", {"by": "c"}, to="general")
+    assert len(slow.queued()) == 12 and not slow_events
+    await sio.emit("friend_removed", {"by": "c"}, to="general")
+    assert slow.queued() == [] and slow_events == ["disconnect"]  # what it had queued is discarded
+    await asyncio.sleep(0)
+    assert slow.close_args == (False, True)
+    assert slow.queue.qsize() == 1 and slow.queue.get_nowait() is None  # lets the writer task finish
+
+    # the reader in the same room got every frame
+    assert fast.received == (["receive_message"] * 4 + ["typing_users", "presence_delta"]
+                             + ["receive_message"] * 5 + ["friend_removed"] * 5)
+    assert guard.stats()["disconnects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_a_client_that_catches_up_is_asked_to_resync_once(sio):
+    guard = OutboundGuard(sio, high_water=2, resync_water=3, max_queue=100, max_lag_s=60)
+    guard.install()
+    _, client = await connect(sio, "eio-1", slow=True)
+
+    for i in range(5):
+        await sio.emit("receive_message", {"id": i}, to="general")
+    assert guard.dropped == {"receive_message": 2}
+
+    # still behind: nothing is sent, and new messages keep being dropped
+    await guard.sweep()
+    assert client.queued() == ["receive_message"] * 3
+
+    # it reads what was queued
+    while not client.queue.empty():
+        client.queue.get_nowait()
+    await sio.emit("receive_message", {"id": 5}, to="general")
+    assert client.queue.empty()
+    await guard.sweep()
+    await guard.sweep()
+    assert client.queued() == ["resync_required"]
+    assert guard.stats()["resyncs"] == 1 and guard.stats()["lagging"] == 0
+
+    # caught up: messages flow again
+    await sio.emit("receive_message", {"id": 6}, to="general")
+    assert client.queued() == ["resync_required", "receive_message"]
+
+
+@pytest.mark.asyncio
+async def test_owing_a_resync_for_too_long_disconnects(sio):
+    guard = OutboundGuard(sio, high_water=1, resync_water=1, max_queue=100, max_lag_s=0)
+    guard.install()
+    _, client = await connect(sio, "eio-1", slow=True)
+
+    await sio.emit("receive_message", {"id": 1}, to="general")
+    await sio.emit("receive_message", {"id": 2}, to="general")
+    await guard.sweep()
+    await asyncio.sleep(0)
+    assert client.closed and guard.disconnects == 1
+    await guard.sweep()
+    assert guard.stats()["lagging"] == 0
+
+
+def test_event_names_come_from_the_encoded_packet():
+    assert _event_of('2["typing_users",{"room":"x"}]') == "typing_users"
+    assert _event_of('2/admin,7["receive_message",{}]') == "receive_message"
+    assert _event_of('31["ack"]') is None
+    assert _event_of(b"\x00") is None
+
+
+def test_guard_refuses_a_server_it_cannot_hook():
+    with pytest.raises(TypeError):
+        OutboundGuard(socketio.AsyncServer(async_mode="asgi")).install()
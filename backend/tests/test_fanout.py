@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+
+from app.fanout import MessageFanout, protocol_room, PROTOCOL_SINGLE, PROTOCOL_BATCH
+
+
+@pytest.mark.asyncio
+async def test_quiet_room_sends_single_frames_immediately(emit):
+    fanout = MessageFanout(emit, linger_ms=50, hot_rate=10)
+
+    for i in range(3):
+        await fanout.publish("quiet", {"id": i})
+
+    assert emit.events == [("receive_message", {"id": i}, "quiet") for i in range(3)]
+
+
+@pytest.mark.asyncio
+async def test_busy_room_batches_for_new_clients_only(emit):
+    fanout = MessageFanout(emit, linger_ms=20, max_batch=8, hot_rate=5)
+
+    for i in range(20):
+        await fanout.publish("busy", {"id": i})
+    await asyncio.sleep(0.05)
+
+    v1, v2 = protocol_room("busy", PROTOCOL_SINGLE), protocol_room("busy", PROTOCOL_BATCH)
+    to_everyone = [d["id"] for e, d, to in emit.events if to == "busy"]
+    singles = [d["id"] for e, d, to in emit.events if to == v1]
+    batches = [d for e, d, to in emit.events if e == "receive_messages"]
+
+    assert all(to == v2 for e, _, to in emit.events if e == "receive_messages")
+    # old clients still see every message, one frame each and in order
+    assert to_everyone + singles == list(range(20))
+    # new clients see every message too, in far fewer frames
+    assert to_everyone + [m["id"] for b in batches for m in b] == list(range(20))
+    assert len(batches) < len(singles)
+    assert max(len(b) for b in batches) <= 8
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from app.history_cache import RecentMessageCache
+from app.models import Message
+from app.schemas import MessageRead
+
+BASE = datetime(2025, 1, 1)
+
+
+def _msg(i, room="r"):
+    return MessageRead(id=i, room=room, username="u", content=f"m{i}", timestamp=BASE + timedelta(seconds=i))
+
+
+def _ids(rows):
+    return [m.id for m in rows]
+
+
+def test_serves_windows_inside_cached_run():
+    cache = RecentMessageCache(per_room=10)
+    for i in range(1, 8):
+        cache.append(_msg(i))
+
+    assert _ids(cache.window("r", 3)) == [7, 6, 5]
+    assert _ids(cache.window("r", 2, before=(BASE + timedelta(seconds=5), 5))) == [4, 3]
+    assert _ids(cache.window("r", 2, after=(BASE + timedelta(seconds=3), 3))) == [5, 4]
+    # not known whether older messages exist in the database
+    assert cache.window("r", 20) is None
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_primed_complete_room_answers_short_pages():
+    cache = RecentMessageCache(per_room=10)
+    cache.prime("r", [_msg(2), _msg(1)], complete=True)
+    cache.append(_msg(3))
+
+    assert _ids(cache.window("r", 50)) == [3, 2, 1]
+    assert cache.window("r", 50, before=(BASE, 0)) == []
+
+
+def test_ring_buffer_drops_oldest():
+    cache = RecentMessageCache(per_room=3)
+    cache.prime("r", [_msg(2), _msg(1)], complete=True)
+    for i in range(3, 6):
+        cache.append(_msg(i))
+
+    assert _ids(cache.window("r", 3)) == [5, 4, 3]
+    assert cache.window("r", 4) is None
+
+
+def test_lru_eviction_under_byte_budget():
+    cache = RecentMessageCache(per_room=100, max_bytes=2500)
+    for room in ("a", "b", "c"):
+        cache.append(_msg(1, room))
+    cache.window("a", 1)  # touch "a" so "b" is the coldest
+    for i in range(2, 6):
+        cache.append(_msg(i, "d"))
+
+    assert cache.window("b", 1) is None
+    assert _ids(cache.window("a", 1)) == [1]
+    assert cache.stats()["evictions"] >= 1
+    assert cache.nbytes <= 2500
+
+
+def test_hot_room_reopen_skips_database(client, db_session, make_user):
+    _, headers = make_user("reader")
+    db_session.add_all(
+        Message(room="hot", username="reader", content=f"hot-{i}", timestamp=BASE + timedelta(seconds=i))
+        for i in range(3)
+    )
+    db_session.commit()
+
+    first = client.get("/messages/", params={"room": "hot"}, headers=headers).json()
+    db_session.query(Message).filter_by(room="hot").delete()
+    db_session.commit()
+    second = client.get("/messages/", params={"room": "hot"}, headers=headers).json()
+
+    assert [m["content"] for m in second] == [m["content"] for m in first] == ["hot-2", "hot-1", "hot-0"]
+
+
+def test_since_returns_messages_after_a_buffered_id():
+    cache = RecentMessageCache(per_room=5)
+    for i in range(1, 9):
+        cache.append(_msg(i))
+
+    assert _ids(cache.since("r", 5, 10)) == [6, 7, 8]
+    assert _ids(cache.since("r", 4, 2)) == [5, 6]
+    assert cache.since("r", 8, 10) == []
+    # trimmed out of the ring buffer, or never seen
+    assert cache.since("r", 3, 10) is None
+    assert cache.since("other", 5, 10) is None
@@ -0,0 +1,130 @@
+import json
+import asyncio
+import httpx
+import pytest
+
+from app.indexer import SearchIndexer
+
+
+class FakeWrapper:
+    """Stands in for the ES wrapper's /index/bulk endpoint."""
+
+    def __init__(self):
+        self.up = True
+        self.rejected = set()
+        self.batches = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/index/bulk"
+        if not self.up:
+            return httpx.Response(503)
+        items = json.loads(request.content)["items"]
+        failed = [item["message"]["id"] for item in items if item["message"]["id"] in self.rejected]
+        self.batches.append([item for item in items if item["message"]["id"] not in self.rejected])
+        return httpx.Response(200, json={"indexed": len(items) - len(failed), "failed": failed})
+
+    def indexed_ids(self):
+        return sorted(item["message"]["id"] for batch in self.batches for item in batch)
+
+
+def _indexer(wrapper, tmp_path, **kw):
+    return SearchIndexer(
+        "http://es-wrapper",
+        spool_path=str(tmp_path / "spool.jsonl"),
+        transport=httpx.MockTransport(wrapper.handler),
+        **kw,
+    )
+
+
+def _msg(i):
+    return {"id": i, "text": f"m{i}", "timestamp": "2025-01-01T00:00:00", "username": "u"}
+
+
+@pytest.mark.asyncio
+async def test_flushes_by_size_and_time(tmp_path):
+    wrapper = FakeWrapper()
+    seen = []
+    indexer = _indexer(wrapper, tmp_path, batch_size=3, linger_ms=20, on_indexed=seen.extend)
+    await indexer.start()
+    for i in range(7):
+        indexer.add("room", _msg(i))
+    await asyncio.sleep(0.1)
+
+    assert wrapper.indexed_ids() == list(range(7))
+    assert [len(b) for b in wrapper.batches] == [3, 3, 1]
+    assert sorted(item["message"]["id"] for item in seen) == list(range(7))
+    await indexer.stop()
+
+
+@pytest.mark.asyncio
+async def test_outage_spools_then_replays(tmp_path):
+    wrapper = FakeWrapper()
+    wrapper.up = False
+    indexer = _indexer(wrapper, tmp_path, batch_size=2, linger_ms=1, replay_min_delay=0.01, replay_max_delay=0.05)
+    await indexer.start()
+    for i in range(5):
+        indexer.add("room", _msg(i))
+    await asyncio.sleep(0.05)
+    assert indexer.spool_size() > 0
+    assert wrapper.indexed_ids() == []
+
+    wrapper.up = True
+    await asyncio.sleep(0.3)
+    assert wrapper.indexed_ids() == list(range(5))
+    assert indexer.spool_size() == 0
+    await indexer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_spools_unsent_messages(tmp_path):
+    wrapper = FakeWrapper()
+    wrapper.up = False
+    indexer = _indexer(wrapper, tmp_path, linger_ms=60_000)
+    await indexer.start()
+    indexer.add("room", _msg(1))
+    await indexer.stop()
+
+    lines = (tmp_path / "spool.jsonl").read_text().splitlines()
+    assert [json.loads(line)["message"]["id"] for line in lines] == [1]
+
+
+@pytest.mark.asyncio
+async def test_a_rejected_message_is_dead_lettered_not_retried(tmp_path):
+    wrapper = FakeWrapper()
+    wrapper.rejected = {3}
+    indexer = _indexer(wrapper, tmp_path, batch_size=2, linger_ms=1, replay_min_delay=0.01, replay_max_delay=0.05)
+    await indexer.start()
+    for i in range(6):
+        indexer.add("room", _msg(i))
+    await asyncio.sleep(0.3)
+
+    # refused once live, once more on replay, then set aside; the rest is shipped
+    assert wrapper.indexed_ids() == [0, 1, 2, 4, 5]
+    assert indexer.spool_size() == 0
+    assert indexer.stats()["dead_lettered"] == 1
+    lines = (tmp_path / "spool.jsonl.rejected").read_text().splitlines()
+    assert [json.loads(line)["message"]["id"] for line in lines] == [3]
+
+    # later spooled messages are not stuck behind it
+    wrapper.up = False
+    indexer.add("room", _msg(6))
+    await asyncio.sleep(0.05)
+    wrapper.up = True
+    await asyncio.sleep(0.3)
+    assert wrapper.indexed_ids()[-1] == 6
+    await indexer.stop()
+
+
+@pytest.mark.asyncio
+async def test_add_does_not_touch_the_disk(tmp_path):
+    wrapper = FakeWrapper()
+    indexer = _indexer(wrapper, tmp_path, max_buffer=1, linger_ms=60_000)
+    await indexer.start()
+    indexer.add("room", _msg(1))
+    indexer.add("room", _msg(2))  # buffer full: overflows
+
+    assert indexer.stats()["overflow"] == 1
+    assert not (tmp_path / "spool.jsonl").exists()
+    await asyncio.sleep(0.05)
+    assert indexer.stats()["overflow"] == 0 and indexer.spool_size() > 0
+    await indexer.stop()
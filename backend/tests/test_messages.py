@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from app.models import Message
+
+
+def _seed(db_session, room, n, base=datetime(2025, 1, 1)):
+    db_session.add_all(
+        Message(room=room, username="reader", content=f"{room}-{i}", timestamp=base + timedelta(seconds=i))
+        for i in range(n)
+    )
+    db_session.commit()
+
+
+def test_read_messages_newest_first(client, db_session, make_user):
+    _, headers = make_user("reader")
+    _seed(db_session, "history", 3)
+
+    resp = client.get("/messages/", params={"room": "history"}, headers=headers)
+    assert resp.status_code == 200
+    assert [m["content"] for m in resp.json()] == ["history-2", "history-1", "history-0"]
+    assert "X-Next-Cursor" not in resp.headers
+
+
+def test_keyset_paging_walks_whole_room(client, db_session, make_user):
+    _, headers = make_user("reader")
+    _seed(db_session, "paged", 23)
+    # same timestamp for two rows: the id tiebreak keeps paging deterministic
+    db_session.add(Message(room="paged", username="reader", content="paged-tie", timestamp=datetime(2025, 1, 1, 0, 0, 10)))
+    db_session.commit()
+
+    seen, params = [], {"room": "paged", "limit": 5}
+    while True:
+        resp = client.get("/messages/", params=params, headers=headers)
+        page = [m["content"] for m in resp.json()]
+        seen += page
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        params["before"] = cursor
+
+    assert len(seen) == 24 and len(set(seen)) == 24
+    assert seen[0] == "paged-22" and seen[-1] == "paged-0"
+
+
+def test_after_cursor_returns_newer_page(client, db_session, make_user):
+    _, headers = make_user("reader")
+    _seed(db_session, "forward", 10)
+
+    first = client.get("/messages/", params={"room": "forward", "limit": 4}, headers=headers)
+    older = client.get("/messages/", params={"room": "forward", "limit": 4, "before": first.headers["X-Next-Cursor"]}, headers=headers)
+    assert [m["content"] for m in older.json()] == ["forward-5", "forward-4", "forward-3", "forward-2"]
+
+    newer = client.get("/messages/", params={"room": "forward", "limit": 2, "after": older.headers["X-Next-Cursor"]}, headers=headers)
+    assert [m["content"] for m in newer.json()] == ["forward-4", "forward-3"]
+
+
+def test_bad_cursor_is_rejected(client, make_user):
+    _, headers = make_user("reader")
+    resp = client.get("/messages/", params={"before": "not-a-cursor"}, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_messages_requires_auth(client):
+    resp = client.get("/messages/", headers={"Authorization": "Bearer nope"})
+    assert resp.status_code == 401
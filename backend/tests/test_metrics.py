@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import metrics
+from app.main import sio
+
+
+def sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_rest_requests_are_labelled_by_route_template(client, make_user):
+    _, headers = make_user("metrics-user")
+    before = sample("http_request_duration_seconds_count", method="GET", route="/rooms/")
+
+    assert client.get("/rooms/", headers=headers).status_code == 200
+    client.get("/no/such/path")
+
+    assert sample("http_request_duration_seconds_count", method="GET", route="/rooms/") == before + 1
+    assert sample("http_requests_total", method="GET", route="/rooms/", status="200") >= 1
+    assert sample("http_requests_total", method="GET", route="<unmatched>", status="404") >= 1
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/rooms/"}' in r.text
+    assert "chat_connected_sids" in r.text
+
+
+@pytest.mark.asyncio
+async def test_socketio_handlers_are_timed():
+    handler = sio.handlers["/"]["typing"]
+    assert handler.metrics_timed
+    before = sample("socketio_event_duration_seconds_count", event="typing")
+
+    # not in the room: a no-op, but still one observation
+    await handler("no-such-sid", {"room": "lobby"})
+    assert sample("socketio_event_duration_seconds_count", event="typing") == before + 1
+
+
+def test_engine_statements_are_timed():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine, "test")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+
+    assert sample("db_query_duration_seconds_count", engine="test", op="SELECT") == 1
+    assert sample("db_query_duration_seconds_count", engine="test", op="OTHER") == 1
+
+
+@pytest.mark.asyncio
+async def test_es_calls_are_timed_per_path():
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json=[]))
+    async with httpx.AsyncClient(transport=transport, event_hooks=metrics.es_event_hooks()) as es:
+        await es.get("http://es/search", params={"q": "x"})
+    assert sample("es_request_duration_seconds_count", path="/search") >= 1
+    assert sample("es_responses_total", path="/search", status="200") >= 1
+
+
+def test_chat_state_gauges():
+    queue = lambda n: SimpleNamespace(queue=SimpleNamespace(qsize=lambda: n))
+    fake_sio = SimpleNamespace(manager=SimpleNamespace(rooms={"/": {None: {"a": 1, "b": 2, "c": 3}}}),
+                               eio=SimpleNamespace(sockets={"a": queue(0), "b": queue(7), "c": queue(2)}))
+    presence = SimpleNamespace(room_sizes=lambda: {"big": 3, "small": 1, "tiny": 1})
+    families = {f.name: f for f in metrics.ChatStateCollector(fake_sio, presence, top=2).collect()}
+
+    assert families["chat_connected_sids"].samples[0].value == 3
+    assert families["chat_rooms"].samples[0].value == 3
+    assert families["chat_room_memberships"].samples[0].value == 5
+    assert [(s.labels["room"], s.value) for s in families["chat_room_users"].samples][0] == ("big", 3)
+    assert len(families["chat_room_users"].samples) == 2
+    assert families["chat_outbound_queued_frames"].samples[0].value == 9
+    assert families["chat_outbound_queue_max"].samples[0].value == 7
@@ -0,0 +1,122 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+import httpx
+import pytest
+import socketio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token
+from app.database import Base
+from app.models import User, RoomMember
+from app.testing import BACKEND_DIR, free_port, wait_for, listening
+
+
+@pytest.fixture()
+def server(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'multiroom.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        alice, bob = User(username="alice", hashed_password="!"), User(username="bob", hashed_password="!")
+        db.add_all([alice, bob])
+        db.flush()
+        db.add_all([RoomMember(room_name=room, user_id=user.id)
+                    for room, user in [("r1", alice), ("r2", alice), ("r2", bob), ("r3", bob)]])
+        db.commit()
+    engine.dispose()
+
+    port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": db_url,
+        "ES_SERVICE_URL": "http://127.0.0.1:9",
+        "ES_SPOOL_PATH": str(tmp_path / "spool.jsonl"),
+        "PRESENCE_FLUSH_MS": "0",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app_sio", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        assert wait_for(lambda: listening(port)), "server did not start"
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+@pytest.mark.asyncio
+async def test_one_connection_sends_and_leaves_many_rooms(server):
+    alice, bob = socketio.AsyncClient(), socketio.AsyncClient()
+    got = {"alice": [], "bob": []}
+    arrived = asyncio.Event()
+
+    @alice.on("receive_message")
+    async def alice_message(msg):
+        got["alice"].append(msg)
+
+    @bob.on("receive_message")
+    async def bob_message(msg):
+        got["bob"].append(msg)
+        arrived.set()
+
+    await alice.connect(server, transports=["websocket"], auth={"token": create_access_token({"sub": "alice"})})
+    await bob.connect(server, transports=["websocket"],
+                      auth={"token": create_access_token({"sub": "bob"}), "room": "r2"})
+    try:
+        await alice.call("join_room", "r1")
+        # the ack is the room's member list
+        assert await alice.call("join_room", "r2") == ["alice", "bob"]
+
+        ack = await alice.call("send_message", {"room": "r2", "text": "to r2"}, timeout=10)
+        await asyncio.wait_for(arrived.wait(), timeout=10)
+        assert [(m["room"], m["id"]) for m in got["bob"]] == [("r2", ack["id"])]
+        # the sender's own connection is in r2 as well
+        assert [m["room"] for m in got["alice"]] == ["r2"]
+
+        # r3 is bob's; alice can neither join nor send there
+        assert await alice.call("join_room", "r3") == {"error": "not a member"}
+        assert await alice.call("send_message", {"room": "r3", "text": "nope"}) == {"error": "not in room"}
+        assert await alice.call("send_message", {"room": "r2", "text": {"evil": 1}}) == {"error": "invalid message"}
+
+        await alice.call("leave_room", "r2")
+        assert await alice.call("send_message", {"room": "r2", "text": "gone"}) == {"error": "not in room"}
+        arrived.clear()
+        await bob.call("send_message", {"text": "alice has left"}, timeout=10)
+        await asyncio.wait_for(arrived.wait(), timeout=10)
+        assert [m["room"] for m in got["alice"]] == ["r2"]
+    finally:
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async with httpx.AsyncClient(base_url=server) as http:
+        for _ in range(50):
+            stats = (await http.get("/stats")).json()["presence"]
+            if stats["connections"] == 0:
+                break
+            await asyncio.sleep(0.1)
+    assert stats["connections"] == 0 and stats["rooms"] == 0
+
+
+@pytest.mark.asyncio
+async def test_rooms_are_authorized_per_user(server):
+    bob = socketio.AsyncClient()
+    token = create_access_token({"sub": "bob"})
+    with pytest.raises(socketio.exceptions.ConnectionError):
+        await socketio.AsyncClient().connect(server, transports=["websocket"], auth={"token": token, "room": "r1"})
+
+    await bob.connect(server, transports=["websocket"], auth={"token": token, "room": "r3"})
+    try:
+        assert "id" in await bob.call("send_message", {"room": "r3", "text": "still a member"}, timeout=10)
+
+        async with httpx.AsyncClient(base_url=server) as http:
+            r = await http.delete("/rooms/r3/leave", headers={"Authorization": f"Bearer {token}"})
+            assert r.status_code == 204
+        assert await bob.call("send_message", {"room": "r3", "text": "left"}) == {"error": "not in room"}
+        assert await bob.call("join_room", "r3") == {"error": "not a member"}
+    finally:
+        await bob.disconnect()
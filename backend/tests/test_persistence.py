@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime
+import pytest
+
+from app.models import Message
+from app.persistence import MessageIdAllocator, MessageWriter
+
+
+def _row(msg_id, room, text):
+    return {
+        "id": msg_id,
+        "room": room,
+        "username": "writer",
+        "content": text,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_and_acks(session_factory, db_session):
+    acked = []
+
+    async def on_persisted(batch):
+        acked.extend(row["id"] for row, _ in batch)
+
+    ids = MessageIdAllocator(session_factory, block_size=7)
+    writer = MessageWriter(session_factory, batch_size=10, linger_ms=50, on_persisted=on_persisted)
+    writer.start()
+    for i in range(25):
+        await writer.submit(_row(await ids.next_id(), "wb-room", f"m{i}"), sid="sid-1")
+    await writer.stop()
+
+    stored = db_session.query(Message).filter_by(room="wb-room").order_by(Message.id).all()
+    assert [m.content for m in stored] == [f"m{i}" for i in range(25)]
+    assert sorted(acked) == [m.id for m in stored]
+    assert writer.batches == 3
+    assert writer.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_writer_drains_on_stop(session_factory, db_session):
+    ids = MessageIdAllocator(session_factory)
+    writer = MessageWriter(session_factory, batch_size=1000, linger_ms=60_000)
+    writer.start()
+    for i in range(5):
+        await writer.submit(_row(await ids.next_id(), "wb-drain", f"d{i}"))
+    await asyncio.wait_for(writer.stop(), timeout=5)
+
+    assert db_session.query(Message).filter_by(room="wb-drain").count() == 5
+
+
+@pytest.mark.asyncio
+async def test_allocators_do_not_collide(session_factory):
+    a = MessageIdAllocator(session_factory, block_size=5)
+    b = MessageIdAllocator(session_factory, block_size=5)
+    seen = [await a.next_id() for _ in range(12)] + [await b.next_id() for _ in range(12)]
+    assert len(set(seen)) == len(seen)
+
+
+@pytest.mark.asyncio
+async def test_a_refused_row_does_not_hold_up_the_batch(session_factory, db_session):
+    acked = []
+
+    async def on_persisted(batch):
+        acked.extend(row["id"] for row, _ in batch)
+
+    ids = MessageIdAllocator(session_factory)
+    writer = MessageWriter(session_factory, batch_size=10, linger_ms=50, on_persisted=on_persisted, retry_delay=0)
+    writer.start()
+    rows = [_row(await ids.next_id(), "wb-poison", f"p{i}") for i in range(5)]
+    rows[2]["content"] = {"evil": 1}
+    for row in rows:
+        await writer.submit(row)
+    await asyncio.wait_for(writer.stop(), timeout=5)
+
+    stored = db_session.query(Message).filter_by(room="wb-poison").order_by(Message.id).all()
+    assert [m.content for m in stored] == ["p0", "p1", "p3", "p4"]
+    assert sorted(acked) == [m.id for m in stored]
+    assert writer.stats()["dead_lettered"] == 1
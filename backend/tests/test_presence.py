@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+
+from app.bus import LocalPresenceStore
+from app.presence import PresenceTracker
+
+
+@pytest.mark.asyncio
+async def test_second_tab_leaving_keeps_user_online(emit):
+    presence = PresenceTracker(LocalPresenceStore(), emit, flush_ms=0)
+
+    await presence.join("tab-1", "lobby", "alice")
+    await presence.join("tab-2", "lobby", "alice")
+    await presence.join("tab-2", "lobby", "alice")  # repeat join is not counted twice
+    await presence.leave_all("tab-2")
+    await asyncio.sleep(0.01)
+
+    assert await presence.snapshot("lobby") == ["alice"]
+    assert emit.events == [("presence_delta", {"room": "lobby", "joined": ["alice"], "left": []}, "lobby")]
+
+    await presence.leave_all("tab-1")
+    await asyncio.sleep(0.01)
+    assert await presence.snapshot("lobby") == []
+    assert emit.events[-1][1] == {"room": "lobby", "joined": [], "left": ["alice"]}
+
+
+@pytest.mark.asyncio
+async def test_deltas_are_coalesced_per_window(emit):
+    presence = PresenceTracker(LocalPresenceStore(), emit, flush_ms=50)
+
+    for i in range(100):
+        await presence.join(f"sid-{i}", "big", f"user-{i}")
+    # joined and left inside the window: never announced
+    await presence.join("flaky", "big", "flaky-user")
+    await presence.leave_all("flaky")
+    await asyncio.sleep(0.1)
+
+    assert len(emit.events) == 1
+    _, delta, to = emit.events[0]
+    assert to == "big"
+    assert len(delta["joined"]) == 100 and "flaky-user" not in delta["joined"]
+    assert delta["left"] == []
+
+
+@pytest.mark.asyncio
+async def test_empty_rooms_are_evicted_and_memory_reported(emit):
+    store = LocalPresenceStore()
+    presence = PresenceTracker(store, emit, flush_ms=0)
+
+    for i in range(20):
+        await presence.join(f"sid-{i}", f"room-{i % 4}", f"user-{i}")
+    stats = presence.stats()
+    assert stats["rooms"] == 4 and stats["connections"] == 20
+    assert all(r["bytes"] > 0 and r["members"] == 5 for r in stats["largest_rooms"])
+
+    for i in range(20):
+        await presence.leave_all(f"sid-{i}")
+    await presence.stop()
+
+    stats = presence.stats()
+    assert stats["rooms"] == 0 and stats["connections"] == 0
+    assert stats["largest_rooms"] == []
+    assert store._rooms == {}
@@ -0,0 +1,44 @@
+import time
+
+from app.main import principal_cache
+from app.principal_cache import PrincipalCache
+
+
+def test_entry_never_outlives_token_exp():
+    cache = PrincipalCache(ttl=300)
+    cache.put("t1", {"sub": "a", "exp": time.time() + 0.05}, "user-a")
+    assert cache.get("t1") == "user-a"
+    time.sleep(0.06)
+    assert cache.get("t1") is None
+    # already expired tokens are not cached at all
+    cache.put("t2", {"sub": "a", "exp": time.time() - 1}, "user-a")
+    assert len(cache) == 0
+
+
+def test_lru_eviction_and_user_invalidation():
+    cache = PrincipalCache(max_size=2)
+    cache.put("t1", {"sub": "a"}, "user-a")
+    cache.put("t2", {"sub": "b"}, "user-b")
+    cache.get("t1")
+    cache.put("t3", {"sub": "a"}, "user-a")
+
+    assert cache.get("t2") is None
+    assert cache.evictions == 1
+    cache.invalidate_user("a")
+    assert cache.get("t1") is None and cache.get("t3") is None
+
+
+def test_http_auth_served_from_cache(client, db_session, make_user):
+    principal_cache.clear()
+    user, headers = make_user("cached-user")
+    assert client.get("/rooms/", headers=headers).status_code == 200
+
+    # the row is gone, but the principal is still cached ...
+    db_session.delete(user)
+    db_session.commit()
+    assert client.get("/rooms/", headers=headers).status_code == 200
+    assert principal_cache.stats()["hits"] >= 1
+
+    # ... until the user is invalidated
+    principal_cache.invalidate_user("cached-user")
+    assert client.get("/rooms/", headers=headers).status_code == 401
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import text
+
+from app.main import query_profiler, sio
+from app.query_profiler import normalize
+from tests.conftest import engine
+
+
+def test_normalize_collapses_literals_and_in_lists():
+    a = normalize("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'bob'  LIMIT 10")
+    b = normalize("SELECT * FROM users\n WHERE id IN (?) AND name = 'alice' LIMIT 20")
+    assert a == b == "SELECT * FROM users WHERE id IN (...) AND name = ? LIMIT ?"
+
+
+def test_repeated_statements_are_flagged_as_n_plus_one():
+    with query_profiler.profile("loop") as profile, engine.connect() as conn:
+        for i in range(4):
+            conn.execute(text(f"SELECT {i}"))
+    assert profile.repeated() == {"SELECT ?": 4}
+    assert query_profiler.stats()["loop"]["n_plus_one"] == {"SELECT ?": 4}
+
+
+def test_profile_header_reports_query_count(client, make_user):
+    _, headers = make_user("profiled")
+    r = client.get("/rooms/", headers={**headers, "X-Query-Profile": "1"})
+    assert int(r.headers["X-Query-Count"]) >= 1
+    assert "X-Query-Count" not in client.get("/rooms/", headers=headers).headers
+
+
+def test_friend_and_room_endpoints_stay_within_budget(client, make_user, query_budget):
+    _, headers = make_user("budget-owner")
+    for i in range(3):
+        _, other = make_user(f"budget-fan-{i}")
+        assert client.post("/friend_requests/", json={"to_username": "budget-owner"}, headers=other).status_code == 200
+
+    with query_budget(3):
+        r = client.get("/friend_requests/", headers=headers)
+    assert len(r.json()) == 3
+
+    with query_budget(3):
+        client.get("/rooms/", headers=headers)
+        client.get("/friends/", headers=headers)
+
+    make_user("budget-buddy")
+    with query_budget(9) as profiles:
+        assert client.post("/friends/", json={"username": "budget-buddy"}, headers=headers).status_code == 200
+    assert profiles[0].commits == 1
+
+
+@pytest.mark.asyncio
+async def test_socket_events_are_profiled():
+    with query_profiler.capture() as profiles:
+        await sio.handlers["/"]["typing"]("no-such-sid", {"room": "lobby"})
+    assert [p.name for p in profiles] == ["sio:typing"]
@@ -0,0 +1,116 @@
+import pytest
+
+import app.rate_limit as rate_limit
+from app.main import rate_limits
+from app.rate_limit import DEFAULT_LIMITS, RateLimits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_refill(clock):
+    limited = []
+    limits = RateLimits({("send_message", "sid"): (2, 3)}, on_limited=lambda *key: limited.append(key))
+
+    assert [limits.check("send_message", sid="a") for _ in range(3)] == [0, 0, 0]
+    assert limits.check("send_message", sid="a") == pytest.approx(0.5)
+    assert limits.check("send_message", sid="b") == 0  # buckets are per key
+    assert limited == [("send_message", "sid")]
+
+    clock.now += 0.5
+    assert limits.check("send_message", sid="a") == 0
+    assert limits.check("unlimited-event", sid="a") == 0
+
+
+def test_a_refusal_spends_no_tokens_in_other_scopes(clock):
+    limits = RateLimits({("send_message", "sid"): (1, 5), ("send_message", "user"): (1, 2)})
+
+    # two tabs of one user: the user bucket runs out first
+    assert limits.check("send_message", sid="tab-1", user=7) == 0
+    assert limits.check("send_message", sid="tab-2", user=7) == 0
+    assert limits.check("send_message", sid="tab-1", user=7) > 0
+    assert limits.stats()["limited"] == {"send_message:user": 1}
+    # the refused call took nothing from tab-1's own bucket
+    assert limits._limiters["send_message"]["sid"]._buckets["tab-1"].tokens == pytest.approx(4)
+
+    clock.now += 1
+    assert limits.check("send_message", sid="tab-1", user=7) == 0
+
+
+def test_idle_buckets_are_evicted(clock):
+    limits = RateLimits({("typing", "sid"): (5, 10)}, sweep_s=10)
+    for i in range(100):
+        limits.check("typing", sid=f"sid-{i}")
+    limits.forget_sid("sid-0")
+    assert limits.stats()["buckets"] == {"typing:sid": 99}
+
+    clock.now += 1
+    limits.check("typing", sid="busy")
+    assert limits.stats()["buckets"] == {"typing:sid": 100}
+
+    # refilled buckets are dropped by the next sweep; the active one stays
+    clock.now += 10
+    for _ in range(3):
+        limits.check("typing", sid="busy")
+    assert limits.stats()["buckets"] == {"typing:sid": 1}
+
+
+def test_limits_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_SEND_MESSAGE_SID", "1/4")
+    monkeypatch.setenv("RATE_LIMIT_TYPING_SID", "0")
+    limits = RateLimits()
+    assert limits._limiters["send_message"]["sid"].burst == 4
+    assert "sid" not in limits._limiters["typing"]
+
+
+@pytest.fixture()
+def tight_friend_requests():
+    rate_limits.set("friend_request", "user", 1, 2)
+    yield
+    rate_limits.set("friend_request", "user", *DEFAULT_LIMITS[("friend_request", "user")])
+
+
+def test_rest_endpoints_answer_429_with_retry_after(client, make_user, tight_friend_requests):
+    _, headers = make_user("limited-sender")
+    for i in range(3):
+        make_user(f"limited-target-{i}")
+
+    codes = [client.post("/friend_requests/", json={"to_username": f"limited-target-{i}"}, headers=headers)
+             for i in range(3)]
+    assert [r.status_code for r in codes] == [200, 200, 429]
+    assert codes[-1].headers["Retry-After"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_stop_typing_gets_through_when_typing_is_limited(monkeypatch):
+    import app.main as main
+
+    async def get_session(sid):
+        return {"user_id": 7, "username": "fast-typist"}
+
+    monkeypatch.setattr(main.sio, "get_session", get_session)
+    monkeypatch.setattr(main.presence, "in_room", lambda sid, room: True)
+    monkeypatch.setattr(main.room_access, "allowed", lambda user_id, room: True)
+    rate_limits.set("typing", "sid", 0.001, 1)
+    try:
+        handlers = main.sio.handlers["/"]
+        await handlers["typing"]("typist-sid", {"room": "limited-room"})
+        assert main.typists.users("limited-room") == ["fast-typist"]
+        assert rate_limits.check("typing", sid="typist-sid") > 0  # the bucket is empty now
+
+        await handlers["stop_typing"]("typist-sid", {"room": "limited-room"})
+        assert main.typists.users("limited-room") == []
+    finally:
+        rate_limits.set("typing", "sid", *DEFAULT_LIMITS[("typing", "sid")])
@@ -0,0 +1,113 @@
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import func
+
+from app.models import Message
+import app.reindex as reindex_cli
+from app.reindex import Checkpoint, reindex, verify
+
+
+class FakeWrapper:
+    """The ES wrapper's /index/bulk and /ids, backed by a dict."""
+
+    def __init__(self, fail_after_batches=None):
+        self.docs: dict[str, dict] = {}   # id -> item
+        self.batches = 0
+        self.fail_after_batches = fail_after_batches
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/index/bulk":
+            if self.fail_after_batches is not None and self.batches >= self.fail_after_batches:
+                return httpx.Response(503)
+            self.batches += 1
+            for item in json.loads(request.content)["items"]:
+                self.docs[str(item["message"]["id"])] = item
+            return httpx.Response(200, json={"failed": []})
+        if request.url.path == "/ids":
+            chat_id = request.url.params["chat_id"]
+            ids = sorted(i for i, item in self.docs.items() if item["chat_id"] == chat_id)
+            return httpx.Response(200, json={"ids": ids, "next": None})
+        return httpx.Response(404)
+
+    def client(self):
+        return httpx.AsyncClient(base_url="http://es-wrapper", transport=httpx.MockTransport(self.handler))
+
+
+def _seed(db_session, rooms=("ri-a", "ri-b"), per_room=25):
+    start = db_session.query(func.max(Message.id)).scalar() or 0
+    base = datetime(2025, 1, 1)
+    for i in range(per_room * len(rooms)):
+        db_session.add(Message(room=rooms[i % len(rooms)], username="u", content=f"m{i}",
+                               timestamp=base + timedelta(seconds=i)))
+    db_session.commit()
+    ids = [m.id for m in db_session.query(Message).filter(Message.id > start).order_by(Message.id)]
+    return start, ids
+
+
+@pytest.mark.asyncio
+async def test_reindex_streams_everything_and_checkpoints(session_factory, db_session, tmp_path):
+    start, ids = _seed(db_session)
+    wrapper = FakeWrapper()
+    checkpoint = Checkpoint(str(tmp_path / "ckpt.json"))
+
+    async with wrapper.client() as client:
+        summary = await reindex(session_factory, client, checkpoint, batch_size=7, concurrency=3,
+                                start_after=start, progress_out=None)
+
+    assert sorted(int(i) for i in wrapper.docs) == ids
+    assert summary["indexed"] == len(ids) and summary["last_id"] == ids[-1]
+    assert checkpoint.load()["last_id"] == ids[-1]
+
+
+@pytest.mark.asyncio
+async def test_interrupted_reindex_resumes_from_checkpoint(session_factory, db_session, tmp_path):
+    start, ids = _seed(db_session, rooms=("ri-c",), per_room=40)
+    checkpoint = Checkpoint(str(tmp_path / "ckpt.json"))
+    checkpoint.save({"last_id": start, "failed": []})
+
+    broken = FakeWrapper(fail_after_batches=3)
+    async with broken.client() as client:
+        with pytest.raises(httpx.HTTPError):
+            await reindex(session_factory, client, checkpoint, batch_size=5, concurrency=2, progress_out=None)
+    stopped_at = checkpoint.load()["last_id"]
+    assert stopped_at == ids[14]  # three whole batches made it
+
+    healthy = FakeWrapper()
+    async with healthy.client() as client:
+        await reindex(session_factory, client, checkpoint, batch_size=5, concurrency=2, progress_out=None)
+    assert sorted(int(i) for i in healthy.docs) == [i for i in ids if i > stopped_at]
+
+
+@pytest.mark.asyncio
+async def test_verify_reports_and_fixes_gaps(session_factory, db_session):
+    _, ids = _seed(db_session, rooms=("ri-d", "ri-e"), per_room=10)
+    wrapper = FakeWrapper()
+    async with wrapper.client() as client:
+        rows = db_session.query(Message).filter(Message.id.in_(ids)).all()
+        for m in rows:
+            wrapper.docs[str(m.id)] = {"chat_id": m.room, "message": {"id": m.id}}
+        del wrapper.docs[str(ids[0])], wrapper.docs[str(ids[3])]
+        wrapper.docs["999999"] = {"chat_id": "ri-d", "message": {"id": 999999}}
+
+        report = await verify(session_factory, client, rooms=["ri-d", "ri-e"], fix=True)
+
+    assert report["missing"] == 2 and report["extra"] == 1
+    assert report["rooms"]["ri-d"]["sample_missing"] == [ids[0]]
+    assert report["rooms"]["ri-e"]["sample_missing"] == [ids[3]]
+    assert report["rooms"]["ri-d"]["sample_extra"] == [999999]
+    assert str(ids[0]) in wrapper.docs and str(ids[3]) in wrapper.docs
+
+
+def test_cli_options_follow_the_subcommand(monkeypatch, capsys):
+    async def fake_main(args):
+        return {"command": args.command, "batch_size": args.batch_size, "url": args.url}
+
+    monkeypatch.setattr(reindex_cli, "_main", fake_main)
+    reindex_cli.main(["run", "--batch-size", "10", "--url", "http://es:5000"])
+    reindex_cli.main(["verify", "--batch-size", "20"])
+    first, second = capsys.readouterr().out.split("}\n")[:2]
+    assert json.loads(first + "}") == {"command": "run", "batch_size": 10, "url": "http://es:5000"}
+    assert json.loads(second + "}")["batch_size"] == 20
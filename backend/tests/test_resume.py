@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.history_cache import RecentMessageCache
+from app.main import _query_messages, query_profiler
+from app.models import Message
+from app.resume import ResumeSync, as_event
+
+
+def _seed(db_session, room, n, base=datetime(2025, 3, 1)):
+    rows = [Message(room=room, username="resumer", content=f"{room}-{i}", timestamp=base + timedelta(seconds=i))
+            for i in range(n)]
+    db_session.add_all(rows)
+    db_session.commit()
+    return [m.id for m in rows]
+
+
+def _sync(session_factory, **kw):
+    async def load_recent(room, limit):
+        async with session_factory() as db:
+            return await _query_messages(db, room, limit)
+    return ResumeSync(RecentMessageCache(), load_recent, **kw)
+
+
+@pytest.mark.asyncio
+async def test_mass_reconnect_costs_one_query_per_room(db_session, session_factory):
+    rooms = {f"resume-{r}": _seed(db_session, f"resume-{r}", 150) for r in range(3)}
+    sync = _sync(session_factory, max_messages=100)
+
+    # 600 clients come back at once, each having missed 0..119 messages
+    clients = []
+    for i in range(600):
+        room = f"resume-{i % 3}"
+        behind = i % 120
+        clients.append((room, rooms[room][-1 - behind], behind))
+
+    with query_profiler.profile("reconnect") as profile:
+        results = await asyncio.gather(*(sync.missed(room, last_id) for room, last_id, _ in clients))
+
+    assert profile.count == 3
+    for (room, _, behind), missed in zip(clients, results):
+        if behind > 100:
+            assert missed is None
+        else:
+            assert [m.id for m in missed] == rooms[room][len(rooms[room]) - behind:]
+    assert sync.stats()["reloads"] == sum(1 for *_, behind in clients if behind > 100)
+
+    # the load primed the cache: a second wave never reaches the database
+    with query_profiler.profile("second-wave") as profile:
+        await asyncio.gather(*(sync.missed(room, last_id) for room, last_id, _ in clients[:60]))
+    assert profile.count == 0
+
+
+@pytest.mark.asyncio
+async def test_unknown_id_means_reload_and_fresh_messages_come_from_cache(db_session, session_factory):
+    ids = _seed(db_session, "resume-live", 5)
+    sync = _sync(session_factory)
+
+    assert await sync.missed("resume-live", -1) is None
+
+    latest = (await sync.missed("resume-live", ids[1]))[-1]
+    # written in this process but not stored yet
+    sync.cache.append(latest.model_copy(update={"id": 10**9, "timestamp": latest.timestamp + timedelta(seconds=1)}))
+    missed = await sync.missed("resume-live", ids[-1])
+    assert [as_event(m)["id"] for m in missed] == [10**9]
+    assert sync.stats()["db_loads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_one_client_giving_up_does_not_cancel_the_shared_load():
+    loads = []
+
+    async def load_recent(room, limit):
+        loads.append(room)
+        await asyncio.sleep(0.03)
+        return []
+
+    sync = ResumeSync(RecentMessageCache(), load_recent)
+    first = asyncio.create_task(sync.missed("shared", 1))
+    await asyncio.sleep(0.005)
+    others = [asyncio.create_task(sync.missed("shared", 1)) for _ in range(3)]
+    await asyncio.sleep(0.005)
+    first.cancel()
+
+    # the id is not in an empty room: everyone is told to reload, nobody is cancelled
+    assert await asyncio.gather(*others) == [None] * 3
+    assert first.cancelled() and loads == ["shared"]
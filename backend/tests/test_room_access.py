@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.room_access import RoomAccess
+
+
+class Loader:
+    def __init__(self, rooms):
+        self.rooms = rooms
+        self.calls = 0
+
+    async def __call__(self, user_id):
+        self.calls += 1
+        return set(self.rooms.get(user_id, ()))
+
+
+@pytest.mark.asyncio
+async def test_checks_use_the_set_loaded_at_connect():
+    load = Loader({1: {"general"}})
+    access = RoomAccess(load)
+
+    await access.attach("tab-1", 1)
+    await access.attach("tab-2", 1)  # second connection reuses the set
+    assert load.calls == 1
+
+    for _ in range(1000):
+        assert access.allowed(1, "general")
+    assert not access.allowed(1, "secret")
+    assert access.allowed(1, "private_1_7") and not access.allowed(1, "private_2_7")
+    assert not access.allowed(1, None)
+    assert load.calls == 1
+
+    access.detach("tab-1")
+    assert access.allowed(1, "general")
+    access.detach("tab-2")
+    assert not access.allowed(1, "general")
+    assert access.stats()["users"] == 0
+
+
+@pytest.mark.asyncio
+async def test_grant_revoke_and_background_refresh():
+    load = Loader({1: {"general"}})
+    access = RoomAccess(load, ttl=3600)
+    await access.attach("tab", 1)
+
+    access.grant(1, "new-room")
+    assert access.allowed(1, "new-room")
+    assert access.revoke(1, "general") == ["tab"]
+    assert not access.allowed(1, "general")
+
+    # changed through another process: an invalidation (or the TTL) reloads
+    # in the background while the check answers from the current set
+    load.rooms[1] = {"general", "elsewhere"}
+    access.invalidate(1)
+    assert not access.allowed(1, "elsewhere")
+    await asyncio.sleep(0)
+    await asyncio.gather(*access._tasks)
+    assert access.allowed(1, "elsewhere") and access.allowed(1, "general")
+    assert load.calls == 2
+
+
+def test_rest_endpoints_change_access_on_the_event_loop(client, make_user, monkeypatch):
+    from app.main import room_access
+
+    calls = []
+
+    def on_loop(name):
+        def record(*args):
+            calls.append(name)
+            asyncio.get_running_loop()  # raises in a threadpool worker
+            return []
+        return record
+
+    monkeypatch.setattr(room_access, "grant", on_loop("grant"))
+    monkeypatch.setattr(room_access, "revoke", on_loop("revoke"))
+    _, headers = make_user("access-owner")
+    assert client.post("/rooms/", json={"name": "loop-room"}, headers=headers).status_code == 200
+    assert client.delete("/rooms/loop-room/leave", headers=headers).status_code == 204
+    assert calls == ["grant", "revoke"]
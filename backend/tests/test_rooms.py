@@ -0,0 +1,59 @@
+def test_list_rooms_shows_created_and_private_rooms(client, make_user):
+    owner, headers = make_user("owner")
+    _, other_headers = make_user("stranger")
+
+    assert client.post("/rooms/", json={"name": "lobby"}, headers=headers).status_code == 200
+    assert client.post("/friends/", json={"username": "stranger"}, headers=headers).status_code == 200
+
+    names = {r["name"] for r in client.get("/rooms/", headers=headers).json()}
+    assert "lobby" in names
+    assert any(n.startswith("private_") for n in names)
+
+    other = {r["name"] for r in client.get("/rooms/", headers=other_headers).json()}
+    assert "lobby" not in other
+    assert any(n.startswith("private_") for n in other)
+
+
+def _room_names(client, headers):
+    return {r["name"] for r in client.get("/rooms/", headers=headers).json()}
+
+
+def test_membership_follows_invite_accept_and_leave(client, make_user):
+    _, owner = make_user("club-owner")
+    _, guest = make_user("club-guest")
+    client.post("/rooms/", json={"name": "club"}, headers=owner)
+    client.post("/room_invites/", json={"room_name": "club", "to_username": "club-guest"}, headers=owner)
+    assert "club" not in _room_names(client, guest)
+
+    invite = client.get("/room_invites/", headers=guest).json()[0]
+    client.post(f"/room_invites/{invite['id']}/respond", json={"action": "accept"}, headers=guest)
+    assert "club" in _room_names(client, guest)
+
+    assert client.delete("/rooms/club/leave", headers=guest).status_code == 204
+    assert "club" not in _room_names(client, guest)
+    assert "club" in _room_names(client, owner)
+
+
+def test_backfill_builds_members_from_invites_and_private_rooms(db_session):
+    from app.membership import backfill_room_members
+    from app.models import Room, RoomInvite, RoomMember, User
+
+    a, b = User(username="bf-a", hashed_password="!"), User(username="bf-b", hashed_password="!")
+    db_session.add_all([a, b])
+    db_session.commit()
+    db_session.add_all([
+        Room(name="bf-group"),
+        Room(name=f"private_{a.id}_{b.id}"),
+        RoomInvite(from_user_id=a.id, to_user_id=a.id, room_name="bf-group", status="accepted"),
+        RoomInvite(from_user_id=a.id, to_user_id=b.id, room_name="bf-group", status="pending"),
+    ])
+    db_session.commit()
+
+    backfill_room_members(db_session)
+    assert backfill_room_members(db_session) == 0  # idempotent
+
+    rows = {
+        (m.room_name, m.user_id)
+        for m in db_session.query(RoomMember).filter(RoomMember.user_id.in_([a.id, b.id]))
+    }
+    assert rows == {("bf-group", a.id), (f"private_{a.id}_{b.id}", a.id), (f"private_{a.id}_{b.id}", b.id)}
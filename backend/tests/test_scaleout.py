@@ -0,0 +1,170 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+import httpx
+import pytest
+import socketio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token
+from app.broker import Broker
+from app.bus import BrokerPresenceStore, make_client_manager, make_presence_store
+from app.database import Base
+from app.models import User, IdBlock, RoomMember
+from app.persistence import MessageIdAllocator
+from app.testing import BACKEND_DIR, free_port, wait_for, listening
+
+
+@pytest.mark.asyncio
+async def test_broker_rolls_back_counters_of_a_dead_connection(tmp_path):
+    path = str(tmp_path / "broker.sock")
+    broker = Broker()
+    await broker.start(path)
+    try:
+        a, b = BrokerPresenceStore(path), BrokerPresenceStore(path)
+        await a.add("lobby", "alice")
+        await b.add("lobby", "bob")
+        await b.add("lobby", "alice")
+        assert sorted(await a.members("lobby")) == ["alice", "bob"]
+
+        await b.remove("lobby", "alice")
+        assert sorted(await a.members("lobby")) == ["alice", "bob"]
+
+        # worker b dies without cleaning up
+        await b.client.close()
+        await asyncio.sleep(0.05)
+        assert await a.members("lobby") == ["alice"]
+        await a.client.close()
+    finally:
+        await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_id_allocators_in_separate_processes_do_not_collide(session_factory, db_session):
+    db_session.query(IdBlock).filter_by(name="scaleout").delete()
+    db_session.commit()
+
+    # one allocator per "process": each keeps its own block
+    allocators = [MessageIdAllocator(session_factory, block_size=5, name="scaleout") for _ in range(4)]
+
+    async def take(alloc):
+        return [await alloc.next_id() for _ in range(12)]
+
+    results = await asyncio.gather(*(take(a) for a in allocators))
+    ids = [i for r in results for i in r]
+    assert len(ids) == len(set(ids))
+
+
+def test_redis_broker_without_the_package_fails_at_startup(monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", None)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", None)
+    with pytest.raises(RuntimeError, match="pip install redis"):
+        make_client_manager("redis://localhost:6379/0")
+    with pytest.raises(RuntimeError, match="pip install redis"):
+        make_presence_store("redis://localhost:6379/0")
+
+
+@pytest.fixture()
+def cluster(tmp_path):
+    """A broker and two backend workers sharing one SQLite file."""
+    db_url = f"sqlite:///{tmp_path / 'cluster.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        alice, bob = User(username="alice", hashed_password="!"), User(username="bob", hashed_password="!")
+        db.add_all([alice, bob])
+        db.flush()
+        db.add_all([RoomMember(room_name="lobby", user_id=alice.id), RoomMember(room_name="lobby", user_id=bob.id)])
+        db.commit()
+    engine.dispose()
+
+    sock = str(tmp_path / "broker.sock")
+    env = {
+        **os.environ,
+        "DATABASE_URL": db_url,
+        "BROKER_URL": f"unix://{sock}",
+        "ES_SERVICE_URL": "http://127.0.0.1:9",
+        "ES_SPOOL_PATH": str(tmp_path / "spool.jsonl"),
+    }
+    procs = [subprocess.Popen([sys.executable, "-m", "app.broker", sock], cwd=BACKEND_DIR, env=env)]
+    ports = []
+    try:
+        assert wait_for(lambda: os.path.exists(sock)), "broker did not start"
+        for _ in range(2):
+            port = free_port()
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app_sio", "--port", str(port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env,
+            ))
+            # start workers one at a time so their schema checks don't race
+            assert wait_for(lambda: listening(port)), "worker did not start"
+            ports.append(port)
+        yield ports
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+
+@pytest.mark.asyncio
+async def test_messages_and_presence_cross_workers(cluster):
+    port_a, port_b = cluster
+    alice, bob = socketio.AsyncClient(), socketio.AsyncClient()
+    got_message = asyncio.Event()
+    received = []
+    presence = []
+
+    @bob.on("receive_message")
+    async def on_message(msg):
+        received.append(msg)
+        got_message.set()
+
+    @bob.on("room_users")
+    async def on_users(users):
+        presence.append(sorted(users))
+
+    await alice.connect(f"http://127.0.0.1:{port_a}", transports=["websocket"],
+                        auth={"token": create_access_token({"sub": "alice"}), "room": "lobby"})
+    await bob.connect(f"http://127.0.0.1:{port_b}", transports=["websocket"],
+                      auth={"token": create_access_token({"sub": "bob"}), "room": "lobby"})
+    try:
+        ack = await alice.call("send_message", {"text": "hello from worker A"}, timeout=10)
+        await asyncio.wait_for(got_message.wait(), timeout=10)
+
+        assert received[0]["text"] == "hello from worker A"
+        assert received[0]["id"] == ack["id"]
+        assert ["alice", "bob"] in presence
+    finally:
+        await alice.disconnect()
+        await bob.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_history_on_the_other_worker_includes_remote_messages(cluster):
+    port_a, port_b = cluster
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bob'})}"}
+    alice, bob = socketio.AsyncClient(), socketio.AsyncClient()
+    got_message = asyncio.Event()
+    bob.on("receive_message", lambda msg: got_message.set())
+
+    await alice.connect(f"http://127.0.0.1:{port_a}", transports=["websocket"],
+                        auth={"token": create_access_token({"sub": "alice"}), "room": "lobby"})
+    await bob.connect(f"http://127.0.0.1:{port_b}", transports=["websocket"],
+                      auth={"token": create_access_token({"sub": "bob"}), "room": "lobby"})
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port_b}", headers=headers) as http:
+            # worker B caches the room's history before A writes to it
+            assert (await http.get("/messages/", params={"room": "lobby"})).json() == []
+
+            ack = await alice.call("send_message", {"text": "written on A"}, timeout=10)
+            await asyncio.wait_for(got_message.wait(), timeout=10)
+
+            page = (await http.get("/messages/", params={"room": "lobby"})).json()
+            assert [m["id"] for m in page] == [ack["id"]]
+    finally:
+        await alice.disconnect()
+        await bob.disconnect()
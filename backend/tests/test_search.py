@@ -1,13 +1,15 @@
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app
+from app.main import app, search_cache
 from app.schemas import MessageRead
 
 # A dummy response object that mimics httpx.Response
 class DummyResponse:
-    def __init__(self, json_data, status_code=200):
+    def __init__(self, json_data, status_code=200, headers=None):
         self._json = json_data
         self.status_code = status_code
+        self.headers = headers or {}
 
     def raise_for_status(self):
         if not (200 <= self.status_code < 300):
@@ -22,10 +24,13 @@ def fake_es(monkeypatch):
     Monkey-patch httpx.AsyncClient.get so that any .get(...)
     inside our /search route returns a DummyResponse we control.
     """
+    calls = []
+
     async def fake_get(self, url, params=None):
         # verify that our route called the right URL & params
         assert url.endswith("/search")
         assert "chat_id" in params and "q" in params
+        calls.append(params)
 
         # return a list of ES‐style hits
         hits = [
@@ -37,11 +42,14 @@ def fake_es(monkeypatch):
                 "username": "tester",
             }
         ]
-        return DummyResponse(hits, status_code=200)
+        # a full page: hand out a cursor derived from the one we got
+        headers = {"X-Next-Cursor": f"after-{params.get('cursor', 'start')}"}
+        return DummyResponse(hits, status_code=200, headers=headers)
 
-    # Patch the AsyncClient.get on the httpx class used in app.main
-    monkeypatch.setattr("app.main.httpx.AsyncClient.get", fake_get)
-    yield
+    # Patch AsyncClient.get, which the search backend calls the wrapper with
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+    search_cache.clear()
+    yield calls
 
 def test_proxy_search_transforms_hits(client: TestClient):
     # Call your /search endpoint
@@ -60,3 +68,19 @@ def test_proxy_search_transforms_hits(client: TestClient):
         }
     ]
     assert data == expected
+
+
+def test_proxy_search_pages_with_cursor(client: TestClient, fake_es):
+    first = client.get("/search", params={"chat_id": "room123", "q": "hello", "size": 1})
+    assert first.headers["X-Next-Cursor"] == "after-start"
+
+    second = client.get("/search", params={"chat_id": "room123", "q": "hello", "size": 1,
+                                           "cursor": first.headers["X-Next-Cursor"]})
+    assert second.status_code == 200
+    assert second.headers["X-Next-Cursor"] == "after-after-start"
+    assert fake_es[-1]["cursor"] == "after-start"
+    assert fake_es[-1]["size"] == 1 and fake_es[-1]["sort"] == "timestamp"
+
+    # same page again comes from the cache
+    client.get("/search", params={"chat_id": "room123", "q": "HELLO", "size": 1})
+    assert len(fake_es) == 2
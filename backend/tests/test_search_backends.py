@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.models import Message
+from app.schemas import SearchHit
+from app.search_backends import SqlSearchBackend, install_fulltext, fts5_query
+from tests.conftest import engine
+
+
+@pytest.fixture()
+def fts_backend(session_factory):
+    install_fulltext(engine)
+    # the FTS table outlives drop_all between runs; resync it with `messages`
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    return SqlSearchBackend(session_factory, "sqlite")
+
+
+def _seed(db_session, room, texts):
+    base = datetime(2025, 3, 1)
+    rows = [Message(room=room, username="fts", content=t, timestamp=base + timedelta(minutes=i))
+            for i, t in enumerate(texts)]
+    db_session.add_all(rows)
+    db_session.commit()
+    return [m.id for m in rows]
+
+
+def test_fts5_query_quotes_user_input():
+    assert fts5_query('deploy "prod" OR NOT*') == '"deploy" "prod" "OR" "NOT"*'
+    assert fts5_query("  -- ") == ""
+
+
+@pytest.mark.asyncio
+async def test_sql_backend_matches_and_pages_like_the_wrapper(fts_backend, db_session):
+    ids = _seed(db_session, "fts-room", [
+        "the deploy went fine",
+        "lunch?",
+        "deploying again, sorry",
+        "who broke the deploy",
+    ])
+    _seed(db_session, "fts-other", ["deploy in another room"])
+
+    hits, cursor = await fts_backend.search("fts-room", "deploy", size=2)
+    assert [h["id"] for h in hits] == [ids[3], ids[2]]  # newest first, prefix match included
+    assert cursor is not None
+    # hits map onto the same response schema as ES hits
+    SearchHit(id=hits[0]["id"], room=hits[0]["chat_id"], username=hits[0]["username"],
+              content=hits[0]["text"], timestamp=hits[0]["timestamp"])
+
+    rest, cursor = await fts_backend.search("fts-room", "deploy", size=2, cursor=cursor)
+    assert [h["id"] for h in rest] == [ids[0]] and cursor is None
+
+    hits, _ = await fts_backend.search("fts-room", "deploy", sort="relevance", highlight=True)
+    assert {h["id"] for h in hits} == {ids[0], ids[2], ids[3]}
+    assert all("<em>" in h["highlight"][0] for h in hits)
+
+    hits, _ = await fts_backend.search("fts-room", "deploy", since=datetime(2025, 3, 1, 0, 2))
+    assert [h["id"] for h in hits] == [ids[3], ids[2]]
+
+    with pytest.raises(ValueError):
+        await fts_backend.search("fts-room", "deploy", cursor="garbage")
+
+
+@pytest.mark.asyncio
+async def test_sql_backend_reports_persisted_rows(session_factory):
+    seen = []
+    backend = SqlSearchBackend(session_factory, "sqlite", on_indexed=seen.extend)
+    backend.persisted([{"id": 1, "room": "a"}, {"id": 2, "room": "b"}])
+    assert [item["chat_id"] for item in seen] == ["a", "b"]
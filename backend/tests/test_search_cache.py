@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+
+from app.search_cache import SearchCache, search_key
+
+
+class SlowES:
+    def __init__(self, delay=0.02):
+        self.calls = 0
+        self.delay = delay
+
+    def loader(self, result):
+        async def load():
+            self.calls += 1
+            await asyncio.sleep(self.delay)
+            return result
+        return load
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_one_call():
+    cache, es = SearchCache(settle=0), SlowES()
+    key = search_key("room", "Hello  World")
+
+    results = await asyncio.gather(*(cache.get_or_load(key, es.loader(["hit"])) for _ in range(20)))
+    assert results == [["hit"]] * 20
+    assert es.calls == 1
+
+    # normalized query hits the cache
+    assert await cache.get_or_load(search_key("room", "hello world"), es.loader(["other"])) == ["hit"]
+    stats = cache.stats()
+    assert stats["es_calls"] == 1 and stats["coalesced"] == 19 and stats["hits"] == 1
+    assert stats["es_calls_saved"] == 20
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_per_chat_and_covers_inflight_loads():
+    cache, es = SearchCache(settle=0), SlowES()
+    a, b = search_key("a", "x"), search_key("b", "x")
+    await cache.get_or_load(a, es.loader(["a1"]))
+    await cache.get_or_load(b, es.loader(["b1"]))
+
+    cache.invalidate("a")
+    assert await cache.get_or_load(b, es.loader(["b2"])) == ["b1"]
+    assert await cache.get_or_load(a, es.loader(["a2"])) == ["a2"]
+
+    # a load that started before an invalidation must not be cached
+    cache.invalidate("a")
+    task = asyncio.create_task(cache.get_or_load(search_key("a", "y"), es.loader(["old"])))
+    await asyncio.sleep(0.005)
+    cache.invalidate("a")
+    assert await task == ["old"]
+    assert await cache.get_or_load(search_key("a", "y"), es.loader(["new"])) == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_ttl_lru_and_settle_window():
+    cache, es = SearchCache(max_entries=2, ttl=0.05, settle=0.05), SlowES(delay=0)
+    for q in ("one", "two", "three"):
+        await cache.get_or_load(search_key("r", q), es.loader([q]))
+    assert len(cache) == 2  # "one" was evicted
+
+    await asyncio.sleep(0.06)
+    assert await cache.get_or_load(search_key("r", "two"), es.loader(["fresh"])) == ["fresh"]
+
+    cache.invalidate("r")
+    await cache.get_or_load(search_key("r", "two"), es.loader(["racing"]))
+    assert await cache.get_or_load(search_key("r", "two"), es.loader(["settled"])) == ["settled"]
+
+
+@pytest.mark.asyncio
+async def test_failed_load_is_not_cached():
+    cache = SearchCache()
+    key = search_key("r", "boom")
+
+    async def fail():
+        raise RuntimeError("es down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load(key, fail)
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_first_requester_going_away_does_not_cancel_the_others():
+    cache, es = SearchCache(settle=0), SlowES(delay=0.03)
+    key = search_key("room", "q")
+
+    first = asyncio.create_task(cache.get_or_load(key, es.loader(["hit"])))
+    await asyncio.sleep(0.005)
+    others = [asyncio.create_task(cache.get_or_load(key, es.loader(["other"]))) for _ in range(3)]
+    await asyncio.sleep(0.005)
+    first.cancel()
+
+    assert await asyncio.gather(*others) == [["hit"]] * 3
+    assert first.cancelled()
+    assert es.calls == 1 and len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_bookkeeping_is_dropped_once_settled():
+    cache, es = SearchCache(settle=0.01), SlowES(delay=0)
+    for i in range(50):
+        await cache.get_or_load(search_key(f"room-{i}", "q"), es.loader(["hit"]))
+        cache.invalidate(f"room-{i}")
+    await asyncio.sleep(0.02)
+    cache.invalidate("last")
+
+    assert list(cache._unsettled_until) == ["last"]
+    assert not cache._generation and not cache._loading
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+
+from app.bus import LocalPresenceStore
+from app.typing_state import TypingTracker
+
+
+@pytest.mark.asyncio
+async def test_keystrokes_collapse_into_one_frame_per_tick(emit):
+    typists = TypingTracker(emit, tick_ms=1000, timeout_s=5)
+
+    for _ in range(50):
+        typists.typing("sid-a", "lobby", "alice")
+        typists.typing("sid-b", "lobby", "bob")
+    await typists.flush()
+    await typists.flush()  # nothing changed: nothing sent
+
+    assert emit.events == [("typing_users", {"room": "lobby", "users": ["alice", "bob"]}, "lobby")]
+    stats = typists.stats()
+    assert stats["inbound"] == 100 and stats["suppressed"] == 98 and stats["outbound"] == 1
+
+    typists.stop_typing("sid-a", "lobby", "alice")
+    typists.stop_typing("sid-a", "lobby", "alice")
+    await typists.flush()
+    assert emit.events[-1][1]["users"] == ["bob"]
+
+
+@pytest.mark.asyncio
+async def test_timeout_and_disconnect_stop_typing(emit):
+    typists = TypingTracker(emit, tick_ms=10, timeout_s=0.2)
+    typists.start()
+    try:
+        typists.typing("sid-a", "lobby", "alice")
+        typists.typing("sid-b", "lobby", "bob")
+        typists.typing("sid-b", "other", "bob")
+        await asyncio.sleep(0.03)
+        typists.disconnect("sid-b")
+        await asyncio.sleep(0.03)
+        assert typists.users("other") == []
+        assert typists.users("lobby") == ["alice"]
+
+        await asyncio.sleep(0.3)
+        assert typists.users("lobby") == []
+        assert typists.stats()["expired"] == 1
+        assert emit.events[-1][1] == {"room": "lobby", "users": []}
+    finally:
+        await typists.stop()
+
+
+@pytest.mark.asyncio
+async def test_second_tab_disconnecting_stops_its_typing(emit):
+    typists = TypingTracker(emit, tick_ms=1000, timeout_s=60)
+    typists.typing("tab-1", "lobby", "alice")
+    typists.typing("tab-2", "lobby", "alice")  # same user, now typing in the other tab
+
+    typists.disconnect("tab-1")
+    assert typists.users("lobby") == ["alice"]
+    typists.disconnect("tab-2")
+    assert typists.users("lobby") == []
+
+
+@pytest.mark.asyncio
+async def test_frames_list_the_typers_of_every_worker(emit):
+    store = LocalPresenceStore()
+    worker_a = TypingTracker(emit, store, tick_ms=1000, timeout_s=60)
+    worker_b = TypingTracker(emit, store, tick_ms=1000, timeout_s=60)
+
+    worker_a.typing("sid-a", "lobby", "alice")
+    await worker_a.flush()
+    worker_b.typing("sid-b", "lobby", "bob")
+    await worker_b.flush()
+    assert [data["users"] for _, data, _ in emit.events] == [["alice"], ["alice", "bob"]]
+
+    # alice stops on A: the frame A sends still lists bob, typing on B
+    worker_a.stop_typing("sid-a", "lobby", "alice")
+    await worker_a.flush()
+    assert emit.events[-1][1]["users"] == ["bob"]
+
+    # a worker shutting down takes its typers with it
+    await worker_b.stop()
+    assert emit.events[-1][1]["users"] == []
@@ -1,30 +1,47 @@
-from fastapi import FastAPI, Body, Query, HTTPException
-from services.elasticsearch_service import index_message, search_messages, es
+import asyncio
+import logging
+from datetime import datetime
+from typing import Literal
+from fastapi import FastAPI, Body, Query, HTTPException, Response
+from services.elasticsearch_service import index_message, bulk_index_messages, search_messages, list_message_ids, es
+from services.indices import ensure_indices
+from services import metrics
 from elasticsearch import NotFoundError
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Elasticsearch Wrapper Service",
     description="API for indexing and searching chat messages in Elasticsearch"
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+ROLLOVER_CHECK_SECONDS = 3600
+_rollover_task = None
+
+
+async def _keep_write_alias_current():
+    """Move the write alias to the new month's partition once the month turns."""
+    while True:
+        await asyncio.sleep(ROLLOVER_CHECK_SECONDS)
+        try:
+            await ensure_indices(es)
+        except Exception:
+            logger.exception("monthly index rollover failed")
+
 
 @app.on_event("startup")
 async def ensure_index():
-    idx = "chat-messages"
-    exists = await es.indices.exists(index=idx)
-    if not exists:
-        await es.indices.create(
-            index=idx,
-            body={
-                "mappings": {
-                    "properties": {
-                        "chat_id":   {"type": "keyword"},
-                        "id":        {"type": "keyword"},
-                        "text":      {"type": "text"},
-                        "timestamp": {"type": "date"}
-                    }
-                }
-            }
-        )
+    global _rollover_task
+    await ensure_indices(es)
+    _rollover_task = asyncio.create_task(_keep_write_alias_current())
+
+
+@app.on_event("shutdown")
+async def stop_rollover():
+    if _rollover_task is not None:
+        _rollover_task.cancel()
+
 
 @app.post("/index")
 async def index_endpoint(
@@ -42,16 +59,69 @@ async def index_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/index/bulk")
+async def bulk_index_endpoint(
+    items: list[dict] = Body(..., embed=True)
+):
+    """
+    POST /index/bulk
+    Body JSON: { "items": [ { "chat_id": "...", "message": { "id": "...", ... } }, ... ] }
+    Returns the ids ES rejected so the caller can retry just those.
+    """
+    try:
+        failed = await bulk_index_messages(items)
+        return {"indexed": len(items) - len(failed), "failed": failed}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/search")
 async def search_endpoint(
+    response: Response,
     chat_id: str = Query(..., description="ID of the chat room"),
-    q: str = Query(..., description="Search query string")
+    q: str = Query(..., description="Search query string"),
+    size: int = Query(20, ge=1, le=100, description="Hits per page"),
+    sort: Literal["timestamp", "relevance"] = Query("timestamp", description="Newest first, or best match first"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    highlight: bool = Query(False, description="Add highlighted `text` fragments to each hit"),
+    since: datetime | None = Query(None, description="Only messages at or after this time"),
+    until: datetime | None = Query(None, description="Only messages at or before this time"),
 ):
     """
-    GET /search?chat_id=...&q=...
-    Returns list of matching messages.
+    GET /search?chat_id=...&q=...[&size=&sort=&cursor=&highlight=&since=&until=]
+    Returns list of matching messages; when more may follow, the
+    X-Next-Cursor response header holds the cursor of the next page.
     """
     try:
-        return await search_messages(chat_id, q)
+        hits, next_cursor = await search_messages(chat_id, q, size=size, sort=sort, cursor=cursor, highlight=highlight,
+                                               since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return hits
+
+
+@app.get("/ids")
+async def ids_endpoint(
+    chat_id: str = Query(..., description="ID of the chat room"),
+    after: str | None = Query(None, description="`next` of the previous page"),
+    size: int = Query(5000, ge=1, le=10000),
+):
+    """
+    GET /ids?chat_id=...[&after=...]
+    Ids of every message indexed for one chat, a page at a time:
+    { "ids": [...], "next": "..." | null }
+    """
+    try:
+        ids, next_after = await list_message_ids(chat_id, after=after, size=size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"ids": ids, "next": next_after}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
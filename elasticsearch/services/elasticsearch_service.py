@@ -1,8 +1,14 @@
 # elasticsearch/services/elasticsearch_service.py
 
 import os
+import json
+import base64
+from datetime import datetime
 from elasticsearch import AsyncElasticsearch
 
+from services.indices import READ_ALIAS, index_for, indices_for_range
+from services.metrics import timed
+
 # ES_HOST should point at your real Elasticsearch cluster,
 # e.g. "http://elasticsearch-node:9200" or default to localhost.
 ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
@@ -11,40 +17,180 @@ ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
 es = AsyncElasticsearch(hosts=[ES_HOST])
 
 
-async def index_message(chat_id: str, message: dict):
-    """
-    Index a single chat message under index "chat-messages".
-    Expects `message` to have at least "id" and "text" keys.
-    """
-    doc = {
+def _to_doc(chat_id: str, message: dict) -> dict:
+    return {
         "chat_id":   chat_id,
         "id":        message["id"],
         "text":      message["text"],
         "timestamp": message["timestamp"],
         "username":  message.get("username"),   # ← index this too
     }
+
+
+@timed("index")
+async def index_message(chat_id: str, message: dict):
+    """
+    Index a single chat message into its monthly partition.
+    Expects `message` to have at least "id" and "text" keys.
+    """
+    doc = _to_doc(chat_id, message)
     await es.index(
-        index="chat-messages",
+        index=index_for(doc["timestamp"]),
         id=doc["id"],
+        routing=chat_id,
         document=doc
     )
 
 
-async def search_messages(chat_id: str, query: str):
+@timed("bulk")
+async def bulk_index_messages(items: list[dict]) -> list:
+    """
+    Index many messages with one `_bulk` request.
+    `items` is a list of {"chat_id": ..., "message": {...}}.
+    Returns the ids of the documents ES rejected.
+    """
+    operations = []
+    for item in items:
+        doc = _to_doc(item["chat_id"], item["message"])
+        operations.append({"index": {"_index": index_for(doc["timestamp"]), "_id": doc["id"], "routing": doc["chat_id"]}})
+        operations.append(doc)
+    if not operations:
+        return []
+
+    resp = await es.bulk(operations=operations)
+    if not resp.get("errors"):
+        return []
+    return [
+        entry["index"]["_id"]
+        for entry in resp.get("items", [])
+        if entry.get("index", {}).get("error")
+    ]
+
+
+# fields MessageRead is built from; nothing else is shipped back
+SEARCH_SOURCE = ["id", "chat_id", "username", "text", "timestamp"]
+
+SORTS = {
+    "timestamp": [{"timestamp": "desc"}, {"id": "desc"}],
+    "relevance": [{"_score": "desc"}, {"timestamp": "desc"}, {"id": "desc"}],
+}
+
+
+def encode_cursor(sort_values: list) -> str:
+    """Opaque cursor for the `sort` values of the last hit of a page."""
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Inverse of `encode_cursor`; raises ValueError on anything malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(values, list) or not values:
+        raise ValueError("invalid cursor")
+    return values
+
+
+def build_search_body(
+    chat_id: str,
+    query: str,
+    size: int = 20,
+    sort: str = "timestamp",
+    search_after: list | None = None,
+    highlight: bool = False,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> dict:
     """
-    Search for `query` within messages of one chat.
-    Returns a list of source-documents.
+    Search request for one page of matches in one chat.
+    `chat_id` is a non-scoring `term` filter, so ES can cache it per segment.
     """
+    filters = [{"term": {"chat_id": chat_id}}]
+    if since is not None or until is not None:
+        bounds = {}
+        if since is not None:
+            bounds["gte"] = since.isoformat()
+        if until is not None:
+            bounds["lte"] = until.isoformat()
+        filters.append({"range": {"timestamp": bounds}})
     body = {
         "query": {
             "bool": {
-                "must": [
-                    {"match": {"chat_id": chat_id}},
-                    {"match": {"text": {"query": query, "fuzziness": "AUTO"}}}
-                ]
+                "filter": filters,
+                "must": [{"match": {"text": {"query": query, "fuzziness": "AUTO"}}}],
             }
-        }
+        },
+        "size": size,
+        "sort": SORTS[sort],
+        "_source": SEARCH_SOURCE,
+        "track_total_hits": False,
     }
-    resp = await es.search(index="chat-messages", body=body)
+    if search_after is not None:
+        body["search_after"] = search_after
+    if highlight:
+        body["highlight"] = {"fields": {"text": {}}, "pre_tags": ["<em>"], "post_tags": ["</em>"]}
+    return body
+
+
+@timed("search")
+async def search_messages(
+    chat_id: str,
+    query: str,
+    size: int = 20,
+    sort: str = "timestamp",
+    cursor: str | None = None,
+    highlight: bool = False,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """
+    Search for `query` within messages of one chat, one page at a time.
+    With `since`, only the monthly partitions overlapping the range are read.
+    Returns (source-documents, cursor of the next page or None).
+    """
+    body = build_search_body(
+        chat_id, query, size=size, sort=sort,
+        search_after=decode_cursor(cursor) if cursor else None,
+        highlight=highlight, since=since, until=until,
+    )
+    resp = await es.search(
+        index=indices_for_range(since, until),
+        routing=chat_id,
+        ignore_unavailable=True,
+        allow_no_indices=True,
+        body=body,
+    )
+    hits = resp.get("hits", {}).get("hits", [])
+
+    docs = []
+    for hit in hits:
+        doc = hit["_source"]
+        if highlight and "highlight" in hit:
+            doc["highlight"] = hit["highlight"].get("text", [])
+        docs.append(doc)
+    next_cursor = encode_cursor(hits[-1]["sort"]) if len(hits) == size else None
+    return docs, next_cursor
+
+
+@timed("ids")
+async def list_message_ids(chat_id: str, after: str | None = None, size: int = 5000):
+    """
+    One page of the ids indexed for a chat, in id order (for reconciling
+    with the database). Returns (ids, the `after` of the next page or None).
+    """
+    body = {
+        "query": {"bool": {"filter": [{"term": {"chat_id": chat_id}}]}},
+        "size": size,
+        "sort": [{"id": "asc"}],
+        "_source": False,
+        "track_total_hits": False,
+    }
+    if after is not None:
+        body["search_after"] = [after]
+    resp = await es.search(
+        index=READ_ALIAS, routing=chat_id, ignore_unavailable=True, allow_no_indices=True, body=body,
+    )
     hits = resp.get("hits", {}).get("hits", [])
-    return [hit["_source"] for hit in hits]
+    ids = [hit["_id"] for hit in hits]
+    return ids, (hits[-1]["sort"][0] if len(hits) == size else None)
@@ -0,0 +1,110 @@
+# elasticsearch/services/indices.py
+#
+# Monthly chat-message indices behind aliases:
+#
+#   chat-messages-YYYY.MM   one index per calendar month (by message timestamp)
+#   chat-messages-read      every partition (plus the legacy `chat-messages` index)
+#   chat-messages-write     the current month's partition
+#
+# New partitions get their mapping, settings and read alias from an index
+# template, so indexing into a month that doesn't exist yet just works.
+# Documents are routed by chat_id: one room lives on one shard per partition.
+
+import os
+from datetime import datetime, timezone
+
+PREFIX        = "chat-messages"
+LEGACY_INDEX  = "chat-messages"
+READ_ALIAS    = "chat-messages-read"
+WRITE_ALIAS   = "chat-messages-write"
+TEMPLATE_NAME = "chat-messages"
+
+ES_SHARDS   = int(os.getenv("ES_SHARDS", "1"))
+ES_REPLICAS = int(os.getenv("ES_REPLICAS", "0"))
+
+MAPPING = {
+    "properties": {
+        "chat_id":   {"type": "keyword"},
+        "id":        {"type": "keyword"},
+        "username":  {"type": "keyword"},
+        "text":      {"type": "text"},
+        "timestamp": {"type": "date"},
+    }
+}
+
+
+def parse_timestamp(value) -> datetime | None:
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        try:
+            ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    # naive timestamps are UTC; offset ones are converted so months split at UTC midnight
+    return ts.replace(tzinfo=timezone.utc) if not ts.tzinfo else ts.astimezone(timezone.utc)
+
+
+def partition_for(ts: datetime) -> str:
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts
+    return f"{PREFIX}-{ts.year:04d}.{ts.month:02d}"
+
+
+def index_for(timestamp) -> str:
+    """Partition a message belongs in; the write alias when its timestamp is unusable."""
+    ts = parse_timestamp(timestamp)
+    return partition_for(ts) if ts is not None else WRITE_ALIAS
+
+
+def indices_for_range(since: datetime | None, until: datetime | None, now: datetime | None = None) -> str:
+    """
+    Index expression covering [since, until]. Without a lower bound every
+    partition may match, so that's the read alias. The legacy index is always
+    listed: it holds messages of any date from before partitioning, and
+    searches pass `ignore_unavailable` for deployments that never had it.
+    """
+    if since is None:
+        return READ_ALIAS
+    now = now or datetime.now(timezone.utc)
+    since, until = parse_timestamp(since), parse_timestamp(until or now)
+    if until < since:
+        return partition_for(since)
+    names = []
+    year, month = since.year, since.month
+    while (year, month) <= (until.year, until.month):
+        names.append(f"{PREFIX}-{year:04d}.{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    names.append(LEGACY_INDEX)
+    return ",".join(names)
+
+
+async def ensure_indices(es, now: datetime | None = None):
+    """Install the template, create this month's partition and point both aliases at it."""
+    await es.indices.put_index_template(
+        name=TEMPLATE_NAME,
+        index_patterns=[f"{PREFIX}-*"],
+        template={
+            "settings": {"number_of_shards": ES_SHARDS, "number_of_replicas": ES_REPLICAS},
+            "mappings": {**MAPPING, "_routing": {"required": True}},
+            "aliases": {READ_ALIAS: {}},
+        },
+        priority=100,
+    )
+
+    current = partition_for(now or datetime.now(timezone.utc))
+    if not await es.indices.exists(index=current):
+        await es.indices.create(index=current)
+
+    actions = []
+    if await es.indices.exists_alias(name=WRITE_ALIAS):
+        for name in (await es.indices.get_alias(name=WRITE_ALIAS)).keys():
+            if name != current:
+                actions.append({"remove": {"index": name, "alias": WRITE_ALIAS}})
+    actions.append({"add": {"index": current, "alias": WRITE_ALIAS, "is_write_index": True}})
+
+    # documents indexed before partitioning stay searchable
+    if await es.indices.exists(index=LEGACY_INDEX) and not await es.indices.exists_alias(name=LEGACY_INDEX):
+        actions.append({"add": {"index": LEGACY_INDEX, "alias": READ_ALIAS}})
+
+    await es.indices.update_aliases(actions=actions)
+    return current
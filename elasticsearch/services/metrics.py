@@ -0,0 +1,82 @@
+# elasticsearch/services/metrics.py
+#
+# Prometheus metrics for the wrapper, served on `/metrics`: latency per
+# route, and latency/errors of the calls it makes to Elasticsearch.
+
+import time
+import functools
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, ProcessCollector, generate_latest,
+)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests", "Requests by route template and status",
+    ["method", "route", "status"], registry=REGISTRY,
+)
+ES_SECONDS = Histogram(
+    "es_call_duration_seconds", "Elasticsearch calls by operation",
+    ["op"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+ES_ERRORS = Counter(
+    "es_call_errors", "Elasticsearch calls that raised", ["op"], registry=REGISTRY,
+)
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware; requests are labelled with the matched route's template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            path = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            HTTP_SECONDS.labels(scope["method"], path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], path, str(status)).inc()
+
+
+def timed(op: str):
+    """Decorator for the coroutines that talk to Elasticsearch."""
+    histogram, errors = ES_SECONDS.labels(op), ES_ERRORS.labels(op)
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return call
+    return wrap
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import services.elasticsearch_service as service
+from services.indices import (
+    READ_ALIAS, WRITE_ALIAS, LEGACY_INDEX,
+    ensure_indices, index_for, indices_for_range, partition_for,
+)
+
+
+class FakeIndices:
+    def __init__(self):
+        self.templates = {}
+        self.indices = {}   # name -> set of aliases
+        self.write_index = {}
+
+    async def put_index_template(self, name, index_patterns, template, priority=None):
+        self.templates[name] = {"index_patterns": index_patterns, "template": template}
+
+    async def exists(self, index):
+        return index in self.indices or any(index in a for a in self.indices.values())
+
+    async def create(self, index):
+        aliases = set()
+        for t in self.templates.values():
+            if any(index.startswith(p.rstrip("*")) for p in t["index_patterns"]):
+                aliases |= set(t["template"].get("aliases", {}))
+        self.indices[index] = aliases
+
+    async def exists_alias(self, name):
+        return any(name in a for a in self.indices.values())
+
+    async def get_alias(self, name):
+        return {i: {"aliases": {name: {}}} for i, a in self.indices.items() if name in a}
+
+    async def update_aliases(self, actions):
+        for action in actions:
+            (op, spec), = action.items()
+            if op == "add":
+                self.indices[spec["index"]].add(spec["alias"])
+                if spec.get("is_write_index"):
+                    self.write_index[spec["alias"]] = spec["index"]
+            else:
+                self.indices[spec["index"]].discard(spec["alias"])
+
+
+class FakeES:
+    def __init__(self):
+        self.indices = FakeIndices()
+        self.bulk_calls = []
+        self.search_calls = []
+
+    async def bulk(self, operations):
+        self.bulk_calls.append(operations)
+        return {"errors": False, "items": []}
+
+    async def search(self, index, body, **kw):
+        self.search_calls.append({"index": index, "body": body, **kw})
+        return {"hits": {"hits": []}}
+
+
+@pytest.mark.asyncio
+async def test_ensure_indices_sets_up_partitions_and_aliases():
+    es = FakeES()
+    es.indices.indices[LEGACY_INDEX] = set()  # a pre-partitioning deployment
+
+    current = await ensure_indices(es, now=datetime(2025, 3, 14, tzinfo=timezone.utc))
+
+    assert current == "chat-messages-2025.03"
+    template = es.indices.templates["chat-messages"]["template"]
+    assert template["mappings"]["properties"]["username"] == {"type": "keyword"}
+    assert template["mappings"]["_routing"] == {"required": True}
+    assert es.indices.write_index[WRITE_ALIAS] == current
+    assert READ_ALIAS in es.indices.indices[current]
+    assert READ_ALIAS in es.indices.indices[LEGACY_INDEX]
+
+    # next month: the write alias moves, the old partition stays readable
+    await ensure_indices(es, now=datetime(2025, 4, 1, tzinfo=timezone.utc))
+    assert es.indices.write_index[WRITE_ALIAS] == "chat-messages-2025.04"
+    assert WRITE_ALIAS not in es.indices.indices[current]
+    assert READ_ALIAS in es.indices.indices[current]
+
+
+def test_partition_helpers():
+    assert index_for("2025-01-31T23:59:59") == "chat-messages-2025.01"
+    assert index_for("2025-02-01T00:00:00Z") == "chat-messages-2025.02"
+    assert index_for("not a date") == WRITE_ALIAS
+
+    assert indices_for_range(None, None) == READ_ALIAS
+    assert indices_for_range(
+        datetime(2024, 11, 5), datetime(2025, 2, 1),
+    ) == "chat-messages-2024.11,chat-messages-2024.12,chat-messages-2025.01,chat-messages-2025.02,chat-messages"
+
+
+@pytest.mark.asyncio
+async def test_bulk_routes_by_chat_and_month(monkeypatch):
+    es = FakeES()
+    monkeypatch.setattr(service, "es", es)
+
+    await service.bulk_index_messages([
+        {"chat_id": "room-a", "message": {"id": 1, "text": "hi", "timestamp": "2025-01-10T10:00:00"}},
+        {"chat_id": "room-b", "message": {"id": 2, "text": "yo", "timestamp": "2025-02-10T10:00:00"}},
+    ])
+
+    actions = es.bulk_calls[0][0::2]
+    assert actions == [
+        {"index": {"_index": "chat-messages-2025.01", "_id": 1, "routing": "room-a"}},
+        {"index": {"_index": "chat-messages-2025.02", "_id": 2, "routing": "room-b"}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_search_with_date_range_reads_only_matching_partitions(monkeypatch):
+    es = FakeES()
+    monkeypatch.setattr(service, "es", es)
+
+    await service.search_messages("room-a", "hello")
+    await service.search_messages(
+        "room-a", "hello",
+        since=datetime(2025, 5, 20, tzinfo=timezone.utc), until=datetime(2025, 6, 2, tzinfo=timezone.utc),
+    )
+
+    everything, recent = es.search_calls
+    assert everything["index"] == READ_ALIAS
+    assert recent["index"] == "chat-messages-2025.05,chat-messages-2025.06,chat-messages"
+    assert recent["routing"] == "room-a" and recent["ignore_unavailable"]
+    filters = recent["body"]["query"]["bool"]["filter"]
+    assert {"term": {"chat_id": "room-a"}} in filters
+    assert filters[1]["range"]["timestamp"]["gte"].startswith("2025-05-20")
+
+
+def test_offset_timestamps_are_partitioned_by_utc_month():
+    # 23:30 at UTC-5 on Jan 31 is already February in UTC, where range queries look for it
+    assert index_for("2025-01-31T23:30:00-05:00") == "chat-messages-2025.02"
+    assert index_for("2025-03-01T00:30:00+02:00") == "chat-messages-2025.02"
+    assert partition_for(datetime(2025, 1, 31, 23, 30, tzinfo=timezone(timedelta(hours=-5)))) == "chat-messages-2025.02"
+    assert indices_for_range(
+        datetime(2025, 1, 31, 23, 30, tzinfo=timezone(timedelta(hours=-5))),
+        datetime(2025, 2, 10, tzinfo=timezone.utc),
+    ) == "chat-messages-2025.02,chat-messages"
+
+
+def test_date_ranges_still_read_the_legacy_index():
+    # messages indexed before partitioning live only in `chat-messages`, whatever their date
+    for since, until in [(datetime(2019, 1, 1), None), (datetime(2025, 5, 20), datetime(2025, 5, 21))]:
+        assert LEGACY_INDEX in indices_for_range(since, until).split(",")
@@ -0,0 +1,43 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.elasticsearch_service as service
+from services import metrics
+
+
+def sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class FailingES:
+    async def search(self, **kw):
+        raise ConnectionError("es down")
+
+
+@pytest.mark.asyncio
+async def test_es_calls_are_timed_and_failures_counted(monkeypatch):
+    monkeypatch.setattr(service, "es", FailingES())
+    calls, errors = sample("es_call_duration_seconds_count", op="ids"), sample("es_call_errors_total", op="ids")
+
+    with pytest.raises(ConnectionError):
+        await service.list_message_ids("room-a")
+
+    assert sample("es_call_duration_seconds_count", op="ids") == calls + 1
+    assert sample("es_call_errors_total", op="ids") == errors + 1
+
+
+def test_requests_are_labelled_by_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/things/{thing_id}")
+    async def thing(thing_id: int):
+        return {"id": thing_id}
+
+    with TestClient(app) as client:
+        client.get("/things/1")
+        client.get("/things/2")
+
+    assert sample("http_requests_total", method="GET", route="/things/{thing_id}", status="200") == 2
+    assert b"es_call_duration_seconds" in metrics.render()
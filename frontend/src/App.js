@@ -96,6 +96,7 @@ export default function App() {
   // — Socket refs & scrolling ref —
   const socketRef = useRef();
   const notifSocketRef = useRef(null);
+  const activeRoomRef = useRef(null);
   const messagesEndRef = useRef();
 
 
@@ -107,7 +108,9 @@ export default function App() {
 
   notifSocketRef.current?.disconnect();
 
-  const sock = io(SOCKET_SERVER_URL, { auth:{ token } });
+  // the one connection of this tab: every room is joined on it, and the open
+  // chat only filters its events by room (protocol 2 = batched delivery)
+  const sock = io(SOCKET_SERVER_URL, { auth:{ token, protocol: 2 } });
   notifSocketRef.current = sock;
 
   sock.on("connect", () => {
@@ -145,23 +148,25 @@ export default function App() {
     console.error("🔔 [notif socket] connect_error:", err);
   });
 
-  sock.on("receive_message", msg => {
+  const notify = msg => {
     console.log("🔔 [notif socket] got message", msg);
     if (msg.sender === username) return;
-    if (!joined && Notification.permission === "granted") {
+    if (!activeRoomRef.current && Notification.permission === "granted") {
       console.log("🔔 firing desktop notification for", msg);
       new Notification(`📬 ${msg.sender}`, { body: msg.text });
     }
     setNotifyMsg(`${msg.sender}: ${msg.text}`);
     setNotifyOpen(true);
-  });
+  };
+  sock.on("receive_message", notify);
+  sock.on("receive_messages", batch => batch.forEach(notify));
 
   return () => {
     console.log("🔔 [notif socket] tearing down");
     sock.disconnect();
     notifSocketRef.current = null;
   };
-}, [isLoggedIn, token, username, joined]);
+}, [isLoggedIn, token, username]);
 
 
   useEffect(() => {
@@ -294,7 +299,6 @@ export default function App() {
     setTypingUsers([]);
   };
   const handleLeave = () => {
-    socketRef.current?.disconnect();
     setJoined(false);
     setRoom("");
     setMessages([]);
@@ -303,7 +307,6 @@ export default function App() {
   };
 
   const handleBack = () => {
-  socketRef.current?.disconnect();
   setJoined(false);
   setRoom("");
   setMessages([]);
@@ -466,7 +469,15 @@ export default function App() {
   const handleSend = (e) => {
     e.preventDefault();
     if (!message.trim()) return;
-    socketRef.current.emit("send_message", { text: message });
+    const text = message;
+    socketRef.current.emit("send_message", { room, text }, (ack) => {
+      if (ack?.error === "rate limited") {
+        // nothing was sent: put the text back and say when to retry
+        setMessage(text);
+        setNotifyMsg(`Slow down, try again in ${Math.ceil(ack.retry_after)}s`);
+        setNotifyOpen(true);
+      }
+    });
     setMessage("");
     setShowEmoji(false);
   };
@@ -490,38 +501,82 @@ export default function App() {
     }
   };
 
-  // — Active chat socket + load history —
+  // — Active chat on the shared socket + load history —
   useEffect(() => {
     if (!joined) return;
+    const socket = notifSocketRef.current;
+    if (!socket) return;
 
-    fetch(`${SOCKET_SERVER_URL}/messages/?room=${room}`, {
-      headers: { Authorization: `Bearer ${token}` },
-    })
-      .then((r) => r.json())
-      .then((past) => {
-        setMessages(
-          past.map((m) => ({
-            id:        m.id,  
-            sender: m.username,
-            text: m.content,
-            timestamp: m.timestamp,
-          }))
-        );
+    let lastSeen = null;
+    const loadHistory = () =>
+      fetch(`${SOCKET_SERVER_URL}/messages/?room=${room}`, {
+        headers: { Authorization: `Bearer ${token}` },
       })
-      .catch(console.error);
+        .then((r) => r.json())
+        .then((past) => {
+          if (past.length) lastSeen = past[0].id;
+          // history arrives newest-first; the chat view renders oldest-first
+          setMessages(
+            [...past].reverse().map((m) => ({
+              id:        m.id,  
+              sender: m.username,
+              text: m.content,
+              timestamp: m.timestamp,
+            }))
+          );
+        })
+        .catch(console.error);
+    loadHistory();
+
+    const append = (batch) => {
+      if (batch.length) lastSeen = batch[batch.length - 1].id;
+      setMessages((p) => {
+        const have = new Set(p.map((m) => m.id));
+        return [...p, ...batch.filter((m) => !have.has(m.id))];
+      });
+    };
+    const onMessage = (msg) => msg.room === room && append([msg]);
+    const onMessages = (batch) => append(batch.filter((m) => m.room === room));
+    const onResume = ({ room: r, messages: missed, reload }) => {
+      if (r !== room) return;
+      if (reload) loadHistory();
+      else append(missed);
+    };
+    const onDelta = ({ room: r, joined, left }) =>
+      r === room &&
+      setUsers((p) => [
+        ...new Set([...p.filter((u) => !left.includes(u)), ...joined]),
+      ]);
+    const onTyping = ({ room: r, users }) =>
+      r === room && setTypingUsers(users.filter((u) => u !== username));
+    // on every (re)connect: after a blip the server sends a "resume" with
+    // only what was missed since the last message seen here
+    const join = () =>
+      socket.emit("join_room", { room, last_seen: lastSeen ?? undefined }, (list) =>
+        Array.isArray(list) && setUsers(list)
+      );
 
-    const socket = io(SOCKET_SERVER_URL, { auth: { token, room } });
     socketRef.current = socket;
-    socket.on("receive_message", (msg) => 
-      setMessages((p) => [...p, msg]));
-    socket.on("room_users", (list) => setUsers(list));
-    socket.on("typing", ({ user }) =>
-      setTypingUsers((p) => [...new Set([...p, user])])
-    );
-    socket.on("stop_typing", ({ user }) =>
-      setTypingUsers((p) => p.filter((u) => u !== user))
-    );
-    return () => socket.disconnect();
+    activeRoomRef.current = room;
+    socket.on("receive_message", onMessage);
+    socket.on("receive_messages", onMessages);
+    socket.on("resume", onResume);
+    socket.on("presence_delta", onDelta);
+    socket.on("typing_users", onTyping);
+    socket.on("connect", join);
+    // the server shed frames while this tab was not reading: same as a reconnect
+    socket.on("resync_required", join);
+    if (socket.connected) join();
+    return () => {
+      socket.off("receive_message", onMessage);
+      socket.off("receive_messages", onMessages);
+      socket.off("resume", onResume);
+      socket.off("presence_delta", onDelta);
+      socket.off("typing_users", onTyping);
+      socket.off("connect", join);
+      socket.off("resync_required", join);
+      activeRoomRef.current = null;
+    };
   }, [joined, room, token, username]);
 
   // auto-scroll